@@ -0,0 +1,139 @@
+import os
+import hashlib
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Bump whenever parsing, feature engineering, or stat calculations change, so stale entries are never served
+CACHE_VERSION = 2
+
+
+class Activity_Cache(object):
+    """
+    Size-bounded on-disk cache of parsed activities. Each entry holds the engineered trackpoint columns, header metadata (name, type, date, creator) and summary stats of one activity file, stored as an uncompressed .npz archive of NumPy arrays so it loads without any XML parsing or feature engineering.
+
+    Entries are keyed by a hash of the file (its content by default, or its path, size and mtime with key_by='stat') together with the zone settings, so changing zones or points_per_min never returns stale time-in-zones or training loads. Reading an entry refreshes its modification time, and when the directory grows beyond max_bytes the least recently used entries are evicted.
+    """
+    def __init__(self, directory, max_bytes=512*1024**2, key_by='content'):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.key_by = key_by
+        self.n_bytes = None
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def __getstate__(self):
+        # Size estimate is per-process; let each unpickled copy (e.g. in worker processes) rescan
+        state = self.__dict__.copy()
+        state['n_bytes'] = None
+        return state
+
+    def key(self, filepath, zones, points_per_min):
+        h = hashlib.sha1()
+        h.update(repr((CACHE_VERSION, list(zones), list(points_per_min))))
+        if self.key_by == 'stat':
+            stat = os.stat(filepath)
+            h.update(repr((os.path.abspath(filepath), stat.st_size, stat.st_mtime)))
+        else:
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024*1024), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """
+        Returns tuple of name, activity type, date, creator, dataframe of trackpoint data, and dict of summary stats for a cached activity, or None if key is not cached. An entry which can't be read (e.g. truncated when a process was killed mid-write) is removed and counts as not cached.
+        """
+        path = self.entry_path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            with f:
+                # (np.load leaves a half-built NpzFile behind on files which aren't zip archives)
+                if not zipfile.is_zipfile(f):
+                    raise ValueError('not an .npz archive')
+                f.seek(0)
+                with np.load(f, allow_pickle=False) as archive:
+                    fields = dict((name, archive[name]) for name in archive.files)
+            entry = self.decode(fields)
+        except Exception:
+            self.discard(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted by another process since
+            pass
+        return entry
+
+    def decode(self, fields):
+        columns = [str(name) for name in fields.pop('columns')]
+        frame = pd.DataFrame(dict((name, fields.pop('col_'+name)) for name in columns), columns=columns)
+        meta = {}
+        for name, value in fields.items():
+            meta[name.split('_', 1)[1]] = value.tolist()
+        if meta.get('date') is not None:
+            meta['date'] = pd.Timestamp(meta['date']).to_pydatetime()
+        stats = dict((name, value) for name, value in meta.items() if name not in ('name', 'type', 'date', 'creator'))
+        return meta.get('name'), meta.get('type'), meta.get('date'), meta.get('creator'), frame, stats
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def put(self, key, name, act_type, date, creator, frame, stats):
+        fields = {'columns': np.array(list(frame.columns.values))}
+        for column in frame.columns.values:
+            fields['col_'+column] = frame[column].values
+        meta = dict(stats)
+        meta.update({'name': name, 'type': act_type, 'creator': creator})
+        if date is not None:
+            meta['date'] = np.datetime64(date, 'us')
+        for field, value in meta.items():
+            if value is not None:
+                fields['meta_'+field] = np.asarray(value)
+        path = self.entry_path(key)
+        # Write under a temporary name then rename, so concurrent readers never see a partial entry
+        tmp_path = '{}.{}.tmp'.format(path[:-len('.npz')], os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **fields)
+        os.rename(tmp_path, path)
+        if self.n_bytes is not None:
+            self.n_bytes += os.path.getsize(path)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache directory holds at most max_bytes.
+        """
+        if self.n_bytes is not None and self.n_bytes <= self.max_bytes:
+            return
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npz'):
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.n_bytes = sum([size for mtime, size, path in entries])
+        for mtime, size, path in entries:
+            if self.n_bytes <= self.max_bytes:
+                break
+            self.discard(path)
+            self.n_bytes -= size
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npz'):
+                os.remove(os.path.join(self.directory, filename))
+        self.n_bytes = 0
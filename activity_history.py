@@ -0,0 +1,222 @@
+import datetime
+import numpy as np
+
+# Per-activity summary stats, each stored as a float64 column (NaN where an activity has no value)
+STAT_COLUMNS = ['training_load', 'total_distance_2d', 'total_distance_3d', 'avg_speed_2d', 'avg_speed_3d', 'elevation_gain', 'elevation_loss']
+
+
+def as_datetime64(date):
+    return np.datetime64(date, 'us')
+
+
+class Activity_Row(object):
+    """
+    Read-only view of one activity in an Activity_History, with the same attributes as the Activity_Stats it was created from. Views are identified by date, so they stay valid as other activities are added to or removed from the history.
+    """
+    __slots__ = ('history', 'date')
+
+    def __init__(self, history, date):
+        self.history = history
+        self.date = date
+
+    def __repr__(self):
+        return 'Activity_Row({!r}, {!r})'.format(self.type, self.date)
+
+    def __eq__(self, other):
+        return isinstance(other, Activity_Row) and self.history is other.history and self.date == other.date
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.date)
+
+    @property
+    def index(self):
+        return self.history.index(self.date)
+
+    @property
+    def name(self):
+        return self.history.names[self.index]
+
+    @property
+    def creator(self):
+        return self.history.creators[self.index]
+
+    @property
+    def type(self):
+        return self.history.types[self.history.type_codes[self.index]]
+
+    @property
+    def training_load(self):
+        load = self.history.stats['training_load'][self.index]
+        return None if np.isnan(load) else int(load)
+
+    @property
+    def time_in_zones(self):
+        times = self.history.zone_times[self.index]
+        if not len(times) or np.isnan(times[0]):
+            return None
+        return [int(minutes) for minutes in times[~np.isnan(times)]]
+
+
+def stat_property(column):
+    def get(self):
+        value = self.history.stats[column][self.index]
+        return None if np.isnan(value) else float(value)
+    return property(get)
+
+
+for column in STAT_COLUMNS[1:]:
+    setattr(Activity_Row, column, stat_property(column))
+
+
+class Activity_History(object):
+    """
+    Chronologically sorted table of activity summaries, used as the activity_history attribute of an Athlete.
+
+    Rather than holding an object per activity, each attribute is stored as a NumPy column (dates, activity type codes, training loads, minutes in each zone, distances, speeds, elevation gain and loss), so an activity takes tens of bytes plus its name, and aggregations over the history are array reductions. Indexing or iterating yields Activity_Row views which keep the attribute access of Activity_Stats.
+
+    Activities are identified by their dates (which include precision down to min/sec): a hash set of dates makes duplicate checks O(1), and the sorted date column gives O(log n) lookups and range queries by date (and type).
+    """
+    def __init__(self, activities=()):
+        self.types = []
+        self.dates = np.zeros(0, dtype='datetime64[us]')
+        self.type_codes = np.zeros(0, dtype=np.int16)
+        self.stats = dict((column, np.zeros(0)) for column in STAT_COLUMNS)
+        self.zone_times = np.zeros((0, 0), dtype=np.float32)
+        self.names = np.zeros(0, dtype=object)
+        self.creators = np.zeros(0, dtype=object)
+        self.date_index = set()
+        self.add_many(activities)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __iter__(self):
+        for date in self.dates.tolist():
+            yield Activity_Row(self, date)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Activity_Row(self, date) for date in self.dates[index].tolist()]
+        return Activity_Row(self, self.dates[index].tolist())
+
+    def __contains__(self, date):
+        return date in self.date_index
+
+    def index(self, date):
+        """
+        Returns row index of the activity recorded at date.
+        """
+        if date not in self.date_index:
+            raise KeyError(date)
+        return int(np.searchsorted(self.dates, as_datetime64(date)))
+
+    def get(self, date):
+        """
+        Returns the activity recorded at date, or None.
+        """
+        if date in self.date_index:
+            return Activity_Row(self, date)
+        return None
+
+    def type_code(self, act_type):
+        if act_type not in self.types:
+            self.types.append(act_type)
+        return self.types.index(act_type)
+
+    def add(self, activity):
+        """
+        Inserts activity in date order. Returns False (leaving the history unchanged) if an activity with the same date already exists.
+        """
+        return bool(self.add_many([activity]))
+
+    def add_many(self, activities):
+        """
+        Inserts every activity whose date isn't already in the history, sorting once for the whole batch. Returns list of the activities inserted.
+        """
+        added = []
+        for activity in activities:
+            if activity.date not in self.date_index:
+                self.date_index.add(activity.date)
+                added.append(activity)
+        if not added:
+            return added
+        n_zones = max([len(activity.time_in_zones or []) for activity in added] + [self.zone_times.shape[1]])
+        zone_times = np.full((len(added), n_zones), np.nan, dtype=np.float32)
+        for i, activity in enumerate(added):
+            if activity.time_in_zones:
+                zone_times[i, :len(activity.time_in_zones)] = activity.time_in_zones
+        if n_zones > self.zone_times.shape[1]:
+            self.zone_times = np.pad(self.zone_times, ((0, 0), (0, n_zones-self.zone_times.shape[1])), 'constant', constant_values=np.nan)
+        dates = np.concatenate([self.dates, np.array([as_datetime64(activity.date) for activity in added])])
+        order = np.argsort(dates, kind='mergesort')
+        self.dates = dates[order]
+        self.type_codes = np.concatenate([self.type_codes, np.array([self.type_code(activity.type) for activity in added], dtype=np.int16)])[order]
+        for column in STAT_COLUMNS:
+            values = np.array([np.nan if getattr(activity, column) is None else getattr(activity, column) for activity in added], dtype=np.float64)
+            self.stats[column] = np.concatenate([self.stats[column], values])[order]
+        self.zone_times = np.concatenate([self.zone_times, zone_times])[order]
+        self.names = np.concatenate([self.names, np.array([activity.name for activity in added] + [None], dtype=object)[:-1]])[order]
+        self.creators = np.concatenate([self.creators, np.array([activity.creator for activity in added] + [None], dtype=object)[:-1]])[order]
+        return added
+
+    def remove(self, date):
+        """
+        Removes the activity recorded at date, returning its Activity_Stats attributes as a detached record.
+        """
+        i = self.index(date)
+        activity = Removed_Activity(Activity_Row(self, date))
+        self.date_index.remove(date)
+        self.dates = np.delete(self.dates, i)
+        self.type_codes = np.delete(self.type_codes, i)
+        for column in STAT_COLUMNS:
+            self.stats[column] = np.delete(self.stats[column], i)
+        self.zone_times = np.delete(self.zone_times, i, axis=0)
+        self.names = np.delete(self.names, i)
+        self.creators = np.delete(self.creators, i)
+        return activity
+
+    def indices(self, start=None, end=None, act_type=None):
+        """
+        Returns array of row indices of activities (optionally only those of act_type) dated from start to end inclusive, oldest to newest. Either bound may be None to leave that end of the range open.
+        """
+        lo = 0 if start is None else np.searchsorted(self.dates, as_datetime64(start), side='left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, as_datetime64(end), side='right')
+        rows = np.arange(lo, hi)
+        if act_type is not None:
+            if act_type not in self.types:
+                return rows[:0]
+            rows = rows[self.type_codes[lo:hi] == self.types.index(act_type)]
+        return rows
+
+    def between(self, start=None, end=None, act_type=None):
+        """
+        Returns list of activities (optionally only those of act_type) dated from start to end inclusive, oldest to newest. Either bound may be None to leave that end of the range open.
+        """
+        return [Activity_Row(self, date) for date in self.dates[self.indices(start, end, act_type)].tolist()]
+
+    def of_type(self, act_type):
+        return self.between(act_type=act_type)
+
+    def day_ordinals(self):
+        """
+        Returns array of the proleptic Gregorian ordinal (as in datetime.date.toordinal) of each activity's day.
+        """
+        return self.dates.astype('datetime64[D]').astype(np.int64) + datetime.date(1970, 1, 1).toordinal()
+
+
+class Removed_Activity(object):
+    """
+    Copy of the attributes of an activity removed from an Activity_History.
+    """
+    def __init__(self, row):
+        self.date = row.date
+        self.name = row.name
+        self.creator = row.creator
+        self.type = row.type
+        self.training_load = row.training_load
+        self.time_in_zones = row.time_in_zones
+        for column in STAT_COLUMNS[1:]:
+            setattr(self, column, getattr(row, column))
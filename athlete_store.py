@@ -0,0 +1,280 @@
+import json
+import sqlite3
+import datetime
+import numpy as np
+from contextlib import closing
+from sleep import Sleep_History
+from folder_sync import File_Manifest, Manifest_Entry
+
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL UNIQUE,
+    type TEXT,
+    name TEXT,
+    creator TEXT,
+    training_load INTEGER,
+    total_distance_2d REAL,
+    total_distance_3d REAL,
+    avg_speed_2d REAL,
+    avg_speed_3d REAL,
+    elevation_gain REAL,
+    elevation_loss REAL
+);
+CREATE INDEX IF NOT EXISTS activities_by_type ON activities (type, date);
+CREATE TABLE IF NOT EXISTS zone_times (
+    activity_id INTEGER NOT NULL REFERENCES activities (id) ON DELETE CASCADE,
+    zone INTEGER NOT NULL,
+    minutes INTEGER,
+    PRIMARY KEY (activity_id, zone)
+);
+CREATE TABLE IF NOT EXISTS daily_loads (
+    day TEXT NOT NULL,
+    type TEXT NOT NULL,
+    load REAL,
+    PRIMARY KEY (day, type)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    date TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS sleep_nights (
+    day TEXT PRIMARY KEY,
+    minutes REAL
+);
+'''
+
+# Scalar Athlete attributes stored (JSON-encoded) in the settings table
+SETTINGS = ['max_hr', 'zones', 'points_per_min', 'sleep_score',
+            'cardio_fitness', 'cardio_fatigue', 'cardio_form',
+            'cycling_fitness', 'cycling_fatigue', 'cycling_form',
+            'running_fitness', 'running_fatigue', 'running_form',
+            'time_in_zones_7day', 'time_in_zones_42day']
+
+# Activity_Stats attributes stored as columns of the activities table
+ACTIVITY_COLUMNS = ['date', 'type', 'name', 'creator', 'training_load',
+                    'total_distance_2d', 'total_distance_3d', 'avg_speed_2d', 'avg_speed_3d',
+                    'elevation_gain', 'elevation_loss']
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def format_date(date):
+    return date.strftime(DATE_FORMAT)
+
+
+def parse_date(text):
+    return datetime.datetime.strptime(text, DATE_FORMAT)
+
+
+def sleep_rows(nights):
+    return [(day.isoformat(), float(minutes)) for day, minutes in nights]
+
+
+class Stored_Activity(object):
+    """
+    Activity summary read back from an Athlete_Store, with the attributes of the Activity_Stats it was saved from.
+    """
+    def __init__(self, row, time_in_zones, zones):
+        for column, value in zip(ACTIVITY_COLUMNS, row):
+            setattr(self, column, value)
+        self.date = parse_date(self.date)
+        self.time_in_zones = time_in_zones
+        self.zones = zones
+
+
+class Athlete_Store(object):
+    """
+    Embedded SQLite database holding an Athlete: settings and current values, activities and their minutes in zones, daily training loads, sleep records and the synced file manifest. Saves write only what changed, and the activity history is read when first used.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.executescript(SCHEMA)
+                connection.execute('INSERT OR IGNORE INTO settings VALUES (?, ?)', ('schema_version', json.dumps(SCHEMA_VERSION)))
+
+    def connect(self):
+        connection = sqlite3.connect(self.filepath)
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+    def __getstate__(self):
+        return {'filepath': self.filepath}
+
+    def save(self, athlete):
+        """
+        Writes athlete to the store. Unless the athlete was loaded from or last saved to this store, every activity is written in place of those already stored; otherwise only those added since.
+        """
+        full = athlete.__dict__.get('store') is None or athlete.store.filepath != self.filepath
+        if full:
+            activities = list(athlete.activity_history)
+        else:
+            activities = athlete.unsaved_activities
+        removed = athlete.removed_activities
+        with closing(self.connect()) as connection:
+            with connection:
+                self.save_settings(connection, athlete)
+                if full:
+                    # (zone times go with their activities)
+                    connection.execute('DELETE FROM activities')
+                    connection.execute('DELETE FROM daily_loads')
+                connection.executemany('DELETE FROM activities WHERE date = ?', [(format_date(activity.date),) for activity in removed])
+                self.save_activities(connection, activities)
+                if 'daily_loads' in athlete.__dict__:
+                    self.save_daily_loads(connection, athlete.daily_loads, None if full else activities + removed)
+                self.save_manifest(connection, athlete.manifest, full)
+                self.save_sleep(connection, athlete.sleep_history, full)
+        athlete.store = self
+        athlete.unsaved_activities = []
+        athlete.removed_activities = []
+
+    def save_settings(self, connection, athlete):
+        values = [(name, json.dumps(getattr(athlete, name))) for name in SETTINGS]
+        values.append(('last_update', json.dumps(format_date(athlete.last_update))))
+        cache = athlete.cache
+        if cache is not None:
+            cache = [cache.directory, cache.max_bytes, cache.key_by]
+        values.append(('cache', json.dumps(cache)))
+        connection.executemany('INSERT OR REPLACE INTO settings VALUES (?, ?)', values)
+
+    def save_activities(self, connection, activities):
+        for activity in activities:
+            row = [format_date(activity.date)] + [getattr(activity, column) for column in ACTIVITY_COLUMNS[1:]]
+            cursor = connection.execute('INSERT OR IGNORE INTO activities ({}) VALUES ({})'.format(', '.join(ACTIVITY_COLUMNS), ', '.join(['?']*len(ACTIVITY_COLUMNS))), row)
+            if cursor.rowcount and activity.time_in_zones:
+                connection.executemany('INSERT INTO zone_times VALUES (?, ?, ?)',
+                                       [(cursor.lastrowid, zone, minutes) for zone, minutes in enumerate(activity.time_in_zones, 1)])
+
+    def save_daily_loads(self, connection, daily_loads, activities=None):
+        """
+        Writes the daily loads of every day touched by activities (or every day, if activities is None).
+        """
+        if daily_loads.start is None:
+            return
+        if activities is None:
+            days = np.flatnonzero(daily_loads.loads.any(axis=1))
+        else:
+            days = np.unique([(activity.date.date() - daily_loads.start).days for activity in activities])
+        rows = []
+        for day in days:
+            date = (daily_loads.start + datetime.timedelta(days=int(day))).isoformat()
+            for code, act_type in enumerate(daily_loads.types):
+                rows.append((date, act_type, float(daily_loads.loads[day, code])))
+        connection.executemany('INSERT OR REPLACE INTO daily_loads VALUES (?, ?, ?)', rows)
+
+    def save_manifest(self, connection, manifest, full):
+        """
+        Writes the manifest entries added or changed since it was last saved (or every entry, if full), and deletes those forgotten.
+        """
+        if full:
+            connection.execute('DELETE FROM files')
+        paths = manifest.entries if full else manifest.dirty
+        connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in manifest.forgotten])
+        rows = []
+        for path in paths:
+            entry = manifest.entries[path]
+            rows.append((path, entry.size, entry.mtime, entry.hash, None if entry.date is None else format_date(entry.date), entry.error))
+        connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', rows)
+        manifest.dirty = set()
+        manifest.forgotten = set()
+
+    def save_sleep(self, connection, sleep_history, full):
+        """
+        Writes the nights added or changed since sleep_history was last saved (or every night, if full).
+        """
+        if full:
+            connection.execute('DELETE FROM sleep_nights')
+        nights = sleep_history.nights() if full else sleep_history.nights(sleep_history.dirty)
+        connection.executemany('INSERT OR REPLACE INTO sleep_nights VALUES (?, ?)', sleep_rows(nights))
+        sleep_history.dirty = set()
+
+    def load(self):
+        """
+        Returns the stored Athlete, with its activity history left in the store until first used.
+        """
+        from class_defs import Athlete
+        from activity_cache import Activity_Cache
+        with closing(self.connect()) as connection:
+            settings = dict((key, json.loads(value)) for key, value in connection.execute('SELECT key, value FROM settings'))
+            nights = connection.execute('SELECT day, minutes FROM sleep_nights ORDER BY day').fetchall()
+            file_rows = connection.execute('SELECT path, size, mtime, hash, date, error FROM files').fetchall()
+        cache = settings['cache']
+        if cache is not None:
+            cache = Activity_Cache(cache[0], max_bytes=cache[1], key_by=cache[2])
+        athlete = Athlete(max_hr=settings['max_hr'], zones=settings['zones'], points_per_min=settings['points_per_min'], cache=cache)
+        for name in SETTINGS:
+            setattr(athlete, name, settings[name])
+        athlete.last_update = parse_date(settings['last_update'])
+        athlete.sleep_history = Sleep_History([datetime.datetime.strptime(day, '%Y-%m-%d').date().toordinal() for day, minutes in nights],
+                                              [minutes for day, minutes in nights])
+        athlete.sleep_history.dirty = set()
+        if len(athlete.sleep_history):
+            athlete.update_sleep_score()
+        athlete.manifest = File_Manifest((path, Manifest_Entry(size, mtime, digest, None if date is None else parse_date(date), error))
+                                         for path, size, mtime, digest, date, error in file_rows)
+        # Leave these to be fetched by Athlete.__getattr__ on first use
+        for name in ['activity_history', 'daily_loads', 'fitness_state']:
+            del athlete.__dict__[name]
+        athlete.store = self
+        return athlete
+
+    def load_history(self, athlete):
+        """
+        Fills in activity_history, daily_loads and fitness_state of an athlete loaded from this store.
+        """
+        from activity_history import Activity_History
+        from fitness_model import Daily_Loads, Fitness_State
+        with closing(self.connect()) as connection:
+            zone_times = {}
+            for activity_id, minutes in connection.execute('SELECT activity_id, minutes FROM zone_times ORDER BY activity_id, zone'):
+                zone_times.setdefault(activity_id, []).append(minutes)
+            rows = connection.execute('SELECT id, {} FROM activities ORDER BY date'.format(', '.join(ACTIVITY_COLUMNS))).fetchall()
+            load_rows = connection.execute('SELECT day, type, load FROM daily_loads ORDER BY day').fetchall()
+        athlete.activity_history = Activity_History([Stored_Activity(row[1:], zone_times.get(row[0]), athlete.zones) for row in rows])
+        athlete.daily_loads = Daily_Loads()
+        if load_rows:
+            days = [datetime.datetime.strptime(day, '%Y-%m-%d').date() for day, act_type, load in load_rows]
+            daily_loads = athlete.daily_loads
+            daily_loads.types = sorted(set([act_type for day, act_type, load in load_rows]))
+            daily_loads.extend(days[0], days[-1])
+            for day, (_, act_type, load) in zip(days, load_rows):
+                daily_loads.loads[(day - daily_loads.start).days, daily_loads.types.index(act_type)] = load
+        athlete.fitness_state = Fitness_State.from_history(athlete.activity_history, len(athlete.points_per_min))
+
+    def activities(self, start=None, end=None, act_type=None):
+        """
+        Returns list of dicts of stored activity summaries dated from start to end inclusive (either may be None), optionally only those of act_type, oldest to newest. Reads only the matching rows.
+        """
+        query = 'SELECT {} FROM activities WHERE 1'.format(', '.join(ACTIVITY_COLUMNS))
+        args = []
+        if start is not None:
+            query += ' AND date >= ?'
+            args.append(format_date(start))
+        if end is not None:
+            query += ' AND date <= ?'
+            args.append(format_date(end))
+        if act_type is not None:
+            query += ' AND type = ?'
+            args.append(act_type)
+        with closing(self.connect()) as connection:
+            rows = connection.execute(query + ' ORDER BY date', args).fetchall()
+        return [dict(zip(ACTIVITY_COLUMNS, row)) for row in rows]
+
+
+def is_store(filepath):
+    """
+    Returns whether the file at filepath is a SQLite database (as opposed to a legacy pickled Athlete).
+    """
+    with open(filepath, 'rb') as f:
+        return f.read(16) == b'SQLite format 3\x00'
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import traceback
+import multiprocessing
+from timeit import default_timer
+from parse_xml import parse_gpx, parse_tcx, unpack_gpx, unpack_tcx, engineer_features, impute_nulls
+from synthetic_data import write_gpx, write_tcx, write_activity_folder, synthetic_history
+from instrumentation import current_rss, peak_rss
+
+BENCHMARK_VERSION = 1
+
+# Activity files benchmarked through each parsing stage: (case name, writer, writer keyword arguments, included in --quick runs)
+ACTIVITY_FILES = [('Garmin Connect run, 30 min', write_gpx, {'creator': 'Garmin Connect', 'minutes': 30}, True),
+                  ('Strava run, 30 min, no cadence', write_gpx, {'creator': 'StravaGPX', 'minutes': 30, 'cadence': False}, True),
+                  ('Garmin Connect run, 30 min, no GPS, HR dropouts', write_gpx, {'minutes': 30, 'gps': False, 'hr_dropout': 0.05}, True),
+                  ('Garmin Connect ride, 3 hr, smart recording', write_gpx, {'act_type': 'cycling', 'minutes': 180, 'smart_recording': True}, True),
+                  ('Strava ride, 5 hr', write_gpx, {'creator': 'StravaGPX', 'act_type': 'cycling', 'minutes': 300}, False),
+                  ('Garmin Connect ultra, 24 hr, smart recording, HR dropouts', write_gpx, {'minutes': 1440, 'smart_recording': True, 'hr_dropout': 0.02}, False),
+                  ('Garmin Connect ultra, 24 hr', write_gpx, {'minutes': 1440}, False),
+                  ('TCX indoor ride, 1 hr', write_tcx, {'minutes': 60}, True),
+                  ('TCX indoor ride, 6 hr, HR dropouts', write_tcx, {'minutes': 360, 'hr_dropout': 0.05}, False)]
+
+FOLDER_SIZES = {'quick': [5], 'full': [10, 30]}
+HISTORY_SIZES = {'quick': [10, 1000], 'full': [10, 100, 1000, 10000]}
+
+# Modules whose import time is measured in a fresh interpreter; none of them may load the plotting stack
+IMPORTED_MODULES = ['class_defs', 'cli', 'team']
+PLOTTING_MODULES = ['matplotlib.pyplot', 'seaborn']
+
+
+# ____________ Measurement ____________
+
+def run_isolated(stage, state):
+    """
+    Runs stage(state) once in a forked child process and returns tuple of (seconds taken, peak bytes of memory used above what the child started with).
+
+    The child starts with a copy of everything set up beforehand (and may modify it freely), and a forked process's peak resident set size starts from its current size, so the peak reflects memory used by the stage alone.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+
+    def child():
+        try:
+            before = current_rss() or peak_rss()
+            start = default_timer()
+            stage(state)
+            sender.send((default_timer() - start, max(peak_rss() - before, 0), None))
+        except Exception:
+            sender.send((None, None, traceback.format_exc()))
+
+    process = multiprocessing.Process(target=child)
+    process.start()
+    seconds, peak, error = receiver.recv()
+    process.join()
+    if error is not None:
+        raise RuntimeError('Benchmark stage failed:\n' + error)
+    return seconds, peak
+
+
+def run_command(argv):
+    """
+    Runs argv in a child process and returns tuple of (seconds taken, peak bytes of memory used by the child), raising RuntimeError if it fails.
+    """
+    with open(os.devnull, 'w') as devnull:
+        start = default_timer()
+        process = subprocess.Popen(argv, stdout=devnull, stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__)))
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = default_timer() - start
+        process.returncode = status
+    if status:
+        raise RuntimeError('Benchmark command failed: ' + ' '.join(argv))
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return seconds, usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss*1024
+
+
+def measure_command(results, stage_name, case, argv, repeat=3, stages=None):
+    """
+    Appends to results a dict of the best latency over repeat runs of the command argv (including interpreter startup) and the largest peak memory. Does nothing unless stage_name is selected by stages.
+    """
+    if not selected([stage_name], stages):
+        return
+    runs = [run_command(argv) for _ in range(repeat)]
+    results.append({'stage': stage_name, 'case': case, 'latency': min([seconds for seconds, peak in runs]), 'throughput': None,
+                    'unit': None, 'peak_mb': max([peak for seconds, peak in runs])/1024.**2})
+
+
+def selected(stage_names, stages):
+    """
+    Returns whether any of stage_names contains one of the substrings in stages (or stages is empty).
+    """
+    return not stages or any([stage in name for name in stage_names for stage in stages])
+
+
+def measure(results, stage_name, case, units, unit, stage, state, repeat=3, stages=None):
+    """
+    Appends to results a dict of the best latency over repeat isolated runs of stage(state), the corresponding throughput in units per second, and the largest peak memory. Does nothing unless stage_name is selected by stages.
+    """
+    if not selected([stage_name], stages):
+        return
+    runs = [run_isolated(stage, state) for _ in range(repeat)]
+    latency = min([seconds for seconds, peak in runs])
+    results.append({'stage': stage_name, 'case': case, 'latency': latency, 'throughput': units/latency if latency else None,
+                    'unit': unit, 'peak_mb': max([peak for seconds, peak in runs])/1024.**2})
+
+
+# ____________ Benchmark cases ____________
+
+def parsing_benchmarks(directory, quick, **options):
+    results = []
+    if not selected(['parse_gpx', 'parse_tcx', 'engineer_features', 'impute_nulls'], options['stages']):
+        return results
+    for i, (case, writer, kwargs, in_quick) in enumerate(ACTIVITY_FILES):
+        if quick and not in_quick:
+            continue
+        extension = 'tcx' if writer is write_tcx else 'gpx'
+        filepath = os.path.join(directory, 'benchmark_{}.{}'.format(i, extension))
+        n_points = writer(filepath, seed=i, **kwargs)
+        if extension == 'gpx':
+            parse, unpack = parse_gpx, lambda path: unpack_gpx(path)[1::3]
+        else:
+            parse, unpack = parse_tcx, lambda path: unpack_tcx(path)[1::2]
+        measure(results, parse.__name__, case, n_points, 'trackpoints', parse, filepath, **options)
+        act_type, data = unpack(filepath)
+        measure(results, 'engineer_features', case, n_points, 'trackpoints', lambda state: engineer_features(*state), (act_type, data), **options)
+        act_type, data = engineer_features(act_type, data)
+        measure(results, 'impute_nulls', case, n_points, 'trackpoints', impute_nulls, data, **options)
+        os.remove(filepath)
+    return results
+
+
+def folder_benchmarks(directory, quick, **options):
+    from class_defs import Athlete
+    results = []
+    if not selected(['Athlete.add_activities_from_folder'], options['stages']):
+        return results
+    for n_activities in FOLDER_SIZES['quick' if quick else 'full']:
+        folder = os.path.join(directory, 'folder_{}'.format(n_activities))
+        write_activity_folder(folder, n_activities)
+        measure(results, 'Athlete.add_activities_from_folder', '{} activities, 30 min each'.format(n_activities), n_activities, 'activities',
+                lambda state: Athlete().add_activities_from_folder(state), folder, **options)
+        shutil.rmtree(folder)
+    return results
+
+
+def history_benchmarks(quick, **options):
+    from class_defs import Athlete
+    results = []
+    for n_activities in HISTORY_SIZES['quick' if quick else 'full']:
+        case = '{} activity history'.format(n_activities)
+        pairs = [(None, activity) for activity in synthetic_history(n_activities)]
+        measure(results, 'Athlete.merge_activities', case, n_activities, 'activities',
+                lambda state: Athlete().merge_activities(state), pairs, **options)
+        athlete = Athlete()
+        athlete.merge_activities(pairs)
+        measure(results, 'Athlete.update_fitness_values', case, n_activities, 'activities',
+                lambda state: state.update_fitness_values(), athlete, **options)
+        measure(results, 'Athlete.calculate_daily_fitness_fatigue_form', case, n_activities, 'activities',
+                lambda state: state.calculate_daily_fitness_fatigue_form('cardio'), athlete, **options)
+    return results
+
+
+def startup_benchmarks(directory, quick, **options):
+    """
+    Times starting a fresh interpreter, importing each of IMPORTED_MODULES (failing if any imports the plotting stack), and running cli.py status on a saved 1000 activity history.
+    """
+    from class_defs import Athlete
+    results = []
+    measure_command(results, 'interpreter startup', 'python -c pass', [sys.executable, '-c', 'pass'], **options)
+    for module in IMPORTED_MODULES:
+        check = 'import sys, {}; sys.exit(any([name in sys.modules for name in {!r}]))'.format(module, PLOTTING_MODULES)
+        measure_command(results, 'import {}'.format(module), 'fresh interpreter, without plotting', [sys.executable, '-c', check], **options)
+    if selected(['cli status'], options['stages']):
+        athlete = Athlete()
+        athlete.merge_activities([(None, activity) for activity in synthetic_history(1000)])
+        filepath = os.path.join(directory, 'athlete.db')
+        athlete.save(filepath)
+        measure_command(results, 'cli status', '1000 activity history', [sys.executable, 'cli.py', 'status', filepath], **options)
+    return results
+
+
+def run_benchmarks(quick=False, repeat=3, stages=None):
+    """
+    Runs every benchmark (or only those whose stage name contains one of stages) on freshly generated synthetic data, and returns list of result dicts.
+    """
+    directory = tempfile.mkdtemp(prefix='fitness_model_benchmarks_')
+    try:
+        return startup_benchmarks(directory, quick, repeat=repeat, stages=stages) + \
+               parsing_benchmarks(directory, quick, repeat=repeat, stages=stages) + \
+               folder_benchmarks(directory, quick, repeat=repeat, stages=stages) + \
+               history_benchmarks(quick, repeat=repeat, stages=stages)
+    finally:
+        shutil.rmtree(directory)
+
+
+# ____________ Reporting ____________
+
+def format_results(results):
+    lines = ['{:<46} {:<58} {:>11} {:>26} {:>10}'.format('Stage', 'Case', 'Latency (s)', 'Throughput', 'Peak (MB)')]
+    for result in results:
+        throughput = '{:,.0f} {}/s'.format(result['throughput'], result['unit']) if result['throughput'] else '-'
+        lines.append('{:<46} {:<58} {:>11.4f} {:>26} {:>10.1f}'.format(result['stage'], result['case'], result['latency'], throughput, result['peak_mb']))
+    return '\n'.join(lines)
+
+
+def compare(results, baseline, threshold=0.25, min_peak_mb=4.):
+    """
+    Returns list of messages describing each result whose latency (or peak memory, when either run used at least min_peak_mb) exceeds the matching baseline result by more than the fraction threshold.
+    """
+    previous = dict(((result['stage'], result['case']), result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        old = previous.get((result['stage'], result['case']))
+        if old is None:
+            continue
+        if result['latency'] > old['latency']*(1 + threshold):
+            regressions.append('{} [{}]: latency {:.4f}s vs {:.4f}s baseline'.format(result['stage'], result['case'], result['latency'], old['latency']))
+        if max(result['peak_mb'], old['peak_mb']) >= min_peak_mb and result['peak_mb'] > old['peak_mb']*(1 + threshold):
+            regressions.append('{} [{}]: peak memory {:.1f} MB vs {:.1f} MB baseline'.format(result['stage'], result['case'], result['peak_mb'], old['peak_mb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark startup, parsing, ingestion and fitness calculations on synthetic activity data.')
+    parser.add_argument('--quick', action='store_true', help='run only the smaller cases')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest is reported (default 3)')
+    parser.add_argument('--stage', action='append', help='only run stages whose name contains STAGE (may be repeated)')
+    parser.add_argument('--save', metavar='FILE', help='save results as JSON, e.g. as a baseline for --compare')
+    parser.add_argument('--compare', metavar='FILE', help='compare against results saved with --save, exiting with status 1 on any regression')
+    parser.add_argument('--threshold', type=float, default=0.25, help='fractional slowdown (or memory growth) counted as a regression (default 0.25)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, repeat=args.repeat, stages=args.stage)
+    print format_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'version': BENCHMARK_VERSION, 'python': platform.python_version(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), threshold=args.threshold)
+        if regressions:
+            print '\nRegressions beyond {:.0%}:\n\t'.format(args.threshold) + '\n\t'.join(regressions)
+            return 1
+        print '\nNo regressions beyond {:.0%}'.format(args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,112 @@
 import numpy as np
 import pandas as pd
 
-def time_in_zones(df):
-    times = []
-    for i in range(1, 6):
-        df_zone = df[df.zone == i]
-        if 'moving' in df.columns.values:
-            df_zone = df_zone[df_zone.moving == True]
-        times.append(int(round(df_zone.time_delta.sum()/60, 0)))
-    return times
+# Training load points accumulated per minute in each heart rate zone, for the default five zones
+POINTS_PER_MIN = [0.2, 0.4, 0.75, 1.6667, 2.]
+# Default heart rate zone thresholds, as fractions of max heart rate
+ZONE_FRACTIONS = [0.59, 0.78, 0.87, 0.97]
+
+
+def default_zones(max_hr):
+    return [int(max_hr*fraction) for fraction in ZONE_FRACTIONS]
+
+
+def max_hr_from_zones(zones):
+    """
+    Returns the max heart rate implied by the default zone thresholds zones (the average of each threshold divided by its fraction of max heart rate). Raises ValueError for any other number of thresholds, whose fractions aren't known.
+    """
+    if len(zones) != len(ZONE_FRACTIONS):
+        raise ValueError('max heart rate can only be derived from {} zone thresholds, not {}; give it explicitly'.format(len(ZONE_FRACTIONS), len(zones)))
+    return int(sum([zone*1./fraction for zone, fraction in zip(zones, ZONE_FRACTIONS)])/len(zones))
+
+
+def zone_points(zones, points_per_min=None):
+    """
+    Returns the per-minute point rates for each of the len(zones)+1 heart rate zones defined by the thresholds in zones, falling back on POINTS_PER_MIN when the default five zones are in use.
+    """
+    if points_per_min is None:
+        points_per_min = POINTS_PER_MIN
+    if len(points_per_min) != len(zones)+1:
+        raise ValueError('{} zone thresholds define {} zones, but {} points_per_min rates were given'.format(len(zones), len(zones)+1, len(points_per_min)))
+    return list(points_per_min)
+
+
+def assign_zones(heart_rates, zones):
+    """
+    Returns array of heart rate zones (1 for heart rates below zones[0], up to len(zones)+1 for heart rates at or above zones[-1]) for an array of heart rates. Missing heart rates fall in the top zone.
+    """
+    return np.searchsorted(np.asarray(zones), np.asarray(heart_rates), side='right') + 1
+
+
+def zone_times_and_load(df, points_per_min=POINTS_PER_MIN):
+    """
+    Returns tuple of minutes spent (moving) in each heart rate zone and the resulting training load, from a single weighted count over the trackpoints. df may also be a resampling.Uniform_Series, whose columns are plain arrays.
+    """
+    n_zones = len(points_per_min)
+    weights = np.nan_to_num(np.asarray(df.time_delta, dtype=np.float64))
+    if 'moving' in df.columns.values:
+        weights = weights*np.asarray(df.moving)
+    seconds = np.bincount(np.asarray(df.zone)-1, weights=weights, minlength=n_zones)
+    times = [int(round(secs/60, 0)) for secs in seconds]
+    load = int(sum([times[i]*points_per_min[i] for i in range(n_zones)]))
+    return times, load
+
+
+def column_values(df, name, dtype=np.float64):
+    """
+    Returns the values of column name of df as an array of dtype (a view of the column's data when it already has that dtype), or None if df has no such column.
+    """
+    if name not in df.columns.values:
+        return None
+    return np.asarray(df[name].values, dtype=dtype)
+
+
+def activity_summary(df, samples=None, points_per_min=POINTS_PER_MIN):
+    """
+    Returns dict of the summary stats (total_distance_2d/3d, avg_speed_2d/3d, elevation_gain/loss, time_in_zones, training_load, avg_cadence) which can be calculated from the columns of df, in one pass over its arrays. Time in zones and training load are counted on samples (a resampling.Uniform_Series) if given.
+    """
+    columns = set(df.columns.values)
+    stats = {}
+    time_delta = column_values(df, 'time_delta')
+    moving = column_values(df, 'moving', bool)
+    moving_secs = None
+    if time_delta is not None:
+        moving_secs = np.nansum(time_delta[moving] if moving is not None else time_delta)
+
+    if 'lat' in columns and 'lon' in columns:
+        for dim in ['2d', '3d']:
+            feet = column_values(df, 'distance_{}_ft'.format(dim))
+            miles = np.nansum(feet)/5280 if feet is not None else 0.001
+            stats['total_distance_{}'.format(dim)] = miles
+            if time_delta is not None:
+                hrs = moving_secs*1./3600
+                stats['avg_speed_{}'.format(dim)] = miles/hrs if hrs != 0 else 0
+
+    elevation_change = column_values(df, 'elevation_change')
+    if 'elevation' in columns and elevation_change is not None:
+        # (the first change is NaN, and compares False)
+        with np.errstate(invalid='ignore'):
+            stats['elevation_gain'] = elevation_change[elevation_change > 0].sum()
+            stats['elevation_loss'] = -elevation_change[elevation_change < 0].sum()
+
+    if 'hr' in columns:
+        stats['time_in_zones'], stats['training_load'] = zone_times_and_load(df if samples is None else samples, points_per_min)
+
+    cadence = column_values(df, 'cadence')
+    if cadence is not None and time_delta is not None:
+        # Time-weighted cadence over moving points with a running cadence
+        with np.errstate(invalid='ignore'):
+            running = cadence > 40
+        if moving is not None:
+            running &= moving
+        running_secs = np.nansum(time_delta[running])
+        if running_secs:
+            stats['avg_cadence'] = int(np.nansum(time_delta[running]*cadence[running])*1./running_secs)
+    return stats
+
+
+def time_in_zones(df, n_zones=len(POINTS_PER_MIN)):
+    return zone_times_and_load(df, [0]*n_zones)[0]
 
 
 def elevation(df):
@@ -17,10 +115,8 @@ def elevation(df):
     return gain, loss
 
 
-def training_load(df):
-    times = time_in_zones(df)
-    points_per_min = [0.2, 0.4, 0.75, 1.6667, 2.]
-    return int(sum([times[i]*points_per_min[i] for i in range(5)]))
+def training_load(df, points_per_min=POINTS_PER_MIN):
+    return zone_times_and_load(df, points_per_min)[1]
 
 
 def distance_2d(df):
@@ -1,26 +1,60 @@
 import os
 import glob
-import seaborn
+import time
 import datetime
+import multiprocessing
 import numpy as np
 import pandas as pd
-import cPickle as pickle
-import matplotlib.pyplot as plt
-from operator import add, truediv
-from scipy.interpolate import spline
-from parse_xml import parse_gpx, parse_tcx
-from matplotlib.collections import LineCollection
-from matplotlib.colors import ListedColormap, BoundaryNorm
-from utils import calc_fit_from_list, calc_fat_from_list, calc_norm_factor
-from calculate_stats import time_in_zones, elevation, training_load, distance_2d, distance_3d, avg_speed_2d, avg_speed_3d, avg_cadence
+from operator import truediv
+from parse_xml import parse_gpx, parse_tcx, parse_gpx_header, parse_tcx_header
+from activity_history import Activity_History
+from athlete_store import Athlete_Store
+from sleep import Sleep_History
+from resampling import Uniform_Series
+from folder_sync import File_Manifest
+from scenarios import Scenario_Engine, as_date
+from rollups import Rollups
+from instrumentation import stage
+from plot_kernels import METERS_PER_FOOT, cumulative_sum, rolling_mean, clip_outliers, screen_points, resample, time_at_values
+from fitness_model import Fitness_State, Daily_Loads, Fitness_Index, daily_fitness_fatigue_form
+from calculate_stats import ZONE_FRACTIONS, zone_points, default_zones, max_hr_from_zones, activity_summary
+
+
+def pyplot(backend=None):
+    """
+    Returns matplotlib.pyplot, imported (along with seaborn, for its styling) only when something is plotted, so that code which never plots doesn't pay to load the plotting stack or need a display. A backend (e.g. 'Agg', for saving figures without a display) may be chosen before pyplot is first imported.
+    """
+    import matplotlib
+    if backend is not None:
+        matplotlib.use(backend)
+    import matplotlib.pyplot as plt
+    import seaborn
+    return plt
+
+
+def show(plt, filepath=None):
+    """
+    Saves the current figure to filepath, or shows it if filepath is None.
+    """
+    if filepath is None:
+        plt.show()
+    else:
+        plt.savefig(filepath)
+        plt.close()
 
 
 class Activity(object):
     """
     Activities are never modified, all attributes are specified upon creation. Many attributes (e.g. temperatures, average speeds, etc.) are available which are not used in the current fitness model but felt like they were a waste to throw away.
+
+    If an Activity_Cache is provided, parsed trackpoint data and summary stats are loaded from it when the file has been parsed before with the same zone settings, and stored in it otherwise.
+
+    With lazy=True only the file's header (name, type, date, creator) is read on creation. Trackpoints are decoded, features engineered and stats calculated the first time any trackpoint attribute or stat is used (an unknown activity type also waits for this, since it's corrected from the trackpoint speeds), after which they're kept like those of any other Activity.
     """
-    def __init__(self, filepath, zones = [113, 150, 168, 187]):
+    def __init__(self, filepath, zones = [113, 150, 168, 187], points_per_min=None, cache=None, lazy=False):
         self.filepath = filepath
+        self.cache = cache
+        self.deferred = ()
         self.filetype = filepath.split('.')[-1]
         self.name = None
         self.creator = None
@@ -37,6 +71,7 @@ class Activity(object):
         self.cadences = None
         self.avg_cadence = None
         self.zones = zones
+        self.points_per_min = zone_points(zones, points_per_min)
         self.distances_2d_ft = None
         self.distances_3d_ft = None
         self.speeds_2d = None
@@ -47,20 +82,86 @@ class Activity(object):
         self.avg_speed_3d = None
         self.elevation_gain = None
         self.elevation_loss = None
-        self.time_in_zone1 = None
-        self.time_in_zone2 = None
-        self.time_in_zone3 = None
-        self.time_in_zone4 = None
-        self.time_in_zone5 = None
+        # Minutes in each of the len(zones)+1 heart rate zones, also exposed as time_in_zone1, time_in_zone2, etc.
+        self.time_in_zones = None
+        for zone in range(1, len(zones)+2):
+            setattr(self, 'time_in_zone{}'.format(zone), None)
         self.training_load = None
-        self.init()
+        # Uniform_Series of the trackpoint data by sample rate, built on first use by resampled()
+        self.uniform_series = {}
+        self.init(lazy)
+
+    def __getattr__(self, name):
+        # Lazy Activities parse their trackpoints on first use of anything the header doesn't provide
+        if name in self.__dict__.get('deferred', ()):
+            self.load()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def init(self, lazy=False):
+        if lazy:
+            self.read_header()
+        else:
+            self.load()
 
-    def init(self):
+    def trackpoint_attributes(self):
+        """
+        Returns list of names of the attributes set from trackpoint data: per-point series and summary stats.
+        """
+        return ['time_deltas', 'moving', 'lats', 'lons', 'elevations', 'heart_rates', 'heart_rate_zones', 'temps', 'cadences',
+                'distances_2d_ft', 'distances_3d_ft', 'speeds_2d', 'speeds_3d',
+                'avg_cadence', 'total_distance_2d', 'total_distance_3d', 'avg_speed_2d', 'avg_speed_3d',
+                'elevation_gain', 'elevation_loss', 'time_in_zones', 'training_load'] + \
+               ['time_in_zone{}'.format(zone) for zone in range(1, len(self.zones)+2)]
+
+    def read_header(self):
         if self.filetype == 'gpx':
-            self.name, self.type, self.date, self.creator, activity_info = parse_gpx(self.filepath, zones=self.zones)
+            self.name, self.type, self.date, self.creator = parse_gpx_header(self.filepath)
         elif self.filetype == 'tcx':
-            self.name, self.type, self.date, self.creator, activity_info = parse_tcx(self.filepath, zones=self.zones)
-
+            self.name, self.type, self.date, self.creator = parse_tcx_header(self.filepath)
+        deferred = self.trackpoint_attributes()
+        if self.type == 'Unknown Activity Type':
+            deferred.append('type')
+        # Leave these to be filled in by __getattr__ on first use
+        for name in deferred:
+            del self.__dict__[name]
+        self.deferred = tuple(deferred)
+
+    def load(self):
+        """
+        Parses the activity file (or loads it from the cache) and sets trackpoint data and summary stats.
+        """
+        for name in self.deferred:
+            self.__dict__.setdefault(name, None)
+        self.deferred = ()
+        with stage('Activity.load', self.filepath):
+            cached, key = None, None
+            if self.cache is not None:
+                key = self.cache.key(self.filepath, self.zones, self.points_per_min)
+                with stage('Activity_Cache.get'):
+                    cached = self.cache.get(key)
+            if cached is not None:
+                self.name, self.type, self.date, self.creator, activity_info, stats = cached
+            else:
+                if self.filetype == 'gpx':
+                    self.name, self.type, self.date, self.creator, activity_info = parse_gpx(self.filepath, zones=self.zones)
+                elif self.filetype == 'tcx':
+                    self.name, self.type, self.date, self.creator, activity_info = parse_tcx(self.filepath, zones=self.zones)
+                self.set_trackpoint_data(activity_info)
+                with stage('calculate_stats', points=len(activity_info)):
+                    stats = self.calculate_stats(activity_info)
+                if self.cache is not None:
+                    with stage('Activity_Cache.put', points=len(activity_info)):
+                        self.cache.put(key, self.name, self.type, self.date, self.creator, activity_info, stats)
+            if cached is not None:
+                self.set_trackpoint_data(activity_info)
+            for stat, value in stats.items():
+                setattr(self, stat, value)
+            if self.time_in_zones is not None:
+                for zone, minutes in enumerate(self.time_in_zones, 1):
+                    setattr(self, 'time_in_zone{}'.format(zone), minutes)
+
+    def set_trackpoint_data(self, activity_info):
         if 'time_delta' in activity_info.columns.values:
             self.time_deltas = activity_info.time_delta
 
@@ -70,55 +171,72 @@ class Activity(object):
                 self.lons = activity_info.lon
                 self.distances_2d_ft = activity_info.distance_2d_ft
                 self.distances_3d_ft = activity_info.distance_3d_ft
-                self.total_distance_2d = distance_2d(activity_info)
-                self.total_distance_3d = distance_3d(activity_info)
                 if 'time_delta' in activity_info.columns.values:
                     self.speeds_2d = activity_info.speed_2d
                     self.speeds_3d = activity_info.speed_3d
-                    self.avg_speed_2d = avg_speed_2d(activity_info)
-                    self.avg_speed_3d = avg_speed_3d(activity_info)
                     self.moving = activity_info.moving
 
         if 'elevation' in activity_info.columns.values:
             self.elevations = activity_info.elevation
-            gain, loss = elevation(activity_info)
-            self.elevation_gain = gain
-            self.elevation_loss = loss
 
         if 'hr' in activity_info.columns.values:
             self.heart_rates = activity_info.hr
             self.heart_rate_zones = activity_info.zone
-            zones = time_in_zones(activity_info)
-            self.time_in_zone1 = zones[0]
-            self.time_in_zone2 = zones[1]
-            self.time_in_zone3 = zones[2]
-            self.time_in_zone4 = zones[3]
-            self.time_in_zone5 = zones[4]
-            self.training_load = training_load(activity_info)
 
         if 'air_temp' in activity_info.columns.values:
             self.temps = activity_info.air_temp
 
         if 'cadence' in activity_info.columns.values:
             self.cadences = activity_info.cadence
-            self.avg_cadence = avg_cadence(activity_info)
+
+    def calculate_stats(self, activity_info):
+        """
+        Returns dict of summary stats (distances, speeds, elevation, time in zones, training load, cadence) calculated from dataframe of trackpoint data, whose columns must already have been set as attributes by set_trackpoint_data, in a single call to activity_summary; stats which can't be calculated from the available columns are omitted.
+        """
+        samples = None
+        if 'hr' in activity_info.columns.values:
+            # Count time in zones on the uniform time grid shared with plotting, when there are timestamps to build it from
+            with stage('resample', points=len(activity_info)):
+                samples = self.resampled()
+        with stage('activity_summary', points=len(activity_info)):
+            return activity_summary(activity_info, samples, self.points_per_min)
+
+
+    def resampled(self, rate=1.):
+        """
+        Returns the trackpoint data resampled onto a grid of rate samples per second (see Uniform_Series), or None if the activity has no timestamps. Built once per rate and kept, so plotting and zone accounting share the same arrays.
+        """
+        if self.time_deltas is None:
+            return None
+        if rate not in self.uniform_series:
+            self.uniform_series[rate] = Uniform_Series(self.time_deltas,
+                                                       {'hr': self.heart_rates, 'zone': self.heart_rate_zones, 'moving': self.moving,
+                                                        'elevation': self.elevations, 'speed_2d': self.speeds_2d, 'speed_3d': self.speeds_3d,
+                                                        'cadence': self.cadences, 'air_temp': self.temps, 'lat': self.lats, 'lon': self.lons},
+                                                       rate)
+        return self.uniform_series[rate]
 
 
     # ___________ Plotting Methods ___________
 
 
-    def plot(self, hr=True, elevation=True, grade=True, hr_hist=False, zones_hist=False, hr_and_zones_hist=False, mark_hr_zones=False):
-        # Plots all of HR, Zones, HR & Zones overlaid, Elevation, and Grades which are set to True
-        fig, axes = plt.subplots(hr+elevation+grade+hr_hist+zones_hist+hr_and_zones_hist, 1)
+    def plot(self, hr=True, elevation=True, grade=True, hr_hist=False, zones_hist=False, hr_and_zones_hist=False, mark_hr_zones=False, filepath=None):
+        # Plots all of HR, Zones, HR & Zones overlaid, Elevation, and Grades which are set to True; saved to filepath if given, otherwise shown
+        plt = pyplot()
+        if self.moving is None:
+            # Without GPS data (e.g. indoor .tcx files) there are no distances to plot elevation and grade against, and heart rate is plotted against time
+            elevation = grade = False
+        fig, axes = plt.subplots(hr+elevation+grade+hr_hist+zones_hist+hr_and_zones_hist, 1, squeeze=False)
+        axes = list(axes[:, 0])
         axes[0].set_title(self.name, fontsize=14)
 
         if hr:
             self.plot_hr(axes[0], mark_hr_zones=mark_hr_zones)
             if not (elevation or grade):
-                axes[0].set_xlabel('Distance', fontsize=12)
+                axes[0].set_xlabel('Distance' if self.moving is not None else 'Time (min)', fontsize=12)
         if elevation:
             index = hr+elevation-1
-            self.plot_elevation(axes[elevation], grade=grade)
+            self.plot_elevation(axes[index], grade=grade)
             if not grade:
                 axes[index].set_xlabel('Distance', fontsize=12)
         if grade:
@@ -145,11 +263,11 @@ class Activity(object):
             labels = [item.get_text() for item in ax.get_xticklabels()]
             empty_string_labels = ['']*len(labels)
             ax.set_xticklabels(empty_string_labels)
-        plt.show()
+        show(plt, filepath)
 
 
     def plot_hr(self, ax, mark_hr_zones=True):
-        if self.moving[0] == None:
+        if self.moving is None:
             result = self.plot_hr_by_time(ax, mark_hr_zones=mark_hr_zones)
         else:
             result = self.plot_hr_by_distance(ax, mark_hr_zones=mark_hr_zones)
@@ -158,61 +276,42 @@ class Activity(object):
 
 
     def plot_hr_by_distance(self, ax, mark_hr_zones=True):
-        distances = [i/3.28084 for i in self.distances_2d_ft[self.moving]]
-        cumulative_distances = [sum(distances[:i]) for i in range(len(distances))]
-        xgrad = np.linspace(0, cumulative_distances[-1], cumulative_distances[-1])
-        hr = self.heart_rates[self.moving]
+        cumulative_distances = cumulative_sum(self.distances_2d_ft[self.moving].values*METERS_PER_FOOT)
 
         # Smooth heart rates by averaging
-        hr = [np.mean(hr[0:2])] + [np.mean(hr[0:3])] + [np.mean(hr[i-2:i+3]) for i in range(2, len(hr)-2)] + [np.mean(hr[-3:])] + [np.mean(hr[-2:])]
-        smoothed_HRs = spline(cumulative_distances, hr, xgrad)
+        hr = rolling_mean(self.heart_rates[self.moving].values)
+        # Up to one point per meter, but no more than the axis has pixels
+        xgrad, smoothed_HRs = resample(cumulative_distances, hr, cumulative_distances[-1], screen_points(ax))
         ax.set_ylabel('Heart Rate', fontsize=12)
 
         if mark_hr_zones:
-            [z1, z2, z3, z4] = self.zones
-            ax.axhline(y=z1, xmin=0, xmax=len(hr)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            ax.axhline(y=z2, xmin=0, xmax=len(hr)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            ax.axhline(y=z3, xmin=0, xmax=len(hr)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            ax.axhline(y=z4, xmin=0, xmax=len(hr)*1./60, linewidth=1, color = 'k', linestyle='dashed')
+            for zone in self.zones:
+                ax.axhline(y=zone, xmin=0, xmax=len(hr)*1./60, linewidth=1, color = 'k', linestyle='dashed')
 
         return ax.plot(xgrad*3.28084/5280, smoothed_HRs)
 
 
 
     def plot_hr_by_time(self, ax, mark_hr_zones=True):
-        hr_by_sec = [self.heart_rates[0]]
-        hr = self.heart_rates
-        # Smooth heart rates by averaging
-        hr = [np.mean(hr[0:2])] + [np.mean(hr[0:3])] + [np.mean(hr[i-2:i+3]) for i in range(2, len(hr)-2)] + [np.mean(hr[-3:])] + [np.mean(hr[-2:])]
-
-        time_deltas = self.time_deltas
-
-        for i in time_deltas.index[1:]:
-            hr_by_sec += [hr[i]]*int(time_deltas[i])
-        x = np.linspace(0, len(hr_by_sec)*1./60, len(hr_by_sec))
-        hr_by_sec = np.array(hr_by_sec)
+        # Smooth heart rates by averaging, then take them once per second
+        samples = self.resampled()
+        hr_by_sec = samples.gather(rolling_mean(self.heart_rates.values))
+        x, hr_by_sec = resample(samples.seconds/60, hr_by_sec, len(hr_by_sec), screen_points(ax))
         ax.set_ylabel('Heart Rate', fontsize=12)
 
         if mark_hr_zones:
-            [z1, z2, z3, z4] = self.zones
-            plt.axhline(y=z1, xmin=0, xmax=len(hr_by_sec)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            plt.axhline(y=z2, xmin=0, xmax=len(hr_by_sec)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            plt.axhline(y=z3, xmin=0, xmax=len(hr_by_sec)*1./60, linewidth=1, color = 'k', linestyle='dashed')
-            plt.axhline(y=z4, xmin=0, xmax=len(hr_by_sec)*1./60, linewidth=1, color = 'k', linestyle='dashed')
+            for zone in self.zones:
+                ax.axhline(y=zone, xmin=0, xmax=len(hr_by_sec)*1./60, linewidth=1, color = 'k', linestyle='dashed')
 
         return ax.plot(x, hr_by_sec)
 
 
 
     def plot_elevation(self, axis, grade=True):
-        elevations = list(self.elevations[self.moving])
-        distances = [i/3.28084 for i in self.distances_2d_ft[self.moving]]
-
-        cumulative_distances = [sum(distances[:i]) for i in range(len(distances))]
+        elevations = self.elevations[self.moving].values
+        cumulative_distances = cumulative_sum(self.distances_2d_ft[self.moving].values*METERS_PER_FOOT)
 
-        xgrad = np.linspace(0, cumulative_distances[-1], cumulative_distances[-1])
-
-        smoothed_elevations = spline(cumulative_distances, elevations, xgrad)
+        xgrad, smoothed_elevations = resample(cumulative_distances, elevations, cumulative_distances[-1], screen_points(axis))
 
         axis.set_ylabel('Elevation (ft)', fontsize=12)
 
@@ -220,22 +319,20 @@ class Activity(object):
 
 
     def plot_grade(self, axes):
-        elevations = list(self.elevations[self.moving])
-        distances = [i/3.28084 for i in self.distances_2d_ft[self.moving]]
+        elevations = self.elevations[self.moving].values
+        distances = self.distances_2d_ft[self.moving].values*METERS_PER_FOOT
 
-        cumulative_distances = [sum(distances[:i]) for i in range(len(distances))]
+        cumulative_distances = cumulative_sum(distances)
 
-        elevation_changes = [0]+[elevations[i] - elevations[i-1] for i in range(1, len(elevations))]
+        elevation_changes = np.concatenate([[0], np.diff(elevations)])
 
-        grades = [elevation_changes[i]/distances[i]*100 for i in range(len(elevations))]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            grades = elevation_changes/distances*100
 
         # Smooth out grades by eliminating outliers and averaging nearby values
-        grades = [x if np.abs(x) < 22 else 0 for x in grades]
-        grades = [np.mean(grades[0:2])] + [np.mean(grades[0:3])] + [np.mean(grades[i-2:i+3]) for i in range(2, len(grades)-2)] + [np.mean(grades[-3:])] + [np.mean(grades[-2:])]
-
-        xgradnew = np.linspace(0, cumulative_distances[-1], cumulative_distances[-1])
+        grades = rolling_mean(clip_outliers(grades, 22))
 
-        smoothed_grades = spline(cumulative_distances, grades, xgradnew)
+        xgradnew, smoothed_grades = resample(cumulative_distances, grades, cumulative_distances[-1], screen_points(axes))
 
         axes.set_ylabel('Grade')
 
@@ -246,9 +343,8 @@ class Activity(object):
     def plot_hr_hist(self, axis):
         min_hr, max_hr = self.heart_rates.min(), self.heart_rates.max()
         zones = [min(min_hr, 90)]+self.zones+[max(max_hr, 195)]
-        time_at_different_heart_rates = []
-        for heart_rate in range(int(min_hr), int(max_hr)+1):
-            time_at_different_heart_rates.append(round(self.time_deltas[self.heart_rates == heart_rate].sum()*1./60, 2))
+        samples = self.resampled()
+        time_at_different_heart_rates = np.round(time_at_values(samples.hr, samples.time_delta, int(min_hr), int(max_hr))/60, 2)
 
         axis.set_ylabel('Min at HR')
 
@@ -258,53 +354,45 @@ class Activity(object):
     def plot_time_in_zones_hist(self, axis):
         min_hr, max_hr = self.heart_rates.min(), self.heart_rates.max()
         zones = [min(min_hr, 90)]+self.zones+[max(max_hr, 195)]
-        time_deltas = pd.Series([1.0]).append(self.time_deltas[1:])
+        samples = self.resampled()
 
         axis.set_ylabel('Min in Zones')
 
-        return axis.hist(self.heart_rates, bins=zones, weights=time_deltas.apply(int)*1./60, alpha=0.35)
+        return axis.hist(samples.hr, bins=zones, weights=samples.time_delta/60, alpha=0.35)
 
 
     def plot_hr_and_time_in_zones_hist(self, axes):
         min_hr, max_hr = self.heart_rates.min(), self.heart_rates.max()
         zones = [min(min_hr, 90)]+self.zones+[max(max_hr, 195)]
 
-        time_at_different_heart_rates = []
-        for heart_rate in range(int(min_hr), int(max_hr)+1):
-            time_at_different_heart_rates.append(round(self.time_deltas[self.heart_rates == heart_rate].sum()*1./60, 2))
+        samples = self.resampled()
+        time_at_different_heart_rates = np.round(time_at_values(samples.hr, samples.time_delta, int(min_hr), int(max_hr))/60, 2)
 
         for ax in axes:
             ax.grid(b=False)
-        time_deltas = pd.Series([1.0]).append(self.time_deltas[1:])
         axes[0].set_ylabel('Min in Zones')
         axes[1].set_ylabel('Min at HR')
 
-        return axes[0].hist(self.heart_rates, bins=zones, weights=time_deltas.apply(int)*1./60, alpha=0.35), axes[1].plot(range(int(min_hr), int(max_hr)+1), time_at_different_heart_rates, color='g')
+        return axes[0].hist(samples.hr, bins=zones, weights=samples.time_delta/60, alpha=0.35), axes[1].plot(range(int(min_hr), int(max_hr)+1), time_at_different_heart_rates, color='g')
 
 
 class Activity_Stats(object):
     """
-    Class contains same attributes as an Activity, but does not retain the data from the .gpx (e.g. individual TrackPoint data). Primary use is to be stored in activity_history attribute list of an Athlete.
+    Class contains the summary attributes of an Activity (name, type, date, distances, speeds, elevation, time in zones and training load), but none of the data from the .gpx (e.g. individual TrackPoint data or per-point distance and speed series). Primary use is to be added to the activity_history (an Activity_History) of an Athlete, which stores these attributes as columns.
     """
     def __init__(self, activity, zones = [113, 150, 168, 187]):
-        self.save_filepath = None
-        self.last_saved_date = None
         self.name = None
         self.type = None
         self.creator = None
         self.date = None
         self.zones = zones
-        self.distances_2d_ft = None
-        self.distances_3d_ft = None
-        self.speeds_2d = None
-        self.speeds_3d = None
         self.total_distance_2d = None
         self.total_distance_3d = None
         self.avg_speed_2d = None
         self.avg_speed_3d = None
         self.elevation_gain = None
         self.elevation_loss = None
-        self.time_in_zones = []
+        self.time_in_zones = None
         self.training_load = 0
         self.init(activity)
 
@@ -314,44 +402,81 @@ class Activity_Stats(object):
         self.creator = activity.creator
         self.date = activity.date
         self.zones = activity.zones
-        self.distances_2d_ft = activity.distances_2d_ft
-        self.distances_3d_ft = activity.distances_3d_ft
-        self.speeds_2d = activity.speeds_2d
-        self.speeds_3d = activity.speeds_3d
         self.total_distance_2d = activity.total_distance_2d
         self.total_distance_3d = activity.total_distance_3d
         self.avg_speed_2d = activity.avg_speed_2d
         self.avg_speed_3d = activity.avg_speed_3d
         self.elevation_gain = activity.elevation_gain
         self.elevation_loss = activity.elevation_loss
-        for zone in [activity.time_in_zone1, activity.time_in_zone2,
-                     activity.time_in_zone3, activity.time_in_zone4,
-                     activity.time_in_zone5]:
-            self.time_in_zones.append(zone)
+        self.time_in_zones = activity.time_in_zones
         self.training_load = activity.training_load
 
 
 
+def activity_stats_from_file(job):
+    """
+    Parses the activity file described by job, a tuple of (filepath, zones, points_per_min, cache), and returns its Activity_Stats. Defined at module level so that Athlete.add_activities can hand it to worker processes.
+    """
+    filepath, zones, points_per_min, cache = job
+    return Activity_Stats(Activity(filepath, zones=zones, points_per_min=points_per_min, cache=cache))
+
+
+def error_message(error):
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def activity_stats_or_error(job):
+    """
+    Returns tuple of the Activity_Stats of the activity file described by job (see activity_stats_from_file) and None, or of None and the error raised parsing it, so one bad file in a pool of workers doesn't lose the rest.
+    """
+    try:
+        return activity_stats_from_file(job), None
+    except Exception as e:
+        return None, error_message(e)
+
+
+def parse_activity_files(jobs, processes=1, parse=activity_stats_from_file):
+    """
+    Returns list of the results of parse (by default the Activity_Stats, see activity_stats_from_file) for each job, parsed across a pool of worker processes when processes > 1 (or None, for one worker per CPU) and there is more than one job.
+    """
+    if processes == 1 or len(jobs) < 2:
+        return [parse(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(parse, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
 
 class Athlete(object):
     """
-    Athletes are initialized with a max heart rate, and/or heart rate zones (top ends of ranges of first 4 of 5 zones)
+    Athletes are initialized with a max heart rate, and/or heart rate zones (top ends of ranges of all but the last zone; by default 4 thresholds defining 5 zones). Any number of zones may be used, provided points_per_min gives the training load points accumulated per minute in each zone.
+
+    An Activity_Cache may be provided to skip re-parsing activity files which have been parsed before (e.g. when rebuilding an athlete from its raw data folder).
 
     The most important methods are add_activity (which requires specifying filepath to gpx file), update_values (for updating fitness, fatigue, and form values when no workout was added in the last day or so), and update_sleep_values (which requires .csv of sleep data downloaded from Garmin Connect)
     """
-    def __init__(self, max_hr=195, zones=None, print_fitness_vals=False):
+    def __init__(self, max_hr=195, zones=None, points_per_min=None, cache=None, print_fitness_vals=False):
+        self.cache = cache
+        self.store = None
+        self.unsaved_activities = []
+        self.removed_activities = []
+        self.manifest = File_Manifest()
         self.last_update = datetime.datetime.now()
         self.max_hr = max_hr
         if zones:
             self.zones = zones
         else:
-            self.zones = [int(self.max_hr*0.59),
-                          int(self.max_hr*0.78),
-                          int(self.max_hr*0.87),
-                          int(self.max_hr*0.97)]
+            self.zones = default_zones(self.max_hr)
+        self.points_per_min = zone_points(self.zones, points_per_min)
         self.sleep_score = 100
-        self.sleep_history = []
-        self.activity_history = []
+        self.sleep_history = Sleep_History()
+        self.sleep_score_history = None
+        self.activity_history = Activity_History()
+        self.fitness_state = Fitness_State(len(self.points_per_min))
+        self.daily_loads = Daily_Loads()
+        self.fitness_index = None
         self.cardio_fitness = 0
         self.cardio_fatigue = 0
         self.cardio_form = 0
@@ -370,11 +495,22 @@ class Athlete(object):
         self.running_fitness_history = None
         self.running_fatigue_history = None
         self.running_form_history = None
-        self.time_in_zones_7day = [0, 0, 0, 0, 0]
-        self.time_in_zones_42day = [0, 0, 0, 0, 0]
+        self.time_in_zones_7day = [0]*len(self.points_per_min)
+        self.time_in_zones_42day = [0]*len(self.points_per_min)
         if print_fitness_vals:
             self.print_fitness_vals()
 
+    def __getattr__(self, name):
+        # Athletes loaded from an Athlete_Store fetch their activity history on first use
+        if name in ('activity_history', 'daily_loads', 'fitness_state') and self.__dict__.get('store') is not None:
+            self.store.load_history(self)
+            return self.__dict__[name]
+        # Rollups are built from the history on first use, then kept up to date as activities are added and removed
+        if name == 'rollups':
+            self.rollups = Rollups.from_history(self.activity_history, len(self.points_per_min))
+            return self.rollups
+        raise AttributeError(name)
+
     def print_fitness_vals(self):
         print 'Sleep Score: {}'.format(self.sleep_score)
         print 'Cardio Fitness: {}'.format(self.cardio_fitness)
@@ -385,229 +521,414 @@ class Athlete(object):
         print 'Running Fatigue: {}'.format(self.running_fatigue)
 
     def print_time_in_zones(self):
-        x = map(int, map(truediv, self.time_in_zones_42day, [6]*5))
+        x = map(int, map(truediv, self.time_in_zones_42day, [6]*len(self.time_in_zones_42day)))
         y = map(int, self.time_in_zones_7day)
-        print 'Average Weekly Minutes Zones Over Last 6 Weeks:\n\tZone 1: {}\n\tZone 2: {}\n\tZone 3: {}\n\tZone 4: {}\n\tZone 5: {}\n'.format(x[0], x[1], x[2], x[3], x[4])
-        print 'Minutes in Zones Over Last 1 Week:\n\tZone 1: {}\n\tZone 2: {}\n\tZone 3: {}\n\tZone 4: {}\n\tZone 5: {}'.format(y[0], y[1], y[2], y[3], y[4])
+        print 'Average Weekly Minutes Zones Over Last 6 Weeks:' + ''.join(['\n\tZone {}: {}'.format(i, x[i-1]) for i in range(1, len(x)+1)]) + '\n'
+        print 'Minutes in Zones Over Last 1 Week:' + ''.join(['\n\tZone {}: {}'.format(i, y[i-1]) for i in range(1, len(y)+1)])
 
-    def add_all_from_folder(self, filepath, print_fitness_vals = True):
-        self.add_activities_from_folder(filepath)
-        for csv_file in glob.glob(os.path.join(filepath, '*.csv')):
-            self.update_sleep_values(csv_file)
+    def add_all_from_folder(self, filepath, print_fitness_vals = True, processes=1):
+        self.add_activities_from_folder(filepath, processes=processes)
+        self.update_sleep_values(*glob.glob(os.path.join(filepath, '*.csv')))
         if print_fitness_vals:
             self.print_fitness_vals()
 
-    def add_activities_from_folder(self, filepath, print_fitness_vals=False):
-        for gpx_file in glob.glob(os.path.join(filepath, '*.gpx')):
-            self.add_activity(gpx_file)
-        for tcx_file in glob.glob(os.path.join(filepath, '*.tcx')):
-            self.add_activity(tcx_file)
+    def add_activities_from_folder(self, filepath, print_fitness_vals=False, processes=1):
+        filepaths = glob.glob(os.path.join(filepath, '*.gpx')) + glob.glob(os.path.join(filepath, '*.tcx'))
+        self.add_activities(filepaths, print_fitness_vals=print_fitness_vals, processes=processes)
+
+    def add_activities(self, filepaths, print_fitness_vals=False, processes=1):
+        """
+        Parses and adds every activity file in filepaths. With processes > 1 (or None, for one worker per CPU) the files are parsed across a pool of worker processes. Either way the parsed activities are merged into activity_history in one step, with a single fitness update at the end.
+        """
+        self.merge_activities(self.parse_headers(self.new_activities(self.read_headers(filepaths)), processes))
         if print_fitness_vals:
             self.print_fitness_vals()
 
+    def read_headers(self, filepaths, errors=None):
+        """
+        Reads only the header (name, type, date, creator) of each activity file, and returns list of (filepath, lazy Activity) pairs. Passing these through new_activities before parse_headers means undated files and duplicates are never fully parsed. If errors (a dict) is given, files which can't be read are left out and their errors recorded in it by filepath, rather than raised.
+        """
+        with stage('read_headers', points=len(filepaths)):
+            if errors is None:
+                return [(filepath, Activity(filepath, zones=self.zones, points_per_min=self.points_per_min, cache=self.cache, lazy=True)) for filepath in filepaths]
+            headers = []
+            for filepath in filepaths:
+                try:
+                    headers.append((filepath, Activity(filepath, zones=self.zones, points_per_min=self.points_per_min, cache=self.cache, lazy=True)))
+                except Exception as e:
+                    errors[filepath] = error_message(e)
+            return headers
+
+    def parse_headers(self, headers, processes=1, errors=None):
+        """
+        Fully parses the activities of a list of (filepath, lazy Activity) pairs, across a pool of worker processes with processes > 1 (or None, for one worker per CPU), and returns list of (filepath, Activity_Stats) pairs. If errors (a dict) is given, activities which can't be parsed are left out and their errors recorded in it by filepath, rather than raised.
+        """
+        filepaths = [filepath for filepath, activity in headers]
+        if errors is None:
+            if processes == 1 or len(headers) < 2:
+                activities = [Activity_Stats(activity) for filepath, activity in headers]
+            else:
+                activities = parse_activity_files(self.parsing_jobs(filepaths), processes)
+            return zip(filepaths, activities)
+        if processes == 1 or len(headers) < 2:
+            results = []
+            for filepath, activity in headers:
+                try:
+                    results.append((Activity_Stats(activity), None))
+                except Exception as e:
+                    results.append((None, error_message(e)))
+        else:
+            results = parse_activity_files(self.parsing_jobs(filepaths), processes, parse=activity_stats_or_error)
+        parsed = []
+        for filepath, (activity, error) in zip(filepaths, results):
+            if error is None:
+                parsed.append((filepath, activity))
+            else:
+                errors[filepath] = error
+        return parsed
+
+    def parsing_jobs(self, filepaths):
+        """
+        Returns list of jobs for activity_stats_from_file parsing each of filepaths with this athlete's zones.
+        """
+        return [(filepath, self.zones, self.points_per_min, self.cache) for filepath in filepaths]
+
     def add_activity(self, filepath, print_fitness_vals=False):
-        activity_full = Activity(filepath, zones=self.zones)
-        activity = Activity_Stats(activity_full)
-        if activity.date == None:
-            if print_fitness_vals:
-                self.print_fitness_vals()
-            return
-        # Check to see if activity already exists by comparing dates (which include precision down to min/sec)
-        new_activity = True
-        for old_activity in self.activity_history:
-            if old_activity.date == activity.date:
-                new_activity = False
-        if new_activity:
-            self.activity_history.append(activity)
-            # Sort oldest to newest
-            # Minimizes shuffling if most added activities are more recent
-            self.activity_history.sort(key = lambda x : x.date)
+        self.add_activities([filepath], print_fitness_vals=print_fitness_vals)
+
+    def new_activities(self, activities, replacing=()):
+        """
+        Returns the (filepath, activity) pairs of a list which are dated and not duplicates of activities in activity_history (other than those at the dates in replacing, which are about to be removed) or earlier in the list, printing a message for each duplicate.
+        """
+        new = []
+        dates = set()
+        for filepath, activity in activities:
+            if activity.date == None:
+                continue
+            if (activity.date in self.activity_history and activity.date not in replacing) or activity.date in dates:
+                print "Activity at {} is a duplicate of an existing activity".format(filepath)
+                continue
+            dates.add(activity.date)
+            new.append((filepath, activity))
+        return new
+
+    def merge_activities(self, activities, update=True):
+        """
+        Merges a list of (filepath, Activity_Stats) pairs into activity_history, skipping undated activities and duplicates of existing (or earlier listed) activities, then updates fitness values once. With update=False fitness_state and daily_loads take in the new activities but the fitness values are left for the caller to update (e.g. a Team updating all its athletes at once).
+        """
+        added = [activity for filepath, activity in self.new_activities(activities)]
+        if added:
+            with stage('Athlete.merge_activities', points=len(added)):
+                # Insert the whole batch into the history table with a single sort
+                self.activity_history.add_many(added)
+                for activity in added:
+                    self.fitness_state.add(activity)
+                self.unsaved_activities.extend(added)
+                self.daily_loads.add(added)
+                self.invalidate_fitness_index(added)
+                if 'rollups' in self.__dict__:
+                    self.rollups.add(added)
+            if update:
+                self.update_fitness_values()
+
+    def remove_activities(self, dates, update=True):
+        """
+        Removes the activities recorded at each of dates (ignoring dates not in activity_history) from activity_history, fitness_state and daily_loads, then updates fitness values once (unless update=False). Returns list of the removed activities.
+        """
+        removed = [self.activity_history.remove(date) for date in sorted(set(dates)) if date in self.activity_history]
+        if removed:
+            for activity in removed:
+                self.fitness_state.remove(activity)
+            self.daily_loads.remove(removed)
+            self.invalidate_fitness_index(removed)
+            if 'rollups' in self.__dict__:
+                self.rollups.remove(removed)
+            dates = set([activity.date for activity in removed])
+            self.unsaved_activities = [activity for activity in self.unsaved_activities if activity.date not in dates]
+            self.removed_activities.extend(removed)
+            if update:
+                self.update_fitness_values()
+        return removed
+
+    def sync_folder(self, filepath, processes=1, prune=False, settle=0., print_fitness_vals=False):
+        """
+        Brings the athlete up to date with the activity files (.gpx and .tcx) and sleep data (.csv) in a folder, parsing only files which are new or changed since the last sync (see File_Manifest); with prune=True, activities of deleted files are removed too. Files which can't be read are reported and skipped until they change, keeping any activity they held.
+
+        Returns dict of the numbers of files 'parsed', 'skipped' (copies), 'deleted' and 'failed', of activities 'added' and 'removed', and 'errors' (dict of each unreadable file's error by path).
+        """
+        with stage('Athlete.sync_folder'):
+            changes = self.manifest.scan(filepath, settle=settle)
+            for path, entry in changes.deleted:
+                self.manifest.forget(path)
+            activity_files = [pending for pending in changes.pending if not pending[0].lower().endswith('.csv')]
+            sleep_files = [pending for pending in changes.pending if pending[0].lower().endswith('.csv')]
+            # Activities of files which changed, which the new versions may replace
+            replacing = set([entry.date for path, size, mtime, digest, entry in activity_files if entry is not None and entry.date is not None])
+
+            errors = {}
+            headers = self.read_headers([pending[0] for pending in activity_files], errors)
+            parsed = self.parse_headers(self.new_activities(headers, replacing), processes, errors)
+
+            # Activities whose files changed and were read or (with prune) were deleted, and aren't held by any other synced file
+            stale = [entry.date for path, size, mtime, digest, entry in activity_files if path not in errors and entry is not None and entry.date is not None]
+            if prune:
+                stale.extend([entry.date for path, entry in changes.deleted if entry.date is not None])
+            stale = set(stale) - self.manifest.dates(exclude=set([pending[0] for pending in changes.pending if pending[0] not in errors]))
+            n_before = len(self.activity_history)
+            removed = self.remove_activities(stale, update=False)
+            self.merge_activities(parsed, update=False)
+
+            dates = dict((path, activity.date) for path, activity in headers)
+            for path, size, mtime, digest, entry in activity_files:
+                if path in errors:
+                    self.manifest.record(path, size, mtime, digest, entry.date if entry is not None else None, errors[path])
+                else:
+                    self.manifest.record(path, size, mtime, digest, dates[path])
+            for path, size, mtime, digest, entry in sleep_files:
+                try:
+                    self.update_sleep_values(path)
+                except Exception as e:
+                    errors[path] = error_message(e)
+                self.manifest.record(path, size, mtime, digest, error=errors.get(path))
+
+        for path in sorted(errors):
+            print "Couldn't read {}: {}".format(path, errors[path])
+        n_added = len(self.activity_history) - n_before + len(removed)
+        if removed or n_added:
             self.update_fitness_values()
-        else:
-            print "Activity at {} is a duplicate of an existing activity".format(filepath)
         if print_fitness_vals:
             self.print_fitness_vals()
+        return {'parsed': len(changes.pending) - len(errors), 'skipped': len(changes.copies), 'deleted': len(changes.deleted),
+                'failed': len(errors), 'added': n_added, 'removed': len(removed), 'errors': errors}
+
+    def watch_folder(self, filepath, interval=60, processes=1, prune=False, settle=5., callback=None, max_syncs=None):
+        """
+        Syncs the folder (see sync_folder) every interval seconds until interrupted (or max_syncs syncs), so new exports are picked up as they land. Files must have been left alone for settle seconds before they're read, so exports still being written are never parsed half-finished; files which can't be read at all are reported and left until they change, without stopping the watch. Whenever a sync changes anything (or finds a file it can't read), the athlete is saved to its Athlete_Store (if it was loaded from or saved to one) and callback, if given, is called with the athlete and sync_folder's counts, whose errors give the files which couldn't be read.
+        """
+        n_syncs = 0
+        try:
+            while max_syncs is None or n_syncs < max_syncs:
+                counts = self.sync_folder(filepath, processes=processes, prune=prune, settle=settle)
+                n_syncs += 1
+                if counts['parsed'] or counts['skipped'] or counts['deleted'] or counts['failed']:
+                    if self.__dict__.get('store') is not None:
+                        self.save(self.store.filepath)
+                    if callback is not None:
+                        callback(self, counts)
+                if max_syncs is None or n_syncs < max_syncs:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
 
     def update_fitness_values(self):
         """
-        This method is purely a helper for other updating methods. Updates fitness/fatigue/form values and time_in_zones_42day, time_in_zones_7day to match self.activity_history.
-        """
-        current_time = datetime.datetime.now()
-        cardio_fatigue_list = []
-        cycling_fitness_list = []
-        cycling_fatigue_list = []
-        running_fitness_list = []
-        running_fatigue_list = []
-        time_in_zones_7day = [0, 0, 0, 0, 0]
-        time_in_zones_42day = [0, 0, 0, 0, 0]
-        for activity in self.activity_history:
-            if activity.time_in_zones != [None, None, None, None, None]:
-                time_in_zones_42day = map(add, time_in_zones_42day, activity.time_in_zones)
-            if activity.type == 'cycling':
-                cycling_fitness_list.append(activity)
-            if activity.type == 'running':
-                running_fitness_list.append(activity)
-            if ((current_time - activity.date).total_seconds() < 604800):
-                cardio_fatigue_list.append(activity)
-                if activity.time_in_zones != [None, None, None, None, None]:
-                    time_in_zones_7day = map(add, time_in_zones_7day, activity.time_in_zones)
-                if activity.type == 'cycling':
-                    cycling_fatigue_list.append(activity)
-                elif activity.type == 'running':
-                    running_fatigue_list.append(activity)
-        # All activities contribute to cardio fitness
-        self.cardio_fitness = calc_fit_from_list(self.activity_history)
-        # All other stats are calculated from associated lists of activities
-        self.cardio_fatigue = calc_fat_from_list(cardio_fatigue_list)
-        self.cycling_fitness = calc_fit_from_list(cycling_fitness_list)
-        self.cycling_fatigue = calc_fat_from_list(cycling_fatigue_list)
-        self.running_fitness = calc_fit_from_list(running_fitness_list)
-        self.running_fatigue = calc_fat_from_list(running_fatigue_list)
-        self.time_in_zones_7day = time_in_zones_7day
-        self.time_in_zones_42day = time_in_zones_42day
-        # Iterate through and update all form values
-        self.update_form_values()
+        This method is purely a helper for other updating methods. Moves fitness_state forward to today and updates fitness/fatigue/form values and time_in_zones_42day, time_in_zones_7day from it.
+        """
+        with stage('Athlete.update_fitness_values', points=len(self.activity_history)):
+            today = datetime.date.today()
+            if today < self.fitness_state.day:
+                self.rebuild_fitness_state()
+            self.fitness_state.advance(today)
+            self.cardio_fitness = self.fitness_state.fitness('cardio')
+            self.cardio_fatigue = self.fitness_state.fatigue('cardio')
+            self.cycling_fitness = self.fitness_state.fitness('cycling')
+            self.cycling_fatigue = self.fitness_state.fatigue('cycling')
+            self.running_fitness = self.fitness_state.fitness('running')
+            self.running_fatigue = self.fitness_state.fatigue('running')
+            self.time_in_zones_7day = self.fitness_state.time_in_zones(7)
+            self.time_in_zones_42day = self.fitness_state.time_in_zones(42)
+            # Iterate through and update all form values
+            self.update_form_values()
+            with stage('Athlete.update_historical_values', points=len(self.activity_history)):
+                self.update_historical_values()
 
         # Update last_update
         self.last_update = datetime.datetime.now()
 
+    def rebuild_fitness_state(self):
+        """
+        Recalculates fitness_state from scratch from activity_history; only needed when the clock has moved backwards or the number of zones has changed.
+        """
+        self.fitness_state = Fitness_State.from_history(self.activity_history, len(self.points_per_min))
+
     def update_form_values(self):
-        self.cardio_form = self.cardio_fitness - self.cardio_form
-        self.cycling_form = self.cycling_fitness - self.cycling_form
-        self.running_form = self.running_fitness - self.running_form
-
-    def update_sleep_values(self, filepath):
-        """
-        Updates sleep values according to .csv of sleep data downloaded from Garmin Connect saved at specified filepath
-        """
-        sleep_df = pd.read_csv(filepath, skiprows=[0, 1])
-        self.sleep_history = list(sleep_df.iloc[:,1])
-        n = len(self.sleep_history)
-        # Calculate & normalize long-term exp. weighted sleep score
-        total_sleep = 0
-        for i in range(len(self.sleep_history)):
-            total_sleep += self.sleep_history[i]*np.exp((i-n)*1./n)
-        tot_norm_factor = calc_norm_factor(n)
-        total_sleep = total_sleep/tot_norm_factor
-        # Calculate & normalize short-term exp. weighted sleep score
-        recent_sleep = 0
-        for i in range(3):
-            recent_sleep += self.sleep_history[-i]*np.exp(-i*1./3)
-        rec_norm_factor = calc_norm_factor(3)
-        recent_sleep = recent_sleep/rec_norm_factor
-        # Update athlete attributes
-        self.sleep_score = round(100*(recent_sleep/total_sleep), 1)
+        self.cardio_form = self.cardio_fitness - self.cardio_fatigue
+        self.cycling_form = self.cycling_fitness - self.cycling_fatigue
+        self.running_form = self.running_fitness - self.running_fatigue
+
+    def update_sleep_values(self, *filepaths):
+        """
+        Merges the nights in each .csv of sleep data downloaded from Garmin Connect at filepaths into sleep_history (see Sleep_History; overlapping exports are deduplicated by date), then updates sleep_score and sleep_score_history (daily sleep scores from the first night recorded) if anything new was added.
+        """
+        added = 0
+        for filepath in filepaths:
+            added += self.sleep_history.add_csv(filepath)
+        if added:
+            self.update_sleep_score()
         self.last_update = datetime.datetime.now()
 
-    def save(self):
-        current_time = datetime.datetime.now()
-        with open(self.filepath, 'w') as f:
-            pickle.dump(self, f)
-        self.last_saved_date = current_time
+    def update_sleep_score(self):
+        self.sleep_score_history = self.sleep_history.scores()
+        if len(self.sleep_score_history) and not np.isnan(self.sleep_score_history[-1]):
+            self.sleep_score = float(self.sleep_score_history[-1])
 
-    def update_hr_info(self, Max_hr=None, Zones=None):
+    def update_hr_info(self, Max_hr=None, Zones=None, Points_per_min=None):
         """
-        Can specify either max_hr or zones, or both. If only one is provided, the other will be updated based on the specified value; e.g. if only max_hr is specified, zones will be updated as a percent of max_hr.
+        Can specify either max_hr or zones, or both. If only one is provided, the other will be updated based on the specified value; e.g. if only max_hr is specified, zones will be updated as a percent of max_hr (keeping the number of zones). Max_hr can only be derived from the default four zone thresholds, so must be given alongside any other number of them, as must Points_per_min (one rate per zone, i.e. len(Zones)+1) whenever the number of zones changes. Everything is checked before the athlete is changed.
         """
         if Zones:
-            self.zones = Zones
-            if Max_hr:
-                self.max_hr = Max_hr
-            else:
-                self.max_hr = int((Zones[0]*1./0.59 + Zones[1]*1./0.78 + Zones[2]*1./0.87 + Zones[3]*1./0.97)/4)
-
+            points_per_min = zone_points(Zones, Points_per_min)
+            max_hr = Max_hr or max_hr_from_zones(Zones)
+            zones = list(Zones)
         elif Max_hr:
-            self.max_hr = Max_hr
-            if Zones == self.zones:
-                self.zones = [int(Max_hr*0.59), int(Max_hr*0.78),
-                              int(Max_hr*0.87), int(Max_hr*0.97)]
+            points_per_min = self.points_per_min
+            if len(self.zones) == len(ZONE_FRACTIONS):
+                zones = default_zones(Max_hr)
+            else:
+                zones = [int(round(zone*1.*Max_hr/self.max_hr)) for zone in self.zones]
+            max_hr = Max_hr
+        else:
+            return
+        self.points_per_min = points_per_min
+        self.zones = zones
+        self.max_hr = max_hr
+        self.rebuild_fitness_state()
+        self.fitness_index = None
+        self.__dict__.pop('rollups', None)
 
     def save(self, filepath):
-        with open(filepath, 'wb') as f:
-            pickle.dump(self, f)
+        """
+        Saves athlete to the SQLite database at filepath (see Athlete_Store), which can be loaded with utils.load_saved_athlete. Saving again to the same file only writes what was added since.
+        """
+        Athlete_Store(filepath).save(self)
 
 
     def update_historical_values(self):
         """
-        Method updates attributes corresponding to historical daily fitness/fatigue/form for each activity type. It runs a bit slowly, so it's temporarily omitted from the update_fitness_values method
+        Method updates attributes corresponding to historical daily fitness/fatigue/form (oldest day first) for cardio, cycling, and running, computing all three in one pass over a matrix of daily training loads.
         """
-        self.cardio_fitness_history, self.cardio_fatigue_history, self.cardio_form_history = self.calculate_daily_fitness_fatigue_form()
-        self.cycling_fitness_history, self.cycling_fatigue_history, self.cycling_form_history = self.calculate_daily_fitness_fatigue_form(act_type='cycling')
-        self.running_fitness_history, self.running_fatigue_history, self.running_form_history = self.calculate_daily_fitness_fatigue_form(act_type='running')
+        if not len(self.activity_history):
+            return
+        (self.cardio_fitness_history, self.cycling_fitness_history, self.running_fitness_history), \
+            (self.cardio_fatigue_history, self.cycling_fatigue_history, self.running_fatigue_history), \
+            (self.cardio_form_history, self.cycling_form_history, self.running_form_history) = \
+            [values.T for values in self.calculate_daily_fitness_fatigue_form_matrix(['cardio', 'cycling', 'running'])]
 
 
     def calculate_daily_training_loads(self, act_type):
-        # Find age of oldest activity
-        current_date = datetime.datetime.now().date()
-        activities = self.activity_history
-        activities.sort(key = lambda x : x.date)
-        oldest_date = activities[0].date.date()
-        n_days = (current_date - oldest_date).days
-        training_loads = []
-        # Iterate through activities list, append daily training load (or 0) to each activities list
-        act_num = 0
-        for age in range(n_days, -1, -1):
-            # Initialize daily training loads are 0
-            tl = 0
-            try_next_act = True
-            # Check if the next activity to be examined is the same age as our 'age' tracker. If so, update daily training loads respectively, and if not then continue
-            while try_next_act:
-                if (current_date-activities[act_num].date.date()).days == age:
-                    if activities[act_num].training_load:
-                        if act_type == activities[act_num].type:
-                            tl += activities[act_num].training_load
-                            # If all activities have been iterated through, exit. Otherwise, try the next activity
-                            if act_num == len(activities)-1:
-                                try_next_act = False
-                            else:
-                                act_num += 1
-                        else:
-                            try_next_act = False
-                    else:
-                        try_next_act = False
-                else:
-                    try_next_act = False
-            training_loads.append(tl)
-        return training_loads
+        """
+        Returns array of daily training loads for activities of act_type ('cardio' for all activities), from the day of the oldest activity through today.
+        """
+        return self.daily_loads.matrix([act_type])[:, 0]
 
+    def rebuild_daily_loads(self):
+        self.daily_loads = Daily_Loads()
+        self.daily_loads.add_history(self.activity_history)
+        self.fitness_index = None
 
-    def calculate_daily_fitness_fatigue_form(self, act_type):
+
+    def calculate_daily_fitness_fatigue_form_matrix(self, act_types):
         """
-        Returns a tuple of (fitness, fatigue, form) for a specific activity type. Currently works for activity types cardio, cycling, and running.
+        Returns a tuple of (fitness, fatigue, form) arrays of shape (days, len(act_types)), one column per activity type.
         """
-        training_loads = self.calculate_daily_training_loads(act_type)
-        import pdb; pdb.set_trace()
-        n_days = len(training_loads)
+        return daily_fitness_fatigue_form(self.daily_loads.matrix(act_types))
 
-        # Create exponentially decayed daily fitness values
-        fitness_decay = [np.exp(-i*1./42) for i in range(n_days)]
-        fitness_norm = sum(fitness_decay[:42])
-        fitness_vals = [sum(np.multiply(training_loads[i::-1], fitness_decay[:i+1]))/fitness_norm for i in range(0, n_days)]
 
-        # Create exponentially decayed daily fatigue values
-        adjusted_loads = [0]*6 + training_loads
-        fatigue_weights = [np.exp(-x*1./7) for x in range(7)][::-1]
-        fatigue_norm = sum(fatigue_weights)
-        fatigue_vals = [sum(np.multiply(adjusted_loads[i:i+7], fatigue_weights))/fatigue_norm for i in range(n_days)]
+    def calculate_daily_fitness_fatigue_form(self, act_type='cardio'):
+        """
+        Returns a tuple of (fitness, fatigue, form) for a specific activity type. Works for cardio (all activities combined) and any activity type.
+        """
+        fitness, fatigue, form = self.calculate_daily_fitness_fatigue_form_matrix([act_type])
+        return fitness[:, 0], fatigue[:, 0], form[:, 0]
 
-        # Create daily form values
-        form_vals = list(np.add(fitness_vals, [-i for i in fatigue_vals]))
 
-        return fitness_vals, fatigue_vals, form_vals
+    def invalidate_fitness_index(self, activities):
+        if self.fitness_index is not None:
+            self.fitness_index.invalidate(min([activity.date.date() for activity in activities]))
 
+    def as_of(self, day, act_type='cardio'):
+        """
+        Returns dict of fitness, fatigue and form (of act_type, 'cardio' for all activities), time_in_zones_7day, time_in_zones_42day and sleep_score (the latest on or before day, or None) as of the end of day, e.g. to look up form on a past race day. Fitness, fatigue and form are the values of the daily histories (see update_historical_values) on that day; see as_of_range.
+        """
+        day = as_date(day)
+        values = self.as_of_range(day, day, act_type)
+        sleep_score = values['sleep_score'][0]
+        return {'date': day,
+                'fitness': float(values['fitness'][0]),
+                'fatigue': float(values['fatigue'][0]),
+                'form': float(values['form'][0]),
+                'time_in_zones_7day': [int(minutes) for minutes in np.round(values['time_in_zones_7day'][0])],
+                'time_in_zones_42day': [int(minutes) for minutes in np.round(values['time_in_zones_42day'][0])],
+                'sleep_score': None if np.isnan(sleep_score) else float(sleep_score)}
+
+    def as_of_range(self, start, end, act_type='cardio'):
+        """
+        Returns dict of daily arrays of fitness, fatigue, form, time_in_zones_7day and time_in_zones_42day (days x zones) and sleep_score (NaN before the first score) on each day from start to end inclusive, read from fitness_index (see Fitness_Index) rather than recalculated from the whole history. The index is built on first use and afterwards only brought up to date for activities added or removed since, and for days passed since, so each query costs time proportional to the days asked for.
+        """
+        start, end = as_date(start), as_date(end)
+        if end < start:
+            raise ValueError('end ({}) is before start ({})'.format(end, start))
+        if self.fitness_index is None:
+            self.fitness_index = Fitness_Index(len(self.points_per_min))
+        self.fitness_index.refresh(self.daily_loads, self.activity_history, end)
+        self.fitness_index.update_sleep(self.sleep_score_history, self.sleep_history.start)
+        values = self.fitness_index.values(start, end, act_type)
+        values['dates'] = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+        return values
+
+    def plot_time_in_zones(self, period='week', activity_type='cardio', percentages=False, periods=-1, filepath=None):
+        """
+        Plots minutes (or, with percentages=True, the share of minutes) in each heart rate zone per week or month (period), as stacked bars over the trailing number of periods (default all), from rollups.
+        """
+        plt = pyplot()
+        if percentages:
+            starts, minutes = self.rollups.zone_percentages(period, activity_type)
+            minutes = np.nan_to_num(minutes)
+        else:
+            series = self.rollups.series(period, activity_type)
+            starts, minutes = series['start'], series['time_in_zones']
+        if periods > 0:
+            starts, minutes = starts[-periods:], minutes[-periods:]
+        bottom = np.zeros(len(minutes))
+        for zone in range(minutes.shape[1]):
+            plt.bar(range(len(minutes)), minutes[:, zone], bottom=bottom, label='Zone {}'.format(zone + 1))
+            bottom += minutes[:, zone]
+        step = max(len(starts)//12, 1)
+        plt.xticks(range(0, len(starts), step), [day.isoformat() for day in starts[::step]], rotation=45)
+        plt.ylabel('% of Time in Zones' if percentages else 'Minutes')
+        plt.title('{} Time in Zones by {}'.format(activity_type.capitalize(), period.capitalize()))
+        plt.legend()
+        plt.tight_layout()
+        show(plt, filepath)
+
+    def scenarios(self, act_types=('cardio', 'cycling', 'running'), end=None):
+        """
+        Returns a Scenario_Engine for evaluating what-if Scenarios (workouts added, removed, or scaled) against this athlete's training through end (default today), with its baseline fitness, fatigue and form computed once. Keep it to evaluate batch after batch of plans interactively.
+        """
+        return Scenario_Engine(self, act_types=act_types, end=end)
 
-    def plot_fitness(self, incl_fitness=True, incl_fatigue=True, incl_form=True, activity_type='cardio', weeks=-1):
-        if (activity_type == 'cardio') and self.cardio_fitness_history:
+    def what_if(self, scenarios, act_types=('cardio', 'cycling', 'running'), start=None, end=None):
+        """
+        Returns Scenario_Results of the projected daily fitness, fatigue and form of every Scenario in scenarios, evaluated together in one vectorized pass, from start (default the first day any scenario changes) through end (default today, or the last day any scenario plans for, whichever is later).
+        """
+        scenarios = list(scenarios)
+        if end is None:
+            end = max([datetime.date.today()] + [day for day in [scenario.last_day() for scenario in scenarios] if day is not None])
+        return self.scenarios(act_types, end).evaluate(scenarios, start)
+
+    def plot_fitness(self, incl_fitness=True, incl_fatigue=True, incl_form=True, activity_type='cardio', weeks=-1, filepath=None):
+        plt = pyplot()
+        if (activity_type == 'cardio') and self.cardio_fitness_history is not None:
                 fitness = self.cardio_fitness_history
-                fatigue = self.cardio_fatigue_history,
+                fatigue = self.cardio_fatigue_history
                 form = self.cardio_form_history
-        elif (activity_type == 'cycling') and self.cycling_fitness_history:
+        elif (activity_type == 'cycling') and self.cycling_fitness_history is not None:
                 fitness = self.cycling_fitness_history
-                fatigue = self.cycling_fatigue_history,
+                fatigue = self.cycling_fatigue_history
                 form = self.cycling_form_history
-        elif (activity_type == 'running') and self.running_fitness_history:
+        elif (activity_type == 'running') and self.running_fitness_history is not None:
                 fitness = self.running_fitness_history
-                fatigue = self.running_fatigue_history,
+                fatigue = self.running_fatigue_history
                 form = self.running_form_history
         else:
             fitness, fatigue, form = self.calculate_daily_fitness_fatigue_form(activity_type)
@@ -634,4 +955,4 @@ class Athlete(object):
             else:
                 plt.title('Fitness over Trailing {} Weeks'.format(str(weeks)))
         plt.legend()
-        plt.show()
+        show(plt, filepath)
@@ -0,0 +1,256 @@
+import os
+import sys
+import csv
+import json
+import datetime
+import argparse
+from collections import OrderedDict
+
+# Only the standard library is imported up front; the model (and, for plot commands, the plotting stack) is imported by the commands which need it, so the command line starts quickly
+
+ACTIVITY_FIELDS = ['date', 'type', 'name', 'creator', 'training_load', 'total_distance_2d', 'total_distance_3d',
+                   'avg_speed_2d', 'avg_speed_3d', 'elevation_gain', 'elevation_loss', 'time_in_zones']
+
+DAILY_TYPES = ['cardio', 'cycling', 'running']
+
+
+def parse_day(text):
+    return datetime.datetime.strptime(text, '%Y-%m-%d')
+
+
+def load_athlete(filepath, args=None):
+    """
+    Loads the athlete saved at filepath, or (if there is none yet) creates one from the heart rate settings in args.
+    """
+    from utils import load_saved_athlete
+    from class_defs import Athlete
+    if os.path.exists(filepath):
+        return load_saved_athlete(filepath)
+    if args is None or not hasattr(args, 'max_hr'):
+        raise SystemExit('No athlete saved at {}'.format(filepath))
+    cache = None
+    if args.cache:
+        from activity_cache import Activity_Cache
+        cache = Activity_Cache(args.cache)
+    return Athlete(max_hr=args.max_hr, zones=args.zones, points_per_min=args.points_per_min, cache=cache)
+
+
+def activity_records(athlete, start=None, end=None, act_type=None):
+    """
+    Returns list of dicts of the summaries of athlete's activities dated from start to end, optionally only those of act_type, oldest first.
+    """
+    records = []
+    for activity in athlete.activity_history.between(start, end, act_type):
+        record = OrderedDict((field, getattr(activity, field)) for field in ACTIVITY_FIELDS)
+        record['date'] = record['date'].isoformat()
+        records.append(record)
+    return records
+
+
+def daily_records(athlete, start=None, end=None):
+    """
+    Returns list of dicts of athlete's fitness, fatigue and form on each day (for all activities and for cycling and running), oldest first.
+    """
+    athlete.update_fitness_values()
+    if athlete.cardio_fitness_history is None:
+        return []
+    first = athlete.daily_loads.start
+    records = []
+    for i in range(len(athlete.cardio_fitness_history)):
+        day = first + datetime.timedelta(days=i)
+        if (start is not None and day < start.date()) or (end is not None and day > end.date()):
+            continue
+        record = OrderedDict([('date', day.isoformat())])
+        for act_type in DAILY_TYPES:
+            for value in ['fitness', 'fatigue', 'form']:
+                record['{}_{}'.format(act_type, value)] = round(float(getattr(athlete, '{}_{}_history'.format(act_type, value))[i]), 2)
+        records.append(record)
+    return records
+
+
+def write_records(records, fields, output_format, output):
+    if output_format == 'json':
+        json.dump(records, output, indent=2)
+        output.write('\n')
+    else:
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+
+
+# ____________ Commands ____________
+
+def ingest(args):
+    athlete = load_athlete(args.athlete, args)
+    activity_files = []
+    for path in args.paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            athlete.add_all_from_folder(path, print_fitness_vals=False, processes=args.processes)
+        elif path.lower().endswith('.csv'):
+            athlete.update_sleep_values(path)
+        else:
+            activity_files.append(path)
+    if activity_files:
+        athlete.add_activities(activity_files, processes=args.processes)
+    athlete.save(args.athlete)
+    athlete.print_fitness_vals()
+    return 0
+
+
+def sync(args):
+    athlete = load_athlete(args.athlete, args)
+    # Saving first gives the athlete a store for watch mode to save to
+    athlete.save(args.athlete)
+
+    def report(athlete, counts):
+        print '{parsed} files parsed, {skipped} copies skipped, {deleted} deleted; {added} activities added, {removed} removed'.format(**counts)
+
+    if args.watch:
+        print 'Watching {} (Ctrl-C to stop)'.format(args.folder)
+        athlete.watch_folder(args.folder, interval=args.interval, processes=args.processes, prune=args.prune, callback=report)
+        return 0
+    report(athlete, athlete.sync_folder(args.folder, processes=args.processes, prune=args.prune))
+    athlete.save(args.athlete)
+    athlete.print_fitness_vals()
+    return 0
+
+
+def print_as_of(athlete, day, zones=False):
+    values = dict((act_type, athlete.as_of(day, act_type)) for act_type in DAILY_TYPES)
+    print 'As of {:%Y-%m-%d}:'.format(day)
+    print 'Sleep Score: {}'.format(values['cardio']['sleep_score'])
+    for act_type in DAILY_TYPES:
+        for value in ['fitness', 'fatigue', 'form']:
+            print '{} {}: {}'.format(act_type.capitalize(), value.capitalize(), int(round(values[act_type][value])))
+    if zones:
+        print '\nMinutes in zones, last 7 days: {}'.format(values['cardio']['time_in_zones_7day'])
+        print 'Minutes in zones, last 42 days: {}'.format(values['cardio']['time_in_zones_42day'])
+
+
+def status(args):
+    athlete = load_athlete(args.athlete)
+    if args.as_of:
+        print_as_of(athlete, args.as_of.date(), args.zones)
+        return 0
+    if not args.stored:
+        athlete.update_fitness_values()
+    athlete.print_fitness_vals()
+    if args.zones:
+        print
+        athlete.print_time_in_zones()
+    print '\nLast updated: {:%Y-%m-%d %H:%M}'.format(athlete.last_update)
+    return 0
+
+
+def history(args):
+    athlete = load_athlete(args.athlete)
+    if args.daily:
+        records = daily_records(athlete, args.start, args.end)
+        fields = ['date'] + ['{}_{}'.format(act_type, value) for act_type in DAILY_TYPES for value in ['fitness', 'fatigue', 'form']]
+    else:
+        records = activity_records(athlete, args.start, args.end, args.type)
+        fields = ACTIVITY_FIELDS
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_records(records, fields, args.format, f)
+    else:
+        write_records(records, fields, args.format, sys.stdout)
+    return 0
+
+
+def plot(args):
+    from class_defs import pyplot
+    # Without a display, figures can only be saved
+    pyplot('Agg' if args.output else None)
+    athlete = load_athlete(args.athlete)
+    athlete.update_fitness_values()
+    athlete.plot_fitness(activity_type=args.type, weeks=args.weeks, filepath=args.output)
+    return 0
+
+
+def plot_activity(args):
+    from class_defs import Activity, pyplot
+    pyplot('Agg' if args.output else None)
+    zones = load_athlete(args.athlete).zones if args.athlete else None
+    activity = Activity(args.activity, **({'zones': zones} if zones else {}))
+    activity.plot(hr_hist=args.hist, zones_hist=args.hist, filepath=args.output)
+    return 0
+
+
+def parser():
+    parser = argparse.ArgumentParser(description='Model fitness, fatigue, and form from wearables data. Athletes are saved in (and loaded from) SQLite files.')
+    commands = parser.add_subparsers(dest='command')
+
+    def athlete_settings(command):
+        command.add_argument('--max-hr', type=int, default=195, help='max heart rate of a new athlete (default 195)')
+        command.add_argument('--zones', type=int, nargs='+', help='heart rate zone thresholds of a new athlete (default from --max-hr)')
+        command.add_argument('--points-per-min', type=float, nargs='+', metavar='POINTS', help='training load points per minute in each zone of a new athlete (one more than --zones; needed unless there are 4 thresholds)')
+        command.add_argument('--cache', metavar='DIR', help='cache parsed activities of a new athlete in DIR')
+        command.add_argument('--processes', type=int, default=1, help='worker processes parsing activity files (default 1)')
+
+    command = commands.add_parser('ingest', help='add activity files, sleep .csv files, or folders of them')
+    command.add_argument('athlete', help='athlete file, created if it does not exist')
+    command.add_argument('paths', nargs='+', help='.gpx, .tcx, or sleep .csv files, or folders of them')
+    athlete_settings(command)
+    command.set_defaults(run=ingest)
+
+    command = commands.add_parser('sync', help='add new or changed files from a folder, parsing only those')
+    command.add_argument('athlete', help='athlete file, created if it does not exist')
+    command.add_argument('folder')
+    command.add_argument('--prune', action='store_true', help='remove activities whose files were deleted')
+    command.add_argument('--watch', action='store_true', help='keep syncing as new files land')
+    command.add_argument('--interval', type=float, default=60, help='seconds between syncs with --watch (default 60)')
+    athlete_settings(command)
+    command.set_defaults(run=sync)
+
+    command = commands.add_parser('status', help='print current fitness, fatigue, and sleep score')
+    command.add_argument('athlete')
+    command.add_argument('--zones', action='store_true', help='also print time in heart rate zones')
+    command.add_argument('--stored', action='store_true', help='print values as last saved, without bringing them up to today')
+    command.add_argument('--as-of', type=parse_day, metavar='DAY', help='print values as they were at the end of DAY (YYYY-MM-DD) instead')
+    command.set_defaults(run=status)
+
+    command = commands.add_parser('history', help='export activity summaries (or daily fitness values) as JSON or CSV')
+    command.add_argument('athlete')
+    command.add_argument('--daily', action='store_true', help='export daily fitness, fatigue, and form instead of activities')
+    command.add_argument('--start', type=parse_day, help='first day to export (YYYY-MM-DD)')
+    command.add_argument('--end', type=parse_day, help='last day to export (YYYY-MM-DD)')
+    command.add_argument('--type', help='export only activities of this type')
+    command.add_argument('--format', choices=['json', 'csv'], default='json')
+    command.add_argument('--output', metavar='FILE', help='write to FILE instead of standard output')
+    command.set_defaults(run=history)
+
+    command = commands.add_parser('plot', help='plot fitness, fatigue, and form')
+    command.add_argument('athlete')
+    command.add_argument('--type', default='cardio', help='activity type (default cardio, i.e. all activities)')
+    command.add_argument('--weeks', type=int, default=-1, help='trailing weeks to plot (default all)')
+    command.add_argument('--output', metavar='FILE', help='save the plot to FILE instead of showing it')
+    command.set_defaults(run=plot)
+
+    command = commands.add_parser('plot-activity', help='plot heart rate, elevation, and grade of an activity file')
+    command.add_argument('activity', help='.gpx or .tcx file')
+    command.add_argument('--athlete', help='athlete file whose heart rate zones to use')
+    command.add_argument('--hist', action='store_true', help='also plot time at each heart rate and in each zone')
+    command.add_argument('--output', metavar='FILE', help='save the plot to FILE instead of showing it')
+    command.set_defaults(run=plot_activity)
+    return parser
+
+
+def main(argv=None):
+    command_line = parser()
+    args = command_line.parse_args(argv)
+    if hasattr(args, 'points_per_min'):
+        # The default rates are those of the default five zones
+        n_zones = len(args.zones) + 1 if args.zones else 5
+        n_rates = len(args.points_per_min) if args.points_per_min else 5
+        if n_rates != n_zones:
+            command_line.error('{} heart rate zones need {} --points-per-min rates'.format(n_zones, n_zones))
+    if hasattr(args, 'athlete') and args.athlete:
+        args.athlete = os.path.expanduser(args.athlete)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
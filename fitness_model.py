@@ -0,0 +1,415 @@
+import bisect
+import datetime
+import numpy as np
+
+# Fitness and fatigue are exponentially decayed sums of training load with these time constants (in days)
+FITNESS_DAYS = 42
+FATIGUE_DAYS = 7
+# Normalize by the sum of the weights applied to the last 42 (or 7) days' loads, sum_{i=0}^{41}e^(-i/42) and sum_{i=0}^{6}e^(-i/7); current values (Fitness_State), daily histories (daily_fitness_fatigue_form) and as-of values (Fitness_Index) all use these
+FITNESS_NORM = np.exp(-np.arange(FITNESS_DAYS)*1./FITNESS_DAYS).sum()
+FATIGUE_NORM = np.exp(-np.arange(FATIGUE_DAYS)*1./FATIGUE_DAYS).sum()
+
+
+def discard(window, entry):
+    """
+    Removes the entry for the same activity (identified by its date) from a sorted window list, returning whether it was found.
+    """
+    i = bisect.bisect_left(window, entry[:2])
+    if i < len(window) and window[i][1] == entry[1]:
+        del window[i]
+        return True
+    return False
+
+
+class Fitness_State(object):
+    """
+    Current fitness and fatigue, for all activities combined ('cardio') and for each activity type, along with minutes spent in each heart rate zone over the trailing 7 and 42 days.
+
+    Fitness is the sum of every activity's training load decayed by exp(-age/42), and fatigue the sum of training loads from the last 7 days decayed by exp(-age/7), with ages measured in whole calendar days. Because the exponential weights compose, the state is carried forward in time rather than recalculated: moving the clock forward k days scales each running sum by exp(-k/tau), and adding (or removing) an activity adds (or subtracts) its decayed load. Both cost O(1) regardless of history length, plus retiring the handful of activities which leave the 7 and 42 day windows.
+
+    Activities dated before the state's current day can be added or removed at the same cost; only moving the clock backwards requires rebuilding the state from the activity history.
+    """
+    def __init__(self, n_zones, day=None):
+        self.n_zones = n_zones
+        self.day = day if day is not None else datetime.date.today()
+        self.fitness_sums = {}
+        self.fatigue_sums = {}
+        # Sorted lists of (day, date, training load, keys, zone times) entries for activities inside each window
+        self.fatigue_window = []
+        self.zone_windows = {FATIGUE_DAYS: [], FITNESS_DAYS: []}
+        self.zone_totals = {FATIGUE_DAYS: np.zeros(n_zones), FITNESS_DAYS: np.zeros(n_zones)}
+
+    @classmethod
+    def from_activities(cls, activities, n_zones, day=None):
+        state = cls(n_zones, day=day)
+        for activity in activities:
+            state.add(activity)
+        return state
+
+    @classmethod
+    def from_history(cls, history, n_zones, day=None):
+        """
+        Builds the state from an Activity_History with array reductions over its columns: decayed training loads are summed per activity type with a single np.bincount, and only the activities still inside the 42 day window are entered individually.
+        """
+        state = cls(n_zones, day=day)
+        if not len(history):
+            return state
+        ages = state.day.toordinal() - history.day_ordinals()
+        loads = np.nan_to_num(history.stats['training_load'])
+        sums = np.bincount(history.type_codes, weights=loads*np.exp(-ages*1./FITNESS_DAYS), minlength=len(history.types))
+        for code, act_type in enumerate(history.types):
+            state.fitness_sums[act_type] = sums[code]
+        state.fitness_sums['cardio'] = sums.sum()
+        for i in np.flatnonzero(ages < FITNESS_DAYS):
+            state.update_windows(state.entry(history[i]), 1)
+        return state
+
+    def advance(self, day):
+        """
+        Moves the state forward to day, decaying all running sums and retiring activities which have aged out of the 7 and 42 day windows.
+        """
+        n_days = (day - self.day).days
+        if n_days < 0:
+            raise ValueError('Fitness_State is at {} and cannot move back to {}; rebuild it from the activity history instead'.format(self.day, day))
+        if n_days == 0:
+            return
+        fitness_decay = np.exp(-n_days*1./FITNESS_DAYS)
+        fatigue_decay = np.exp(-n_days*1./FATIGUE_DAYS)
+        for key in self.fitness_sums:
+            self.fitness_sums[key] *= fitness_decay
+        for key in self.fatigue_sums:
+            self.fatigue_sums[key] *= fatigue_decay
+        self.day = day
+        self.expire()
+
+    def expire(self):
+        while self.fatigue_window and self.age(self.fatigue_window[0]) >= FATIGUE_DAYS:
+            self.remove_fatigue(self.fatigue_window.pop(0))
+        if not self.fatigue_window:
+            # Clear accumulated rounding error once nothing is left in the window
+            for key in self.fatigue_sums:
+                self.fatigue_sums[key] = 0.
+        for n_days, window in self.zone_windows.items():
+            while window and self.age(window[0]) >= n_days:
+                self.zone_totals[n_days] -= window.pop(0)[4]
+            if not window:
+                self.zone_totals[n_days][:] = 0
+
+    def age(self, entry):
+        return (self.day - entry[0]).days
+
+    def entry(self, activity):
+        # Activities without heart rate data (or recorded with a different number of zones) don't count towards time in zones
+        zone_times = None
+        if activity.time_in_zones and len(activity.time_in_zones) == self.n_zones:
+            zone_times = np.array(activity.time_in_zones, dtype=np.float64)
+        return (activity.date.date(), activity.date, activity.training_load or 0, ('cardio', activity.type), zone_times)
+
+    def add(self, activity):
+        self.update(self.entry(activity), 1)
+
+    def remove(self, activity):
+        self.update(self.entry(activity), -1)
+
+    def update(self, entry, sign):
+        load, keys = entry[2], entry[3]
+        if load:
+            contribution = sign*load*np.exp(-self.age(entry)*1./FITNESS_DAYS)
+            for key in keys:
+                self.fitness_sums[key] = self.fitness_sums.get(key, 0.) + contribution
+        self.update_windows(entry, sign)
+
+    def update_windows(self, entry, sign):
+        day, date, load, keys, zone_times = entry
+        age = self.age(entry)
+        if load:
+            if age < FATIGUE_DAYS:
+                if sign > 0:
+                    bisect.insort(self.fatigue_window, entry)
+                    self.add_fatigue(entry)
+                elif discard(self.fatigue_window, entry):
+                    self.remove_fatigue(entry)
+        if zone_times is not None:
+            for n_days, window in self.zone_windows.items():
+                if age < n_days:
+                    if sign > 0:
+                        bisect.insort(window, entry)
+                        self.zone_totals[n_days] += zone_times
+                    elif discard(window, entry):
+                        self.zone_totals[n_days] -= zone_times
+
+    def add_fatigue(self, entry):
+        contribution = entry[2]*np.exp(-self.age(entry)*1./FATIGUE_DAYS)
+        for key in entry[3]:
+            self.fatigue_sums[key] = self.fatigue_sums.get(key, 0.) + contribution
+
+    def remove_fatigue(self, entry):
+        contribution = entry[2]*np.exp(-self.age(entry)*1./FATIGUE_DAYS)
+        for key in entry[3]:
+            self.fatigue_sums[key] -= contribution
+
+    def fitness(self, key='cardio'):
+        return int(round(self.fitness_sums.get(key, 0.)/FITNESS_NORM, 0))
+
+    def fatigue(self, key='cardio'):
+        return int(round(self.fatigue_sums.get(key, 0.)/FATIGUE_NORM, 0))
+
+    def time_in_zones(self, n_days):
+        return [int(minutes) for minutes in np.round(self.zone_totals[n_days])]
+
+
+
+class Daily_Loads(object):
+    """
+    Dense array of daily training loads, one row per day (from the day of the oldest activity added) and one column per activity type.
+
+    Activities are mapped to (day, type) cells and aggregated with a single np.bincount per batch, and the array is kept between updates: new activities are added into it (growing it to cover new days or types as needed) rather than rebuilding it from the whole activity history.
+    """
+    def __init__(self):
+        self.start = None
+        self.types = []
+        self.loads = np.zeros((0, 0))
+
+    def add(self, activities, sign=1):
+        activities = [activity for activity in activities if activity.training_load]
+        if not activities:
+            return
+        days = np.array([activity.date.date().toordinal() for activity in activities])
+        for activity in activities:
+            if activity.type not in self.types:
+                self.types.append(activity.type)
+        codes = np.array([self.types.index(activity.type) for activity in activities])
+        loads = np.array([activity.training_load for activity in activities], dtype=np.float64)
+        self.add_cells(days, codes, loads, sign)
+
+    def add_history(self, history):
+        """
+        Adds every activity of an Activity_History, reading its columns directly rather than going through per-activity rows.
+        """
+        rows = np.flatnonzero(np.nan_to_num(history.stats['training_load']))
+        if not len(rows):
+            return
+        for act_type in history.types:
+            if act_type not in self.types:
+                self.types.append(act_type)
+        codes = np.array([self.types.index(act_type) for act_type in history.types])[history.type_codes[rows]]
+        self.add_cells(history.day_ordinals()[rows], codes, history.stats['training_load'][rows])
+
+    def add_cells(self, days, codes, loads, sign=1):
+        """
+        Adds loads into the cells given by arrays of day ordinals and activity type codes.
+        """
+        self.extend(datetime.date.fromordinal(int(days.min())), datetime.date.fromordinal(int(days.max())))
+        n_days, n_types = self.loads.shape
+        cells = (days - self.start.toordinal())*n_types + codes
+        self.loads += sign*np.bincount(cells, weights=loads, minlength=n_days*n_types).reshape(n_days, n_types)
+
+    def remove(self, activities):
+        self.add(activities, sign=-1)
+
+    def extend(self, first_day, last_day):
+        """
+        Grows the array (with zero loads) so it covers every day from first_day to last_day and every known activity type.
+        """
+        if self.start is None:
+            self.start = first_day
+        n_before = max((self.start - first_day).days, 0)
+        n_after = max((last_day - self.start).days + 1 - len(self.loads), 0)
+        n_new_types = len(self.types) - self.loads.shape[1]
+        if n_before or n_after or n_new_types:
+            self.loads = np.pad(self.loads, ((n_before, n_after), (0, n_new_types)), 'constant')
+            self.start -= datetime.timedelta(days=n_before)
+
+    def matrix(self, act_types, end=None):
+        """
+        Returns array of daily training loads with one column per entry of act_types ('cardio' for all activities combined), covering each day from the oldest activity through end (default today).
+        """
+        if self.start is None:
+            return np.zeros((0, len(act_types)))
+        if end is None:
+            end = datetime.date.today()
+        self.extend(self.start, end)
+        n_days = (end - self.start).days + 1
+        columns = []
+        for act_type in act_types:
+            if act_type == 'cardio':
+                columns.append(self.loads[:n_days].sum(axis=1))
+            elif act_type in self.types:
+                columns.append(self.loads[:n_days, self.types.index(act_type)])
+            else:
+                columns.append(np.zeros(n_days))
+        return np.column_stack(columns)
+
+
+def exponential_weights(n_days, length=None):
+    """
+    Returns array of the weights exp(-i/n_days) applied to training loads i days old, for i in range(length) (default n_days).
+    """
+    if length is None:
+        length = n_days
+    return np.exp(-np.arange(length)*1./n_days)
+
+
+def exponential_filter(loads, n_days, initial=None):
+    """
+    Returns array of exponentially decayed sums of daily loads along the first axis, i.e. out[i] = sum_{j<=i} loads[i-j]*exp(-j/n_days), computed as the first-order recursion out[i] = loads[i] + exp(-1/n_days)*out[i-1]. The initial value of out[-1] may be supplied to continue a previously filtered series.
+
+    The recursion is unrolled into cumulative sums over blocks of days (short enough that the rescaling factors can't overflow), so the cost is O(n_days) array operations rather than one Python step per day.
+    """
+    loads = np.asarray(loads, dtype=np.float64)
+    out = np.empty_like(loads)
+    decay = np.exp(-1./n_days)
+    carry = np.zeros(loads.shape[1:]) if initial is None else np.asarray(initial, dtype=np.float64)
+    block = 20*n_days
+    growth = np.exp(np.arange(block)*1./n_days).reshape((block,) + (1,)*(loads.ndim-1))
+    for start in range(0, len(loads), block):
+        chunk = loads[start:start+block]
+        k = len(chunk)
+        # out[start+i] = decay^i * (decay*carry + sum_{m<=i} decay^-m * loads[start+m])
+        out[start:start+k] = (decay*carry + np.cumsum(chunk*growth[:k], axis=0))/growth[:k]
+        carry = out[start+k-1]
+    return out
+
+
+def windowed_exponential_sum(loads, n_days):
+    """
+    Returns array of exponentially decayed sums of daily loads along the first axis over a window of n_days days, i.e. out[i] = sum_{j<n_days} loads[i-j]*exp(-j/n_days).
+    """
+    loads = np.asarray(loads, dtype=np.float64)
+    out = np.zeros_like(loads)
+    for lag, weight in enumerate(exponential_weights(n_days)[:len(loads)]):
+        out[lag:] += weight*loads[:len(loads)-lag]
+    return out
+
+
+def daily_fitness_fatigue_form(loads):
+    """
+    Returns tuple of daily (fitness, fatigue, form) arrays from array of daily training loads (oldest day first), in O(n_days) time. loads may be 2-dimensional (days x activity types), in which case every column is filtered in the same pass.
+
+    Fitness is the 42-day exponentially decayed sum of all past loads, and fatigue the 7-day exponentially decayed sum of the last 7 days' loads, each normalized by the sum of its first 42 (or 7) weights.
+    """
+    fitness = exponential_filter(loads, FITNESS_DAYS)/FITNESS_NORM
+    fatigue = windowed_exponential_sum(loads, FATIGUE_DAYS)/FATIGUE_NORM
+    return fitness, fatigue, fitness - fatigue
+
+
+class Fitness_Index(object):
+    """
+    Point-in-time index of an athlete's training, holding decayed sums of daily loads and cumulative minutes in zones for each day, so fitness, fatigue, form and time in zones as of any day are a couple of array reads. Activities added or removed only invalidate the rows from their day, which refresh recomputes.
+    """
+    def __init__(self, n_zones):
+        self.n_zones = n_zones
+        self.start = None
+        self.types = []
+        self.fitness_sums = np.zeros((0, 1))
+        self.fatigue_sums = np.zeros((0, 1))
+        self.zone_sums = np.zeros((1, n_zones))
+        # Number of leading rows which are up to date
+        self.valid = 0
+        self.sleep_source = None
+        self.sleep_start = None
+        self.sleep_scores = np.zeros(0)
+
+    def __len__(self):
+        return len(self.fitness_sums)
+
+    def invalidate(self, day):
+        """
+        Marks the rows from day onwards as stale, after activities on day were added or removed.
+        """
+        if self.start is not None:
+            self.valid = min(self.valid, max((day - self.start).days, 0))
+
+    def refresh(self, daily_loads, history, end):
+        """
+        Brings the rows through end up to date with daily_loads and the zone times of the activities in history (an Activity_History), recomputing the stale rows and appending any new days.
+        """
+        if daily_loads.start is None:
+            return
+        if daily_loads.start != self.start or daily_loads.types != self.types:
+            # Activities before the first indexed day, or of a new type: every row changes
+            self.start = daily_loads.start
+            self.types = list(daily_loads.types)
+            self.fitness_sums = np.zeros((0, len(self.types) + 1))
+            self.fatigue_sums = np.zeros((0, len(self.types) + 1))
+            self.valid = 0
+        first = self.valid
+        last = max((end - self.start).days + 1, len(self))
+        if first >= last:
+            return
+        loads = np.zeros((last - first, len(self.types) + 1))
+        known = daily_loads.loads[first:last]
+        loads[:len(known), 1:] = known
+        loads[:, 0] = loads[:, 1:].sum(axis=1)
+        self.fitness_sums = np.concatenate([self.fitness_sums[:first], exponential_filter(loads, FITNESS_DAYS, self.fitness_sums[first-1] if first else None)])
+        self.fatigue_sums = np.concatenate([self.fatigue_sums[:first], exponential_filter(loads, FATIGUE_DAYS, self.fatigue_sums[first-1] if first else None)])
+        self.zone_sums = np.concatenate([self.zone_sums[:first+1], self.zone_sums[first] + np.cumsum(self.daily_zone_times(history, first, last), axis=0)])
+        self.valid = last
+
+    def daily_zone_times(self, history, first, last):
+        """
+        Returns array of minutes in each zone on each day from row first to row last (exclusive), counting only activities with a time for every zone.
+        """
+        minutes = np.zeros((last - first, self.n_zones))
+        if history.zone_times.shape[1] < self.n_zones:
+            return minutes
+        first_day = self.start + datetime.timedelta(days=first)
+        rows = history.indices(datetime.datetime.combine(first_day, datetime.time()))
+        days = history.day_ordinals()[rows] - first_day.toordinal()
+        times = history.zone_times[rows, :self.n_zones].astype(np.float64)
+        counted = (days < last - first) & ~np.isnan(times).any(axis=1)
+        np.add.at(minutes, days[counted], times[counted])
+        return minutes
+
+    def update_sleep(self, scores, start):
+        """
+        Indexes daily sleep scores from start (see Athlete.sleep_score_history), carrying each forward over the following days without one. Only recomputed when given a new array of scores.
+        """
+        if scores is self.sleep_source:
+            return
+        self.sleep_source = scores
+        self.sleep_start = start
+        if scores is None or not len(scores):
+            self.sleep_scores = np.zeros(0)
+            return
+        recorded = np.where(np.isnan(scores), -1, np.arange(len(scores)))
+        latest = np.maximum.accumulate(recorded)
+        self.sleep_scores = np.where(latest >= 0, scores[np.maximum(latest, 0)], np.nan)
+
+    def rows(self, start, end):
+        return np.arange((start - self.start).days, (end - self.start).days + 1)
+
+    def column(self, act_type):
+        if act_type == 'cardio':
+            return 0
+        if act_type in self.types:
+            return self.types.index(act_type) + 1
+        return None
+
+    def values(self, start, end, act_type='cardio'):
+        """
+        Returns dict of arrays of fitness, fatigue, form, time_in_zones_7day and time_in_zones_42day (days x zones) and sleep_score on each day from start to end inclusive (days before the first indexed day have none of either). Rows through end must be up to date (see refresh).
+        """
+        n_days = (end - start).days + 1
+        values = {'fitness': np.zeros(n_days), 'fatigue': np.zeros(n_days),
+                  'time_in_zones_7day': np.zeros((n_days, self.n_zones)), 'time_in_zones_42day': np.zeros((n_days, self.n_zones))}
+        column = self.column(act_type)
+        if self.start is not None:
+            rows = self.rows(start, end)
+            inside = rows >= 0
+            rows = rows[inside]
+            if column is not None:
+                values['fitness'][inside] = self.fitness_sums[rows, column]/FITNESS_NORM
+                # The decayed sum over the last 7 days is the decayed sum of all days less that as of 7 days before, decayed by another 7 days
+                dropped = np.where(rows >= FATIGUE_DAYS, self.fatigue_sums[np.maximum(rows - FATIGUE_DAYS, 0), column], 0.)
+                # (clipped at zero, since the difference leaves rounding error once a week passes without training)
+                values['fatigue'][inside] = np.maximum(self.fatigue_sums[rows, column] - np.exp(-1.)*dropped, 0.)/FATIGUE_NORM
+            for n in [FATIGUE_DAYS, FITNESS_DAYS]:
+                values['time_in_zones_{}day'.format(n)][inside] = self.zone_sums[rows + 1] - self.zone_sums[np.maximum(rows + 1 - n, 0)]
+        values['form'] = values['fitness'] - values['fatigue']
+        values['sleep_score'] = np.full(n_days, np.nan)
+        if len(self.sleep_scores):
+            rows = np.arange((start - self.sleep_start).days, (end - self.sleep_start).days + 1)
+            inside = rows >= 0
+            values['sleep_score'][inside] = self.sleep_scores[np.minimum(rows[inside], len(self.sleep_scores) - 1)]
+        return values
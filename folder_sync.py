@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+from collections import namedtuple
+
+# Files picked up from synced folders: activities, and sleep data exported from Garmin Connect
+SYNCED_EXTENSIONS = ('.gpx', '.tcx', '.csv')
+
+# What the manifest knows of each file: stat fields (to skip unchanged files without reading them), content hash (to recognize changed files and copies), the date of the activity it holds (None for sleep data and unreadable files), and the error raised reading it, if it couldn't be read
+Manifest_Entry = namedtuple('Manifest_Entry', ['size', 'mtime', 'hash', 'date', 'error'])
+Manifest_Entry.__new__.__defaults__ = (None,)
+
+# Result of scanning a folder: files to (re)ingest as (path, size, mtime, hash, previous entry or None) tuples, copies of already ingested files as (path, entry) pairs, and (path, entry) pairs of files deleted since the last scan
+Folder_Changes = namedtuple('Folder_Changes', ['pending', 'copies', 'deleted'])
+
+
+def file_hash(filepath):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class File_Manifest(object):
+    """
+    Record of every file ingested from synced folders (see Athlete.sync_folder), keyed by absolute path, so a scan only hashes files whose size or mtime changed and only returns those whose content is new. Files which couldn't be read are kept with their error until they change.
+    """
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.dirty = set()
+        self.forgotten = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def record(self, path, size, mtime, digest, date=None, error=None):
+        self.entries[path] = Manifest_Entry(size, mtime, digest, date, error)
+        self.dirty.add(path)
+        self.forgotten.discard(path)
+
+    def forget(self, path):
+        del self.entries[path]
+        self.dirty.discard(path)
+        self.forgotten.add(path)
+
+    def dates(self, exclude=()):
+        """
+        Returns set of the activity dates of every file in the manifest, other than the paths in exclude.
+        """
+        return set([entry.date for path, entry in self.entries.items() if entry.date is not None and path not in exclude])
+
+    def scan(self, folder, settle=0.):
+        """
+        Compares the synced files (see SYNCED_EXTENSIONS) in folder with the manifest, and returns their Folder_Changes. Files modified less than settle seconds ago are left for a later scan, since they may still be being written.
+        """
+        folder = os.path.abspath(os.path.expanduser(folder))
+        by_hash = dict((entry.hash, entry) for entry in self.entries.values() if entry.error is None)
+        now = time.time()
+        pending = []
+        copies = []
+        seen = set()
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(SYNCED_EXTENSIONS):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            entry = self.entries.get(path)
+            if entry is not None and (entry.size, entry.mtime) == (stat.st_size, stat.st_mtime):
+                continue
+            if now - stat.st_mtime < settle:
+                continue
+            digest = file_hash(path)
+            if entry is not None and entry.hash == digest and entry.error is None:
+                # Touched but unchanged
+                self.record(path, stat.st_size, stat.st_mtime, digest, entry.date)
+            elif digest in by_hash:
+                copies.append((path, by_hash[digest]))
+                self.record(path, stat.st_size, stat.st_mtime, digest, by_hash[digest].date)
+            else:
+                pending.append((path, stat.st_size, stat.st_mtime, digest, entry))
+        deleted = [(path, entry) for path, entry in sorted(self.entries.items()) if os.path.dirname(path) == folder and path not in seen]
+        return Folder_Changes(pending, copies, deleted)
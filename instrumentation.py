@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from timeit import default_timer
+
+# Stack of active Profilers; stages are recorded by the innermost one
+PROFILERS = []
+
+
+def current_rss():
+    """
+    Returns resident set size of this process in bytes, or None where /proc isn't available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*resource.getpagesize()
+    except IOError:
+        return None
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+def active():
+    """
+    Returns the innermost active Profiler, or None when instrumentation is disabled.
+    """
+    return PROFILERS[-1] if PROFILERS else None
+
+
+class No_Stage(object):
+    """
+    Stand-in returned by stage() when no Profiler is active, so instrumented code pays for one function call and nothing else.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NO_STAGE = No_Stage()
+
+
+def stage(name, filepath=None, points=None):
+    """
+    Returns context manager recording the wall time (and memory) of the enclosed code as stage name with the active Profiler, or a no-op when there is none. The number of points processed (e.g. trackpoints) may be passed in, or set on the returned object inside the block. Stages nest; a stage without a filepath inherits that of the stage enclosing it.
+    """
+    profiler = active()
+    if profiler is None:
+        return NO_STAGE
+    return Stage(profiler, name, filepath, points)
+
+
+def record(name, seconds, filepath=None, points=None):
+    """
+    Records a stage timed by the caller (e.g. accumulated over a loop) with the active Profiler, if any.
+    """
+    profiler = active()
+    if profiler is not None:
+        parent = profiler.stages[-1] if profiler.stages else None
+        profiler.record(name, seconds, filepath or (parent.filepath if parent else None), points, parent)
+
+
+class Stage(object):
+    def __init__(self, profiler, name, filepath, points):
+        self.profiler = profiler
+        self.name = name
+        self.filepath = filepath
+        self.points = points
+        self.peak = 0
+
+    def __enter__(self):
+        stages = self.profiler.stages
+        self.parent = stages[-1] if stages else None
+        if self.filepath is None and self.parent is not None:
+            self.filepath = self.parent.filepath
+        self.start_rss = current_rss()
+        if self.profiler.memory:
+            self.start_peak_rss = peak_rss()
+            self.peak = self.start_rss or 0
+        stages.append(self)
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = default_timer() - self.start
+        self.profiler.stages.pop()
+        rss = current_rss()
+        peak_bytes = None
+        if self.profiler.memory and self.start_rss is not None:
+            self.peak = max(self.peak, rss)
+            # A rise in the process's high-water mark happened during this stage, so it is this stage's exact peak; below it, the sampled peak is the best known
+            high_water = peak_rss()
+            if high_water > self.start_peak_rss:
+                self.peak = max(self.peak, high_water)
+            peak_bytes = self.peak - self.start_rss
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, self.peak)
+        rss_delta = None
+        if self.start_rss is not None:
+            rss_delta = rss - self.start_rss
+        self.profiler.record(self.name, seconds, self.filepath, self.points, self.parent, peak_bytes, rss_delta, failed=exc_info[0] is not None)
+        return False
+
+
+class RSS_Sampler(threading.Thread):
+    """
+    Daemon thread polling the resident set size every interval seconds while a Profiler is active, raising the peak of every open stage to it.
+    """
+    def __init__(self, profiler, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.profiler = profiler
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = current_rss()
+            for open_stage in list(self.profiler.stages):
+                open_stage.peak = max(open_stage.peak, rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler(object):
+    """
+    Opt-in recorder of per-stage timings for the ingest pipeline. While a Profiler is active (inside a with block), every instrumented stage (XML decoding, unpacking trackpoints, feature engineering, imputation, each stat calculation, cache reads and writes, fitness updates, ...) appends a record to records, with:
+        - stage: stage name, and parent: name of the enclosing stage (or None)
+        - file: activity file being processed, if any
+        - seconds: wall time, and points: number of trackpoints (or activities) processed, where known
+        - peak_bytes: peak resident set size during the stage above its size at the start of the stage (None with memory=False, or where /proc isn't available). Resident set size is sampled every memory_interval seconds by a background thread, and the process's high-water mark (ru_maxrss) is checked as each stage ends, so the peak is exact for stages which raise the high-water mark and may miss spikes shorter than memory_interval otherwise
+        - rss_delta_bytes: change in the process's resident set size over the stage, where /proc is available
+        - failed: whether the stage raised an exception
+        - time, pid: when (Unix time) and in which process the stage ended
+
+    Records can be passed to callback as they're made, streamed to a JSON lines file at filepath, and exported or summarized afterwards. Stages run in worker processes (Athlete.add_activities with processes > 1) are not recorded; profile with processes=1.
+
+    When no Profiler is active, instrumented code costs a single function call per stage per file.
+    """
+    def __init__(self, filepath=None, callback=None, memory=True, memory_interval=0.005):
+        self.filepath = filepath
+        self.callback = callback
+        self.memory = memory
+        self.memory_interval = memory_interval
+        self.records = []
+        self.stages = []
+        self.sampler = None
+        self.file = None
+
+    def __enter__(self):
+        if self.memory and current_rss() is not None:
+            self.sampler = RSS_Sampler(self, self.memory_interval)
+            self.sampler.start()
+        if self.filepath is not None:
+            self.file = open(self.filepath, 'a')
+        PROFILERS.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        PROFILERS.remove(self)
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return False
+
+    def record(self, name, seconds, filepath=None, points=None, parent=None, peak_bytes=None, rss_delta_bytes=None, failed=False):
+        entry = {'stage': name, 'parent': parent.name if parent is not None else None, 'file': filepath,
+                 'seconds': seconds, 'points': points, 'peak_bytes': peak_bytes, 'rss_delta_bytes': rss_delta_bytes,
+                 'failed': failed, 'time': time.time(), 'pid': os.getpid()}
+        self.records.append(entry)
+        if self.callback is not None:
+            self.callback(entry)
+        if self.file is not None:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+        return entry
+
+    def write_jsonl(self, filepath):
+        """
+        Writes every record to filepath as JSON lines (one JSON object per line).
+        """
+        with open(filepath, 'w') as f:
+            for entry in self.records:
+                f.write(json.dumps(entry) + '\n')
+
+    def summary(self):
+        """
+        Returns dict mapping each stage name to a dict of its number of calls, total seconds, total points, and largest peak_bytes.
+        """
+        totals = {}
+        for entry in self.records:
+            total = totals.setdefault(entry['stage'], {'calls': 0, 'seconds': 0., 'points': 0, 'peak_bytes': None})
+            total['calls'] += 1
+            total['seconds'] += entry['seconds']
+            total['points'] += entry['points'] or 0
+            if entry['peak_bytes'] is not None:
+                total['peak_bytes'] = max(total['peak_bytes'] or 0, entry['peak_bytes'])
+        return totals
+
+    def print_summary(self):
+        totals = self.summary()
+        print '{:<36} {:>7} {:>11} {:>12} {:>10}'.format('Stage', 'Calls', 'Seconds', 'Points', 'Peak MB')
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]['seconds']):
+            peak = '{:.1f}'.format(total['peak_bytes']/1e6) if total['peak_bytes'] is not None else '-'
+            print '{:<36} {:>7} {:>11.4f} {:>12} {:>10}'.format(name, total['calls'], total['seconds'], total['points'], peak)
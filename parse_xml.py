@@ -1,8 +1,14 @@
 import datetime
-import xmltodict
 import numpy as np
+from array import array
 import pandas as pd
-from calculate_stats import avg_speed_2d
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+from timeit import default_timer
+from calculate_stats import avg_speed_2d, assign_zones
+from instrumentation import active, stage, record
 
 # ____________ Helper functions for parsing ____________
 
@@ -42,25 +48,13 @@ def correct_activity_type(act_type, df):
 def engineer_features(act_type, df, zones=[113, 150, 168, 187]):
     # 'time_delta' is elapsed time between successive points
     if 'time' in df.columns.values:
-        df['time_delta'] = (df.time - df.time.shift(1)).apply(lambda x : x.total_seconds())
+        df['time_delta'] = df.time.diff().dt.total_seconds()
     # 'elevation_change' is change in elevation between successive points
     if 'elevation' in df.columns.values:
         df['elevation_change'] = df.elevation - df.elevation.shift(1)
-    # define helper inner-function to calculate heart rate zones
-    def calculate_zone(hr):
-        if hr < zones[0]:
-            return 1
-        elif hr < zones[1]:
-            return 2
-        elif hr < zones[2]:
-            return 3
-        elif hr < zones[3]:
-            return 4
-        else:
-            return 5
     if 'hr' in df.columns.values:
         # 'zone' is heart rate zone during that point
-        df['zone'] = df.hr.apply(calculate_zone)
+        df['zone'] = assign_zones(df.hr.values, zones)
     if 'lon' in df.columns.values:
         # calculate 2d distances between consecutive points
         df['distance_2d_ft'] = haversine_np(df.lon.shift(),
@@ -81,99 +75,248 @@ def engineer_features(act_type, df, zones=[113, 150, 168, 187]):
 
 def impute_nulls(df):
     """
-    Imputes mean of surrounding values in the column, and casts to same dtype as previous value in column. Ignores nulls in first/last rows.
-    """
-    nulls = df.isnull().unstack()
-    nulls_ind = nulls[nulls].index.values
-    for (col, row) in nulls_ind:
-        if (row != 0) and (row != df.shape[0]):
-            imputed_value = (df[col][row-1]+df[col][row+1])*0.5
-            if type(df[col][row-1]) == float:
-                df[col][row] = float(imputed_value)
-            elif type(df[col][row-1]) == int:
-                df[col][row] = int(imputed_value)
-            elif type(df[col][row-1]) == type(np.float64(0)):
-                df[col][row] = np.float64(imputed_value)
+    Imputes interior nulls in each float column by linear interpolation between the nearest non-null values above and below, one vectorized pass per column:
+        - an isolated null gets the mean of the values on either side of it
+        - a run of consecutive nulls is filled with evenly spaced values along the straight line between the values bounding the run
+        - nulls before the first or after the last non-null value in a column (which always includes a null in the first or last row) are left as they are
+    Interpolation is by row position, not by time. Columns keep their dtypes; integer and boolean columns cannot hold nulls and are skipped.
+    """
+    for col in df.columns:
+        values = df[col].values
+        if values.dtype.kind != 'f':
+            continue
+        nulls = np.isnan(values)
+        observed = np.flatnonzero(~nulls)
+        if len(observed) < 2:
+            continue
+        first, last = observed[0], observed[-1]
+        interior = np.flatnonzero(nulls[first:last]) + first
+        if len(interior):
+            values = values.copy()
+            values[interior] = np.interp(interior, observed, values[observed])
+            df[col] = values
     return df
 
 
+# ____________ Helper functions for streaming XML ____________
+
+LOCAL_NAMES = {}
+
+
+def local_name(tag):
+    """
+    Strips the namespace from an ElementTree tag, e.g. '{http://www.topografix.com/GPX/1/1}trkpt' -> 'trkpt'. Namespace prefixes differ between Garmin Connect ('ns3:') and Strava ('gpxtpx:') files, so elements are matched on local name only. Results are memoized, since a file only ever uses a handful of distinct tags.
+    """
+    try:
+        return LOCAL_NAMES[tag]
+    except KeyError:
+        name = LOCAL_NAMES[tag] = tag.rsplit('}', 1)[-1]
+        return name
+
+
+def child_text(elem, name):
+    """
+    Returns the text of the first direct child of elem with the given local name, or None if there is no such child.
+    """
+    for child in elem:
+        if local_name(child.tag) == name:
+            return child.text
+    return None
+
+
+def iter_elements(filepath, names):
+    """
+    Streams every element in the XML file at filepath whose local name is in names, yielding each one as soon as its end tag has been read.
+
+    Each yielded element is cleared and detached from its parent once the caller has consumed it, so peak memory stays roughly flat regardless of file length. Callers must pull everything they need out of an element before asking for the next one. Names may include descendants of other names (e.g. 'trkpt' within 'trk'): each matched descendant is yielded, cleared and detached first, so its ancestor is yielded afterwards without it, holding only the elements it contains which weren't matched.
+    """
+    parents = []
+    for event, elem in ElementTree.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if local_name(elem.tag) in names:
+            yield elem
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+
+
+# ____________ Columnar trackpoint storage ____________
+
+TRACKPOINT_COLUMNS = ('lat', 'lon', 'elevation', 'hr', 'air_temp', 'cadence')
+INTEGER_COLUMNS = ('hr', 'cadence')
+
+
+class Trackpoint_Columns(object):
+    """
+    Accumulates trackpoint observations into one typed array per column rather than one dict per trackpoint. Missing observations are stored as NaN, and timestamps are kept as raw strings until to_dataframe() converts the whole activity in one batch.
+    """
+    def __init__(self, time_format):
+        self.time_format = time_format
+        self.times = []
+        self.columns = dict((name, array('d')) for name in TRACKPOINT_COLUMNS)
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, time, lat=None, lon=None, elevation=None, hr=None, air_temp=None, cadence=None):
+        self.times.append(time)
+        values = (lat, lon, elevation, hr, air_temp, cadence)
+        for name, value in zip(TRACKPOINT_COLUMNS, values):
+            if value is None:
+                self.columns[name].append(np.nan)
+            else:
+                self.columns[name].append(float(value))
+                self.seen.add(name)
+
+    def to_dataframe(self):
+        """
+        Returns dataframe with a 'time' column plus every trackpoint column observed at least once. Integer columns (heart rate, cadence) are returned as int64 unless they contain gaps, in which case they stay float64 with NaN, matching what pandas infers for the equivalent list of dicts.
+        """
+        if not self.times:
+            return pd.DataFrame()
+        data = {'time': pd.to_datetime(self.times, format=self.time_format)}
+        for name in TRACKPOINT_COLUMNS:
+            if name in self.seen:
+                values = np.frombuffer(self.columns[name], dtype=np.float64)
+                if name in INTEGER_COLUMNS and not np.isnan(values).any():
+                    values = values.astype(np.int64)
+                else:
+                    values = values.copy()
+                data[name] = values
+        return pd.DataFrame(data, columns=['time'] + [name for name in TRACKPOINT_COLUMNS if name in self.seen])
+
+
 # ____________ Helper functions for parse_gpx() ____________
 
-def unpack_gpx_trkpt(trkpt, creator):
-    trackpoint = {}
-    if creator == 'Garmin Connect':
-        prepend = 'ns3:'
-        trackpoint['time'] = datetime.datetime.strptime(trkpt['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    elif creator == 'StravaGPX' or creator == 'strava.com Android':
-        prepend = 'gpxtpx:'
-        trackpoint['time'] = datetime.datetime.strptime(trkpt['time'], '%Y-%m-%dT%H:%M:%SZ')
-    if '@lat' in trkpt:
-        trackpoint['lat'] = float(trkpt['@lat'])
-    if '@lon' in trkpt:
-        trackpoint['lon'] = float(trkpt['@lon'])
-    if 'ele' in trkpt:
-        trackpoint['elevation'] = float(trkpt['ele'])
-    if 'extensions' in trkpt:
-        if prepend+'TrackPointExtension' in trkpt['extensions']:
-            ext = trkpt['extensions'][prepend+'TrackPointExtension']
-            if prepend+'hr' in ext:
-                trackpoint['hr'] = int(ext[prepend+'hr'])
-            if prepend+'atemp' in ext:
-                trackpoint['air_temp'] = float(ext[prepend+'atemp'])
-            if prepend+'cad' in ext:
-                trackpoint['cadence'] = int(ext[prepend+'cad'])
-    return trackpoint
-
-
-def extract_metadata_gpx(xmldict):
-    creator = xmldict['gpx']['@creator']
-    if creator == 'Garmin Connect':
-        date = datetime.datetime.strptime(xmldict['gpx']['metadata']['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    elif creator == 'StravaGPX' or creator == 'strava.com Android':
-        date = datetime.datetime.strptime(xmldict['gpx']['metadata']['time'], '%Y-%m-%dT%H:%M:%SZ')
-
-    if 'trk' in xmldict['gpx']:
-        if 'name' in xmldict['gpx']['trk']:
-            name = xmldict['gpx']['trk']['name']
-        else:
-            name = 'Unnamed Activity'
-        if 'type' in xmldict['gpx']['trk']:
-            act_type = xmldict['gpx']['trk']['type']
-        else:
-            act_type = 'Unknown Activity Type'
-        return name, act_type, date, creator
+GPX_TIME_FORMATS = {'Garmin Connect': '%Y-%m-%dT%H:%M:%S.%fZ',
+                    'StravaGPX': '%Y-%m-%dT%H:%M:%SZ',
+                    'strava.com Android': '%Y-%m-%dT%H:%M:%SZ'}
+
+
+def gpx_creator(filepath):
+    """
+    Returns the creator attribute of the root <gpx> element, reading no further into the file than the root start tag.
+    """
+    for event, elem in ElementTree.iterparse(filepath, events=('start',)):
+        return elem.get('creator')
 
+
+def unpack_gpx_trkpt(trkpt, columns):
+    """
+    Appends the observations of a single streamed <trkpt> element to columns (a Trackpoint_Columns).
+    """
+    time, elevation, hr, air_temp, cadence = None, None, None, None, None
+    for child in trkpt:
+        name = local_name(child.tag)
+        if name == 'time':
+            time = child.text
+        elif name == 'ele':
+            elevation = child.text
+        elif name == 'extensions':
+            for ext in child.iter():
+                ext_name = local_name(ext.tag)
+                if ext_name == 'hr':
+                    hr = ext.text
+                elif ext_name == 'atemp':
+                    air_temp = ext.text
+                elif ext_name == 'cad':
+                    cadence = ext.text
+    columns.append(time, trkpt.get('lat'), trkpt.get('lon'), elevation, hr, air_temp, cadence)
+
+
+def extract_metadata_gpx(elem, metadata):
+    """
+    Updates the metadata dict in place from a streamed <metadata> element (activity date) or <trk> element (name and type), the latter arriving only once all of its trackpoints have been consumed.
+    """
+    if local_name(elem.tag) == 'metadata':
+        time = child_text(elem, 'time')
+        if time is not None:
+            metadata['date'] = datetime.datetime.strptime(time, metadata['time_format'])
     else:
-        act_type = 'Unknown Activity Type'
-        name = 'Unnamed Activity'
-        return name, act_type, date, creator
+        name = child_text(elem, 'name')
+        act_type = child_text(elem, 'type')
+        if name is not None:
+            metadata['name'] = name
+        if act_type is not None:
+            metadata['act_type'] = act_type
+
+
+def parse_gpx_header(filepath):
+    """
+    Returns tuple of name, activity type, date (as datetime object) and creator of a .gpx file, reading only the elements which precede its first track segment, i.e. without touching any trackpoints. Values are the same as those unpack_gpx returns, except that an unknown activity type is not yet corrected from the trackpoint speeds.
+    """
+    metadata = {'name': 'Unnamed Activity',
+                'act_type': 'Unknown Activity Type',
+                'date': None,
+                'time_format': None}
+    creator = None
+    path = []
+    for event, elem in ElementTree.iterparse(filepath, events=('start', 'end')):
+        name = local_name(elem.tag)
+        if event == 'start':
+            if name == 'trkseg':
+                break
+            if name == 'gpx':
+                creator = elem.get('creator')
+                metadata['time_format'] = GPX_TIME_FORMATS.get(creator)
+            path.append(name)
+            continue
+        path.pop()
+        if name == 'metadata':
+            extract_metadata_gpx(elem, metadata)
+        elif path and path[-1] == 'trk':
+            if name == 'name':
+                metadata['name'] = elem.text
+            elif name == 'type':
+                metadata['act_type'] = elem.text
+    return metadata['name'], metadata['act_type'], metadata['date'], creator
 
 
 def unpack_gpx(filepath):
     """
     Unpacks GPXTrack XML file constructed by Garmin device (currently tested for Forerunner 230 and Edge 810) containing a single GPX Track and Track Segment, or .gpx files for activities downloaded from Strava.
 
+    The file is streamed, so trackpoints are unpacked one at a time as they are read and discarded once consumed. Trackpoint timestamps are parsed in a single batch using the time format of the file's creator.
+
     Returns tuple of name, activity type, activity date (as datetime object), and dataframe containing observational data for each trackpoint.
     """
-    list_of_trkpt_dicts = []
-    with open(filepath, 'r') as f:
-        dct = xmltodict.parse(f.read())
-    name, act_type, date, creator = extract_metadata_gpx(dct)
-    if 'trk' in dct['gpx']:
-        trkpts = dct['gpx']['trk']['trkseg']['trkpt']
-        # Iterate through each trackpoint by index
-        for trkpt in trkpts:
-            list_of_trkpt_dicts.append(unpack_gpx_trkpt(trkpt, creator))
-    else:
-        list_of_trkpt_dicts = []
-    return name, act_type, date, creator, pd.DataFrame(list_of_trkpt_dicts)
+    creator = gpx_creator(filepath)
+    metadata = {'name': 'Unnamed Activity',
+                'act_type': 'Unknown Activity Type',
+                'date': None,
+                'time_format': GPX_TIME_FORMATS.get(creator)}
+    columns = Trackpoint_Columns(metadata['time_format'])
+    profiling = active() is not None
+    start, unpack_seconds = default_timer(), 0.
+    for elem in iter_elements(filepath, ('trkpt', 'metadata', 'trk')):
+        if local_name(elem.tag) == 'trkpt':
+            if profiling:
+                unpack_start = default_timer()
+                unpack_gpx_trkpt(elem, columns)
+                unpack_seconds += default_timer() - unpack_start
+            else:
+                unpack_gpx_trkpt(elem, columns)
+        else:
+            extract_metadata_gpx(elem, metadata)
+    if profiling:
+        record('xml_decode', default_timer() - start - unpack_seconds, filepath, len(columns))
+        record('unpack_gpx_trkpt', unpack_seconds, filepath, len(columns))
+    with stage('to_dataframe', filepath, len(columns)):
+        data = columns.to_dataframe()
+    return metadata['name'], metadata['act_type'], metadata['date'], creator, data
 
 
 # ____________ Helper functions for parse_tcx() ____________
 
-def extract_metadata_tcx(xmldict):
-    act_type = xmldict['TrainingCenterDatabase']['Activities']['Activity']['@Sport']
-    date = datetime.datetime.strptime(xmldict['TrainingCenterDatabase']['Activities']['Activity']['Id'], '%Y-%m-%dT%H:%M:%S.%fZ')
+TCX_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def extract_metadata_tcx(act_type, activity_id):
+    date = datetime.datetime.strptime(activity_id, TCX_TIME_FORMAT)
     if act_type == 'Biking':
         act_type = 'cycling'
     elif act_type == 'Running':
@@ -182,33 +325,68 @@ def extract_metadata_tcx(xmldict):
     return name, act_type, date
 
 
-def unpack_tcx_trkpt(trkpt):
+def parse_tcx_header(filepath):
+    """
+    Returns tuple of name, activity type, date (as datetime object) and creator of a .tcx file, reading only as far as the <Id> of its activity, i.e. without touching any trackpoints.
+    """
+    sport, activity_id = None, None
+    for event, elem in ElementTree.iterparse(filepath, events=('start', 'end')):
+        name = local_name(elem.tag)
+        if event == 'start':
+            if name == 'Activity':
+                sport = elem.get('Sport')
+            elif name == 'Lap':
+                break
+        elif name == 'Id':
+            activity_id = elem.text
+            break
+    name, act_type, date = extract_metadata_tcx(sport, activity_id)
+    return name, act_type, date, 'Unknown'
+
+
+def unpack_tcx_trkpt(trkpt, columns):
     """
     Currently only formatted to accept TCX files where GPS has been turned off for activity recording, since I only need this format for processing rides data from the stationary bike
     """
-    trackpoint = {}
-    trackpoint['time'] = datetime.datetime.strptime(trkpt['Time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    if 'HeartRateBpm' in trkpt:
-        trackpoint['hr'] = int(trkpt['HeartRateBpm']['Value'])
-    return trackpoint
+    time, hr = None, None
+    for child in trkpt:
+        name = local_name(child.tag)
+        if name == 'Time':
+            time = child.text
+        elif name == 'HeartRateBpm':
+            hr = child_text(child, 'Value')
+    columns.append(time, hr=hr)
 
 
 def unpack_tcx(filepath):
     """
-    Unpacks TCX XML file constructed by Garmin device (currently tested for Forerunner 230) containing a single lap.
+    Unpacks TCX XML file constructed by Garmin device (currently tested for Forerunner 230).
+
+    The file is streamed, so trackpoints are unpacked one at a time as they are read and discarded once consumed. Trackpoint timestamps are parsed in a single batch.
 
     Returns tuple of name, activity type, activity date (as datetime object), and dataframe containing observational data for each trackpoint.
     """
-    list_of_trkpt_dicts = []
-    with open(filepath, 'r') as f:
-        dct = xmltodict.parse(f.read())
-    name, act_type, date = extract_metadata_tcx(dct)
-    # import pdb; pdb.set_trace()
-    trkpts = dct['TrainingCenterDatabase']['Activities']['Activity']['Lap']['Track']['Trackpoint']
-    # Iterate through each trackpoint by index
-    for trkpt in trkpts:
-        list_of_trkpt_dicts.append(unpack_tcx_trkpt(trkpt))
-    return name, act_type, date, pd.DataFrame(list_of_trkpt_dicts)
+    columns = Trackpoint_Columns(TCX_TIME_FORMAT)
+    sport, activity_id = None, None
+    profiling = active() is not None
+    start, unpack_seconds = default_timer(), 0.
+    for elem in iter_elements(filepath, ('Trackpoint', 'Activity')):
+        if local_name(elem.tag) == 'Trackpoint':
+            if profiling:
+                unpack_start = default_timer()
+                unpack_tcx_trkpt(elem, columns)
+                unpack_seconds += default_timer() - unpack_start
+            else:
+                unpack_tcx_trkpt(elem, columns)
+        else:
+            sport, activity_id = elem.get('Sport'), child_text(elem, 'Id')
+    if profiling:
+        record('xml_decode', default_timer() - start - unpack_seconds, filepath, len(columns))
+        record('unpack_tcx_trkpt', unpack_seconds, filepath, len(columns))
+    name, act_type, date = extract_metadata_tcx(sport, activity_id)
+    with stage('to_dataframe', filepath, len(columns)):
+        data = columns.to_dataframe()
+    return name, act_type, date, data
 
 
 # _____________________________________________________________
@@ -217,9 +395,13 @@ def parse_gpx(filepath,  zones=[113, 150, 168, 187]):
     """
     Returns tuple of name (str), activity_type (str), date (datetime), creator (str), and dataframe of trackpoint data with engineered features and nulls filled with imputed values.
     """
-    name, act_type, date, creator, data = unpack_gpx(filepath)
-    act_type, data = engineer_features(act_type, data, zones=zones)
-    data = impute_nulls(data)
+    with stage('unpack_gpx', filepath) as unpacking:
+        name, act_type, date, creator, data = unpack_gpx(filepath)
+        unpacking.points = len(data)
+    with stage('engineer_features', filepath, len(data)):
+        act_type, data = engineer_features(act_type, data, zones=zones)
+    with stage('impute_nulls', filepath, len(data)):
+        data = impute_nulls(data)
     return name, act_type, date, creator, data
 
 
@@ -227,7 +409,11 @@ def parse_tcx(filepath, zones=[113, 150, 168, 187]):
     """
     Returns tuple of name (str), activity_type (str), date (datetime), creator (str), and dataframe of trackpoint data with engineered features and nulls filled with imputed values.
     """
-    name, act_type, date, data = unpack_tcx(filepath)
-    act_type, data = engineer_features(act_type, data, zones=zones)
-    data = impute_nulls(data)
+    with stage('unpack_tcx', filepath) as unpacking:
+        name, act_type, date, data = unpack_tcx(filepath)
+        unpacking.points = len(data)
+    with stage('engineer_features', filepath, len(data)):
+        act_type, data = engineer_features(act_type, data, zones=zones)
+    with stage('impute_nulls', filepath, len(data)):
+        data = impute_nulls(data)
     return name, act_type, date, 'Unknown', data
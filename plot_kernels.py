@@ -0,0 +1,67 @@
+import numpy as np
+
+# Meters per foot, for converting trackpoint distances (in feet) to meters and back
+METERS_PER_FOOT = 1/3.28084
+
+
+def cumulative_sum(values):
+    """
+    Returns array whose i-th entry is the sum of values[:i] (so the first entry is 0), in O(n). Nulls count as 0.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    out = np.zeros(len(values))
+    np.cumsum(values[:-1], out=out[1:])
+    return out
+
+
+def rolling_mean(values, half_width=2):
+    """
+    Returns array of centered rolling means of values over windows of 2*half_width+1 points, with the windows of the first and last half_width points truncated to the ends of the array. Computed from a single cumulative sum, so the cost is O(n) whatever the window size.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if not n:
+        return values
+    sums = np.concatenate([[0.], np.cumsum(values)])
+    index = np.arange(n)
+    lo = np.maximum(index - half_width, 0)
+    hi = np.minimum(index + half_width + 1, n)
+    return (sums[hi] - sums[lo])/(hi - lo)
+
+
+def clip_outliers(values, limit, fill=0.):
+    """
+    Returns copy of values with every value whose magnitude isn't below limit (or which is null) replaced by fill.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.abs(values) < limit, values, fill)
+
+
+def screen_points(axis):
+    """
+    Returns the width in pixels of a matplotlib axis, beyond which extra points along the x axis can't be seen.
+    """
+    return max(int(np.ceil(axis.bbox.width)), 2)
+
+
+def resample(x, y, n_points, max_points=None):
+    """
+    Returns tuple of (x, y) arrays linearly interpolated onto n_points evenly spaced x values spanning x (which must be nondecreasing), capped at max_points (e.g. the screen_points of the axis being drawn on). Replaces interpolating onto a fixed grid (e.g. one point per meter), whose size grows with activity length rather than with what can be displayed.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if max_points is not None:
+        n_points = min(n_points, max_points)
+    grid = np.linspace(x[0], x[-1], max(int(n_points), 2))
+    return grid, np.interp(grid, x, y)
+
+
+def time_at_values(values, time_deltas, lo, hi):
+    """
+    Returns array of total time (in the units of time_deltas) spent at each integer value from lo to hi inclusive, in one pass with np.bincount. Non-integer and null values, and null time deltas, are ignored.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    time_deltas = np.nan_to_num(np.asarray(time_deltas, dtype=np.float64))
+    with np.errstate(invalid='ignore'):
+        keep = (values == np.floor(values)) & (values >= lo) & (values <= hi)
+    return np.bincount((values[keep] - lo).astype(np.int64), weights=time_deltas[keep], minlength=hi-lo+1)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+
+class Uniform_Series(object):
+    """
+    Trackpoint columns of an activity resampled onto a fixed-rate time grid (1 Hz by default), so that every sample stands for the same length of time whatever the device's recording interval (e.g. Garmin "smart recording").
+
+    Sample k stands for the 1/rate seconds ending k/rate seconds after the first trackpoint, and takes the values of the first trackpoint recorded at or after that time, i.e. the trackpoint whose time_delta interval contains it. This is how time_delta already attributes time to trackpoints, so for timestamps in whole seconds, weighting trackpoints by time_delta and counting 1 Hz samples give the same totals.
+
+    The grid is held as a single array of source trackpoint indices; columns are gathered through it the first time they're used (as attributes, e.g. .hr, .zone, .moving) and kept. time_delta is the constant sample length and columns.values lists the available columns, so functions written for trackpoint dataframes (e.g. calculate_stats.zone_times_and_load) accept a Uniform_Series unchanged.
+    """
+    def __init__(self, time_deltas, sources, rate=1.):
+        self.rate = rate
+        elapsed = np.cumsum(np.nan_to_num(np.asarray(time_deltas, dtype=np.float64)))
+        n_samples = int(np.floor(elapsed[-1]*rate + 1e-9)) if len(elapsed) else 0
+        self.seconds = np.arange(1, n_samples+1)/float(rate)
+        self.index = np.searchsorted(elapsed, self.seconds - 1e-9/rate, side='left')
+        self.sources = dict((name, values) for name, values in sources.items() if values is not None)
+        self.gathered = {}
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('sources', ()):
+            if name not in self.gathered:
+                self.gathered[name] = self.gather(self.sources[name])
+            return self.gathered[name]
+        raise AttributeError(name)
+
+    @property
+    def columns(self):
+        return pd.Index(['time_delta'] + sorted(self.sources))
+
+    @property
+    def time_delta(self):
+        return np.full(len(self.seconds), 1./self.rate)
+
+    def gather(self, values):
+        """
+        Returns array of values (one per trackpoint, e.g. a smoothed series) resampled onto the grid.
+        """
+        if isinstance(values, pd.Series):
+            values = values.values
+        return np.asarray(values)[self.index]
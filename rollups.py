@@ -0,0 +1,194 @@
+import datetime
+import numpy as np
+
+# Totals kept per period and activity type, followed by the minutes spent in each heart rate zone
+ROLLUP_STATS = ['activities', 'training_load', 'total_distance_2d', 'elevation_gain']
+PERIODS = ['day', 'week', 'month']
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def period_numbers(ordinals, period):
+    """
+    Returns array of the number of the period (counted from a fixed origin) containing each of an array of day ordinals: the ordinal itself for days, the Monday-based week (date.fromordinal(1) is a Monday) for weeks, and months since January 1970 for months.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    if period == 'day':
+        return ordinals
+    if period == 'week':
+        return (ordinals - 1)//7
+    if period == 'month':
+        return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError('period must be one of {}, not {!r}'.format(PERIODS, period))
+
+
+def period_start(number, period):
+    """
+    Returns the first day of the period numbered number (see period_numbers).
+    """
+    number = int(number)
+    if period == 'day':
+        return datetime.date.fromordinal(number)
+    if period == 'week':
+        return datetime.date.fromordinal(7*number + 1)
+    return datetime.date(1970 + number//12, number % 12 + 1, 1)
+
+
+class Rollups(object):
+    """
+    Running totals of an athlete's activities per day, week (starting Mondays) and month for each activity type (see ROLLUP_STATS, plus minutes in each zone), kept current as activities are added and removed.
+    """
+    def __init__(self, n_zones):
+        self.n_zones = n_zones
+        self.types = []
+        self.first = dict((period, None) for period in PERIODS)
+        self.totals = dict((period, np.zeros((0, 0, len(ROLLUP_STATS) + n_zones))) for period in PERIODS)
+
+    @classmethod
+    def from_history(cls, history, n_zones):
+        rollups = cls(n_zones)
+        rollups.add_history(history)
+        return rollups
+
+    def add(self, activities, sign=1):
+        """
+        Adds each activity (Activity_Stats, or a row of an Activity_History) to the day, week and month it was recorded in, or subtracts them with sign=-1.
+        """
+        activities = [activity for activity in activities if activity.date is not None]
+        if not activities:
+            return
+        for activity in activities:
+            if activity.type not in self.types:
+                self.types.append(activity.type)
+        values = np.zeros((len(activities), len(ROLLUP_STATS) + self.n_zones))
+        values[:, 0] = 1
+        for i, activity in enumerate(activities):
+            for j, stat in enumerate(ROLLUP_STATS[1:]):
+                values[i, j+1] = getattr(activity, stat) or 0
+            if activity.time_in_zones and len(activity.time_in_zones) == self.n_zones:
+                values[i, len(ROLLUP_STATS):] = activity.time_in_zones
+        days = np.array([activity.date.date().toordinal() for activity in activities])
+        codes = np.array([self.types.index(activity.type) for activity in activities])
+        self.add_cells(days, codes, np.nan_to_num(values), sign)
+
+    def remove(self, activities):
+        self.add(activities, sign=-1)
+
+    def add_history(self, history):
+        """
+        Adds every activity of an Activity_History, reading its columns directly rather than going through per-activity rows.
+        """
+        if not len(history):
+            return
+        for act_type in history.types:
+            if act_type not in self.types:
+                self.types.append(act_type)
+        values = np.zeros((len(history), len(ROLLUP_STATS) + self.n_zones))
+        values[:, 0] = 1
+        for j, stat in enumerate(ROLLUP_STATS[1:]):
+            values[:, j+1] = history.stats[stat]
+        if history.zone_times.shape[1] >= self.n_zones:
+            zone_times = history.zone_times[:, :self.n_zones].astype(np.float64)
+            # Activities without a time for every zone don't count towards time in zones
+            values[:, len(ROLLUP_STATS):] = np.where(np.isnan(zone_times).any(axis=1)[:, None], 0., zone_times)
+        codes = np.array([self.types.index(act_type) for act_type in history.types])[history.type_codes]
+        self.add_cells(history.day_ordinals(), codes, np.nan_to_num(values))
+
+    def add_cells(self, days, codes, values, sign=1):
+        """
+        Adds rows of values (activities x columns) into the periods containing the days (an array of ordinals) and the activity types given by codes.
+        """
+        for period in PERIODS:
+            numbers = period_numbers(days, period)
+            self.extend(period, int(numbers.min()), int(numbers.max()))
+            np.add.at(self.totals[period], (numbers - self.first[period], codes), sign*values)
+
+    def extend(self, period, first, last):
+        """
+        Grows the array of period (with zeros) so it covers periods numbered first to last and every known activity type.
+        """
+        totals = self.totals[period]
+        if self.first[period] is None:
+            self.first[period] = first
+        n_before = max(self.first[period] - first, 0)
+        n_after = max(last - self.first[period] + 1 - len(totals), 0)
+        n_new_types = len(self.types) - totals.shape[1]
+        if n_before or n_after or n_new_types:
+            self.totals[period] = np.pad(totals, ((n_before, n_after), (0, n_new_types), (0, 0)), 'constant')
+            self.first[period] -= n_before
+
+    def type_totals(self, period, act_type='cardio', lo=0, hi=None):
+        """
+        Returns array of periods x columns of the totals of act_type ('cardio' for all activities combined), over rows lo to hi (exclusive) of the array of period.
+        """
+        totals = self.totals[period][lo:hi]
+        if act_type == 'cardio':
+            return totals.sum(axis=1)
+        if act_type in self.types:
+            return totals[:, self.types.index(act_type)]
+        return np.zeros((len(totals), totals.shape[2]))
+
+    def sum_periods(self, period, first, last, act_type='cardio'):
+        """
+        Returns array of the totals of act_type over the periods numbered first to last inclusive.
+        """
+        if self.first[period] is None:
+            return np.zeros(len(ROLLUP_STATS) + self.n_zones)
+        n_rows = len(self.totals[period])
+        lo = min(max(first - self.first[period], 0), n_rows)
+        hi = min(max(last - self.first[period] + 1, 0), n_rows)
+        return self.type_totals(period, act_type, lo, hi).sum(axis=0)
+
+    def window(self, start, end, act_type='cardio'):
+        """
+        Returns dict of the totals of act_type over the days from start to end inclusive: the number of activities, training load, distance and elevation gain, and time_in_zones (list of minutes in each zone). Whole months inside the window are read from the monthly rollup and only the days left over at either end from the daily one, so the cost depends on the window's length in months rather than on the activities in it.
+        """
+        start, end = start.toordinal(), end.toordinal()
+        first_month, last_month = period_numbers([start, end + 1], 'month')
+        # Months starting on or after start and ending on or before end
+        if period_start(first_month, 'month').toordinal() != start:
+            first_month += 1
+        last_month -= 1
+        if first_month <= last_month:
+            values = self.sum_periods('month', first_month, last_month, act_type) + \
+                     self.sum_periods('day', start, period_start(first_month, 'month').toordinal() - 1, act_type) + \
+                     self.sum_periods('day', period_start(last_month + 1, 'month').toordinal(), end, act_type)
+        else:
+            values = self.sum_periods('day', start, end, act_type)
+        return self.as_dict(values)
+
+    def as_dict(self, values):
+        totals = dict(zip(ROLLUP_STATS, values.tolist()))
+        totals['activities'] = int(round(totals['activities']))
+        totals['time_in_zones'] = [int(minutes) for minutes in np.round(values[len(ROLLUP_STATS):])]
+        return totals
+
+    def series(self, period='week', act_type='cardio', start=None, end=None):
+        """
+        Returns dict of the totals of act_type in each period ('day', 'week' or 'month') covering start to end (default from the first activity through today): 'start' (list of the first day of each period), an array for each of ROLLUP_STATS, and 'time_in_zones' (array of periods x zones).
+        """
+        if start is None and self.first[period] is None:
+            return self.as_series(period, np.zeros((0, len(ROLLUP_STATS) + self.n_zones)), 0)
+        first = period_numbers([start.toordinal()], period)[0] if start is not None else self.first[period]
+        last = period_numbers([(end or datetime.date.today()).toordinal()], period)[0]
+        values = np.zeros((max(last - first + 1, 0), len(ROLLUP_STATS) + self.n_zones))
+        if self.first[period] is not None:
+            lo, hi = max(first, self.first[period]), min(last, self.first[period] + len(self.totals[period]) - 1)
+            if lo <= hi:
+                values[lo-first:hi-first+1] = self.type_totals(period, act_type, lo-self.first[period], hi-self.first[period]+1)
+        return self.as_series(period, values, first)
+
+    def as_series(self, period, values, first):
+        series = dict((stat, values[:, j]) for j, stat in enumerate(ROLLUP_STATS))
+        series['start'] = [period_start(first + i, period) for i in range(len(values))]
+        series['time_in_zones'] = values[:, len(ROLLUP_STATS):]
+        return series
+
+    def zone_percentages(self, period='week', act_type='cardio', start=None, end=None):
+        """
+        Returns tuple of (list of period start days, array of periods x zones of the percentage of each period's heart rate data spent in each zone), NaN for periods without any, i.e. the activity profile over time.
+        """
+        series = self.series(period, act_type, start, end)
+        minutes = series['time_in_zones']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return series['start'], 100*minutes/minutes.sum(axis=1)[:, None]
@@ -0,0 +1,235 @@
+import datetime
+import numpy as np
+from fitness_model import daily_fitness_fatigue_form
+
+METRICS = ['fitness', 'fatigue', 'form']
+
+
+def as_date(day):
+    return day.date() if isinstance(day, datetime.datetime) else day
+
+
+class Scenario(object):
+    """
+    A hypothetical change to an athlete's training: workouts added (e.g. a planned training block) or removed, and recorded training scaled up or down (e.g. taper options), each given by day and optionally activity type. Methods return the scenario, so changes can be chained:
+
+        Scenario('taper').scale(race_day - 14, race_day - 1, 0.6).add(race_day, 150, 'cycling')
+
+    A Scenario only records the changes; Scenario_Engine.evaluate turns them into daily load deltas.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.changes = []
+
+    def add(self, day, training_load=None, act_type=None, time_in_zones=None):
+        """
+        Adds a hypothetical workout on day with the given training_load, or with the training load accumulated by minutes time_in_zones (at the athlete's points_per_min). Without an act_type it only counts towards 'cardio'.
+        """
+        self.changes.append(('add', as_date(day), act_type, training_load, time_in_zones))
+        return self
+
+    def plan(self, start, daily_loads, act_type=None):
+        """
+        Adds a block of hypothetical training: daily_loads[i] of act_type on the i-th day from start (zero for rest days).
+        """
+        for i, load in enumerate(daily_loads):
+            if load:
+                self.add(as_date(start) + datetime.timedelta(days=i), load, act_type)
+        return self
+
+    def remove(self, date):
+        """
+        Removes the recorded activity at date (a datetime, as in activity_history).
+        """
+        self.changes.append(('remove', date))
+        return self
+
+    def scale(self, start, end, factor, act_type=None):
+        """
+        Scales the recorded training load (of act_type, or of all activities) on every day from start to end inclusive by factor; 0 hides those workouts. Hypothetical workouts added by this or other changes are not scaled, and workouts this scenario removes aren't either.
+        """
+        self.changes.append(('scale', as_date(start), as_date(end), factor, act_type))
+        return self
+
+    def last_day(self):
+        """
+        Returns the last day changed by a hypothetical workout or scaling, or None.
+        """
+        days = [change[1] for change in self.changes if change[0] == 'add'] + [change[2] for change in self.changes if change[0] == 'scale']
+        return max(days) if days else None
+
+
+class Scenario_Engine(object):
+    """
+    Evaluates batches of Scenarios against an athlete's recorded training, filtering the daily load changes of every scenario in one pass and adding them to the baseline series. Create a new engine after adding or removing activities.
+    """
+    def __init__(self, athlete, act_types=('cardio', 'cycling', 'running'), end=None):
+        self.act_types = list(act_types)
+        self.daily_loads = athlete.daily_loads
+        self.points_per_min = athlete.points_per_min
+        self.activity_history = athlete.activity_history
+        self.end = as_date(end) if end is not None else datetime.date.today()
+        self.start = self.daily_loads.start if self.daily_loads.start is not None else min(datetime.date.today(), self.end)
+        if self.daily_loads.start is not None:
+            self.loads = self.daily_loads.matrix(self.act_types, self.end)
+        else:
+            self.loads = np.zeros(((self.end - self.start).days + 1, len(self.act_types)))
+        self.baseline = dict(zip(METRICS, daily_fitness_fatigue_form(self.loads)))
+
+    @property
+    def days(self):
+        return [self.start + datetime.timedelta(days=i) for i in range(len(self.loads))]
+
+    def day_index(self, day):
+        index = (as_date(day) - self.start).days
+        if not 0 <= index < len(self.loads):
+            raise ValueError('{} is outside the days modelled ({} to {}); create the engine with a later end to plan further ahead'.format(day, self.start, self.end))
+        return index
+
+    def type_loads(self, act_type):
+        """
+        Returns array of recorded daily training loads of act_type (all activities if None) over the days modelled.
+        """
+        act_type = act_type or 'cardio'
+        if act_type in self.act_types:
+            return self.loads[:, self.act_types.index(act_type)]
+        if self.daily_loads.start is None:
+            return np.zeros(len(self.loads))
+        return self.daily_loads.matrix([act_type], self.end)[:, 0]
+
+    def day_indices(self, days):
+        indices = np.array([as_date(day).toordinal() for day in days], dtype=np.int64) - self.start.toordinal()
+        outside = (indices < 0) | (indices >= len(self.loads))
+        if outside.any():
+            self.day_index(days[int(np.argmax(outside))])
+        return indices
+
+    def cells(self, scenarios):
+        """
+        Returns tuple of (scenario indices, day indices, column indices, load deltas) arrays of the changes of every scenario. Single-day changes (workouts added or removed) are gathered across all scenarios and converted to cells together; each scaling is a run of consecutive days.
+        """
+        single_days = []
+        runs = []
+        # (day index, type, load) of the activities each scenario removes, which its scalings leave out
+        removals = {}
+        for i, scenario in enumerate(scenarios):
+            for change in scenario.changes:
+                kind = change[0]
+                if kind == 'add':
+                    day, act_type, training_load, time_in_zones = change[1:]
+                    if training_load is None:
+                        training_load = sum([minutes*rate for minutes, rate in zip(time_in_zones or [], self.points_per_min)])
+                    single_days.append((i, day, act_type, training_load))
+                elif kind == 'remove':
+                    activity = self.activity_history.get(change[1])
+                    if activity is None:
+                        raise KeyError('No activity recorded at {}'.format(change[1]))
+                    single_days.append((i, activity.date, activity.type, -(activity.training_load or 0)))
+                    removals.setdefault(i, []).append(((activity.date.date() - self.start).days, activity.type, activity.training_load or 0))
+                elif kind == 'scale':
+                    runs.append((i,) + change[1:])
+
+        pieces = []
+        if single_days:
+            scenario_indices, days, act_types, loads = zip(*single_days)
+            scenario_indices = np.array(scenario_indices, dtype=np.int64)
+            days = self.day_indices(days)
+            loads = np.array(loads, dtype=np.float64)
+            act_types = np.array(act_types, dtype=object)
+            for column, column_type in enumerate(self.act_types):
+                rows = np.arange(len(days)) if column_type == 'cardio' else np.flatnonzero(act_types == column_type)
+                pieces.append((scenario_indices[rows], days[rows], np.full(len(rows), column, dtype=np.int64), loads[rows]))
+        for i, start, end, factor, act_type in runs:
+            first, last = self.day_index(max(start, self.start)), self.day_index(min(end, self.end))
+            days = np.arange(first, last+1)
+            for column, column_type in enumerate(self.act_types):
+                if act_type is None:
+                    # Every modelled column scales by the same factor
+                    loads = self.loads[first:last+1, column] - self.removed_loads(removals.get(i, []), first, last, column_type)
+                elif column_type in ('cardio', act_type):
+                    loads = self.type_loads(act_type)[first:last+1] - self.removed_loads(removals.get(i, []), first, last, act_type)
+                else:
+                    continue
+                pieces.append((np.full(len(days), i, dtype=np.int64), days, np.full(len(days), column, dtype=np.int64), (factor - 1)*loads))
+        if not pieces:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, np.zeros(0)
+        return tuple(np.concatenate(arrays) for arrays in zip(*pieces))
+
+    def removed_loads(self, removals, first, last, act_type='cardio'):
+        """
+        Returns array of the training load of act_type ('cardio' for all activities) removed on each day from index first to last, from a list of (day index, type, load) removals.
+        """
+        loads = np.zeros(last - first + 1)
+        for day, removed_type, load in removals:
+            if first <= day <= last and act_type in ('cardio', removed_type):
+                loads[day - first] += load
+        return loads
+
+    def evaluate(self, scenarios, start=None):
+        """
+        Returns Scenario_Results of the projected daily fitness, fatigue and form of every scenario in scenarios, over the days from start (default the first day any scenario changes) through the engine's end.
+        """
+        scenarios = list(scenarios)
+        scenario_indices, days, columns, loads = self.cells(scenarios)
+        # Deltas are filtered from the first changed day, even if results are wanted only from a later start
+        origin = int(days.min()) if len(days) else len(self.loads) - 1
+        first = self.day_index(start) if start is not None else origin
+        origin = min(origin, first)
+        deltas = np.zeros((len(self.loads) - origin, len(scenarios), len(self.act_types)))
+        np.add.at(deltas, (days - origin, scenario_indices, columns), loads)
+        values = {}
+        for metric, delta in zip(METRICS, daily_fitness_fatigue_form(deltas)):
+            values[metric] = self.baseline[metric][first:, None, :] + delta[first-origin:]
+        return Scenario_Results(self, scenarios, first, values)
+
+
+class Scenario_Results(object):
+    """
+    Projected daily fitness, fatigue and form of a batch of scenarios: values maps each metric to an array of shape (days, scenarios, act_types), starting at start, and baseline to the matching (days, act_types) array without any changes.
+    """
+    def __init__(self, engine, scenarios, first, values):
+        self.names = [scenario.name if scenario.name is not None else i for i, scenario in enumerate(scenarios)]
+        self.act_types = engine.act_types
+        self.start = engine.start + datetime.timedelta(days=first)
+        self.values = values
+        self.baseline = dict((metric, engine.baseline[metric][first:]) for metric in METRICS)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def days(self):
+        return [self.start + datetime.timedelta(days=i) for i in range(len(self.values['fitness']))]
+
+    def day_index(self, day):
+        index = (as_date(day) - self.start).days
+        if not 0 <= index < len(self.values['fitness']):
+            raise ValueError('{} is outside the days evaluated ({} to {})'.format(day, self.start, self.days[-1]))
+        return index
+
+    def series(self, metric, act_type='cardio'):
+        """
+        Returns array of daily values of metric ('fitness', 'fatigue' or 'form') for act_type, of shape (days, scenarios).
+        """
+        return self.values[metric][:, :, self.act_types.index(act_type)]
+
+    def change(self, metric, act_type='cardio'):
+        """
+        Returns array of each scenario's daily change in metric from the baseline, of shape (days, scenarios).
+        """
+        return self.series(metric, act_type) - self.baseline[metric][:, self.act_types.index(act_type), None]
+
+    def on(self, day, metric, act_type='cardio'):
+        """
+        Returns array of each scenario's value of metric on day.
+        """
+        return self.series(metric, act_type)[self.day_index(day)]
+
+    def best(self, day, metric='form', act_type='cardio'):
+        """
+        Returns tuple of (name, value) of the scenario with the highest value of metric on day, e.g. the taper leaving the most form on race day.
+        """
+        values = self.on(day, metric, act_type)
+        i = int(np.argmax(values))
+        return self.names[i], values[i]
@@ -0,0 +1,132 @@
+import datetime
+import numpy as np
+import pandas as pd
+from fitness_model import windowed_exponential_sum
+
+# The sleep score compares exponentially weighted average sleep over the last 3 nights with that over the last 4 weeks
+RECENT_NIGHTS = 3
+BASELINE_NIGHTS = 28
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def read_sleep_csv(filepath):
+    """
+    Returns tuple of (day ordinals, minutes) arrays of the nights in a .csv of sleep data downloaded from Garmin Connect (two header rows, then one row per night with its date in the first column and sleep in the second), skipping rows without a readable date or amount of sleep.
+    """
+    sleep_df = pd.read_csv(filepath, skiprows=[0, 1])
+    dates = pd.to_datetime(sleep_df.iloc[:, 0], errors='coerce')
+    minutes = pd.to_numeric(sleep_df.iloc[:, 1], errors='coerce')
+    valid = (dates.notnull() & minutes.notnull()).values
+    days = dates.values[valid].astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    return days, minutes.values[valid].astype(np.float64)
+
+
+def sleep_scores(minutes):
+    """
+    Returns array of sleep scores from array of nightly sleep on consecutive days along the first axis (NaN for nights without data), which may have further axes (e.g. one column per athlete). The score on each day is the exponentially weighted average sleep of the last 3 nights as a percentage of that of the last 28, averaging over the nights with data, and is NaN until 3 nights have been recorded or when none of the last 3 were.
+    """
+    minutes = np.asarray(minutes, dtype=np.float64)
+    recorded = ~np.isnan(minutes)
+    filled = np.where(recorded, minutes, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recent = windowed_exponential_sum(filled, RECENT_NIGHTS)/windowed_exponential_sum(recorded, RECENT_NIGHTS)
+        baseline = windowed_exponential_sum(filled, BASELINE_NIGHTS)/windowed_exponential_sum(recorded, BASELINE_NIGHTS)
+        scores = np.round(100*recent/baseline, 1)
+    scores[np.cumsum(recorded, axis=0) < RECENT_NIGHTS] = np.nan
+    return scores
+
+
+class Sleep_History(object):
+    """
+    Nightly sleep keyed by date, held as sorted arrays of day ordinals and minutes slept. Nights from any number of (possibly overlapping) Garmin Connect exports are merged in with merge or add_csv: nights already recorded are updated in place from the newer export and only the rest are inserted, so re-importing an overlapping 28-day export costs a searchsorted rather than a rebuild. The days of nights added or changed since the history was last saved are kept in dirty, so an Athlete_Store writes just those.
+    """
+    def __init__(self, days=None, minutes=None):
+        self.days = np.zeros(0, dtype=np.int64)
+        self.minutes = np.zeros(0)
+        self.dirty = set()
+        if days is not None and len(days):
+            self.merge(days, minutes)
+
+    @classmethod
+    def from_undated(cls, minutes, last_day):
+        """
+        Returns Sleep_History of a list of consecutive nights without dates (as kept by older versions), the last of them on last_day.
+        """
+        days = last_day.toordinal() - np.arange(len(minutes))[::-1]
+        return cls(days, minutes)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        """
+        Yields (date, minutes) pairs, oldest first.
+        """
+        for day, minutes in zip(self.days, self.minutes):
+            yield datetime.date.fromordinal(int(day)), minutes
+
+    def nights(self, days=None):
+        """
+        Returns list of (date, minutes) pairs of the nights on days (day ordinals, default every night recorded), oldest first.
+        """
+        if days is None:
+            return list(self)
+        days = np.array(sorted(days), dtype=np.int64)
+        positions = np.searchsorted(self.days, days)
+        return [(datetime.date.fromordinal(int(day)), self.minutes[position]) for day, position in zip(days, positions)]
+
+    @property
+    def start(self):
+        return datetime.date.fromordinal(int(self.days[0])) if len(self.days) else None
+
+    def merge(self, days, minutes):
+        """
+        Merges nights given as arrays of day ordinals and minutes (later entries winning over earlier ones for the same day), and returns the number of nights which were new or changed.
+        """
+        days = np.asarray(days, dtype=np.int64)
+        minutes = np.asarray(minutes, dtype=np.float64)
+        # Keep the last entry for each day, sorted by day
+        days, last = np.unique(days[::-1], return_index=True)
+        minutes = minutes[::-1][last]
+        positions = np.searchsorted(self.days, days)
+        existing = positions < len(self.days)
+        existing[existing] = self.days[positions[existing]] == days[existing]
+        changed = self.minutes[positions[existing]] != minutes[existing]
+        self.minutes[positions[existing]] = minutes[existing]
+        new = ~existing
+        self.dirty.update(days[existing][changed].tolist())
+        self.dirty.update(days[new].tolist())
+        if new.any():
+            if not len(self.days) or days[new][0] > self.days[-1]:
+                # Common case of a newer export: append
+                self.days = np.concatenate([self.days, days[new]])
+                self.minutes = np.concatenate([self.minutes, minutes[new]])
+            else:
+                self.days = np.insert(self.days, positions[new], days[new])
+                self.minutes = np.insert(self.minutes, positions[new], minutes[new])
+        return np.count_nonzero(changed) + np.count_nonzero(new)
+
+    def add_csv(self, filepath):
+        """
+        Merges in the nights of a .csv of sleep data downloaded from Garmin Connect, and returns the number which were new or changed.
+        """
+        return self.merge(*read_sleep_csv(filepath))
+
+    def daily_minutes(self, start=None, end=None):
+        """
+        Returns array of minutes slept on each day from start (default the first night recorded) through end (default the last night recorded), NaN for nights without data.
+        """
+        if not len(self.days) and (start is None or end is None):
+            return np.zeros(0)
+        start = self.days[0] if start is None else start.toordinal()
+        end = self.days[-1] if end is None else end.toordinal()
+        minutes = np.full(max(end - start + 1, 0), np.nan)
+        inside = (self.days >= start) & (self.days <= end)
+        minutes[self.days[inside] - start] = self.minutes[inside]
+        return minutes
+
+    def scores(self, end=None):
+        """
+        Returns array of the sleep score on each day from the first night recorded through end (default the last night recorded); see sleep_scores.
+        """
+        return sleep_scores(self.daily_minutes(end=end))
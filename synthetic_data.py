@@ -0,0 +1,183 @@
+import os
+import datetime
+import numpy as np
+from calculate_stats import POINTS_PER_MIN
+
+# Namespace prefix each creator uses for Garmin's TrackPointExtension, and the timestamp format of its trackpoints
+GPX_CREATORS = {'Garmin Connect': ('ns3', '%Y-%m-%dT%H:%M:%S.000Z'),
+                'StravaGPX': ('gpxtpx', '%Y-%m-%dT%H:%M:%SZ')}
+
+# Typical moving speed (meters/sec), cadence, and TCX Sport of each activity type
+ACTIVITY_PROFILES = {'running': {'speed': 3.0, 'cadence': 85, 'sport': 'Running'},
+                     'cycling': {'speed': 7.5, 'cadence': 90, 'sport': 'Biking'}}
+
+DEFAULT_ZONES = [113, 150, 168, 187]
+
+
+def recording_intervals(rng, n_seconds, smart_recording):
+    """
+    Returns array of seconds between successive trackpoints covering n_seconds: every second, or with smart_recording the irregular 1-8 second spacing Garmin devices use to save space.
+    """
+    if smart_recording:
+        intervals = rng.choice([1, 1, 2, 3, 4, 5, 6, 8], size=n_seconds)
+    else:
+        intervals = np.ones(n_seconds, dtype=np.int64)
+    return intervals[:np.searchsorted(np.cumsum(intervals), n_seconds)+1]
+
+
+def heart_rates(rng, elapsed, hr_dropout):
+    """
+    Returns array of heart rates at elapsed seconds: rising from rest towards a working level over the first few minutes, with slow intervals, drift and noise. With hr_dropout > 0 that fraction of trackpoints fall in runs of missing readings (NaN), as when a strap loses contact.
+    """
+    n = len(elapsed)
+    hr = 95 + 55*(1 - np.exp(-elapsed/180.)) + 15*np.sin(elapsed/600.)**2 + elapsed/3600. + rng.normal(0, 2, n)
+    hr = np.clip(np.round(hr), 60, 200)
+    if hr_dropout > 0:
+        run_length = 30
+        starts = np.flatnonzero(rng.random_sample(n) < hr_dropout/run_length)
+        missing = np.zeros(n, dtype=bool)
+        for start in starts:
+            missing[start:start+rng.randint(5, 2*run_length)] = True
+        hr[missing] = np.nan
+    return hr
+
+
+def track(rng, intervals, act_type, stops=True):
+    """
+    Returns tuple of (lat, lon, elevation) arrays of a route travelled at the typical speed of act_type, turning gradually over rolling terrain and (with stops) occasionally stopping.
+    """
+    n = len(intervals)
+    speeds = ACTIVITY_PROFILES[act_type]['speed']*(1 + 0.1*rng.normal(size=n))
+    if stops:
+        speeds[rng.random_sample(n) < 0.01] = 0
+    meters = np.clip(speeds, 0, None)*intervals
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    lat = 37.77 + np.cumsum(meters*np.cos(heading))/111320.
+    lon = -122.42 + np.cumsum(meters*np.sin(heading))/(111320.*np.cos(np.radians(37.77)))
+    elevation = 50 + np.cumsum(rng.normal(0, 0.3, n)) + 20*np.sin(np.cumsum(meters)/2000.)
+    return lat, lon, elevation
+
+
+def write_gpx(filepath, creator='Garmin Connect', act_type='running', start=None, minutes=30, gps=True, hr_dropout=0., cadence=True, smart_recording=False, seed=0):
+    """
+    Writes a synthetic .gpx activity file in the format Garmin Connect or Strava ('StravaGPX') exports, lasting minutes, with (or without) GPS positions, heart rate dropouts (see heart_rates), cadence, and 1 second or smart recording intervals. Returns the number of trackpoints written.
+    """
+    rng = np.random.RandomState(seed)
+    prefix, time_format = GPX_CREATORS[creator]
+    if start is None:
+        start = datetime.datetime(2017, 3, 1, 8, 0, 0)
+    intervals = recording_intervals(rng, int(minutes*60), smart_recording)
+    elapsed = np.cumsum(intervals)
+    hr = heart_rates(rng, elapsed, hr_dropout)
+    lat, lon, elevation = track(rng, intervals, act_type)
+    cadences = ACTIVITY_PROFILES[act_type]['cadence'] + rng.randint(-3, 4, len(intervals))
+    temps = 20 + elapsed/7200.
+    with open(filepath, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx creator="{}" version="1.1" xmlns="http://www.topografix.com/GPX/1/1" '
+                'xmlns:{}="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'.format(creator, prefix))
+        f.write(' <metadata>\n  <time>{}</time>\n </metadata>\n'.format(start.strftime(time_format)))
+        f.write(' <trk>\n  <name>Synthetic {}</name>\n  <type>{}</type>\n  <trkseg>\n'.format(act_type, act_type))
+        for i, seconds in enumerate(elapsed):
+            position = ' lat="{:.7f}" lon="{:.7f}"'.format(lat[i], lon[i]) if gps else ''
+            extensions = '<{0}:atemp>{1:.1f}</{0}:atemp>'.format(prefix, temps[i])
+            if not np.isnan(hr[i]):
+                extensions += '<{0}:hr>{1:d}</{0}:hr>'.format(prefix, int(hr[i]))
+            if cadence:
+                extensions += '<{0}:cad>{1:d}</{0}:cad>'.format(prefix, int(cadences[i]))
+            time = (start + datetime.timedelta(seconds=int(seconds))).strftime(time_format)
+            f.write('   <trkpt{}>\n    <ele>{:.1f}</ele>\n    <time>{}</time>\n    <extensions>\n     <{}:TrackPointExtension>{}</{}:TrackPointExtension>\n    </extensions>\n   </trkpt>\n'
+                    .format(position, elevation[i], time, prefix, extensions, prefix))
+        f.write('  </trkseg>\n </trk>\n</gpx>\n')
+    return len(elapsed)
+
+
+def write_tcx(filepath, act_type='cycling', start=None, minutes=30, hr_dropout=0., smart_recording=False, seed=0):
+    """
+    Writes a synthetic .tcx activity file as exported by Garmin Connect for an activity recorded without GPS (e.g. on a stationary bike, the only kind of .tcx file parse_tcx reads), lasting minutes. Returns the number of trackpoints written.
+    """
+    rng = np.random.RandomState(seed)
+    time_format = '%Y-%m-%dT%H:%M:%S.000Z'
+    if start is None:
+        start = datetime.datetime(2017, 3, 2, 8, 0, 0)
+    intervals = recording_intervals(rng, int(minutes*60), smart_recording)
+    elapsed = np.cumsum(intervals)
+    hr = heart_rates(rng, elapsed, hr_dropout)
+    with open(filepath, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">\n <Activities>\n')
+        f.write('  <Activity Sport="{}">\n   <Id>{}</Id>\n   <Lap StartTime="{}">\n    <TotalTimeSeconds>{:.1f}</TotalTimeSeconds>\n    <Track>\n'
+                .format(ACTIVITY_PROFILES[act_type]['sport'], start.strftime(time_format), start.strftime(time_format), float(elapsed[-1])))
+        for i, seconds in enumerate(elapsed):
+            time = (start + datetime.timedelta(seconds=int(seconds))).strftime(time_format)
+            f.write('     <Trackpoint>\n      <Time>{}</Time>\n'.format(time))
+            if not np.isnan(hr[i]):
+                f.write('      <HeartRateBpm>\n       <Value>{:d}</Value>\n      </HeartRateBpm>\n'.format(int(hr[i])))
+            f.write('     </Trackpoint>\n')
+        f.write('    </Track>\n   </Lap>\n  </Activity>\n </Activities>\n</TrainingCenterDatabase>\n')
+    return len(elapsed)
+
+
+def write_activity_folder(directory, n_activities, end=None, minutes=30, seed=0):
+    """
+    Writes n_activities synthetic activity files (a mix of Garmin Connect and Strava .gpx runs and rides, and .tcx indoor rides) to directory, one per day up to end (default today). Returns list of the filepaths written.
+    """
+    rng = np.random.RandomState(seed)
+    if end is None:
+        end = datetime.date.today()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filepaths = []
+    for i in range(n_activities):
+        day = end - datetime.timedelta(days=n_activities-1-i)
+        start = datetime.datetime.combine(day, datetime.time(7, 0)) + datetime.timedelta(minutes=int(rng.randint(0, 600)))
+        kind = i % 5
+        if kind == 4:
+            filepath = os.path.join(directory, 'activity_{:05d}.tcx'.format(i))
+            write_tcx(filepath, start=start, minutes=minutes, seed=seed+i)
+        else:
+            filepath = os.path.join(directory, 'activity_{:05d}.gpx'.format(i))
+            write_gpx(filepath, creator=['Garmin Connect', 'StravaGPX'][kind % 2], act_type=['running', 'cycling'][kind//2],
+                      start=start, minutes=minutes, hr_dropout=0.02*(kind == 0), smart_recording=kind == 2, seed=seed+i)
+        filepaths.append(filepath)
+    return filepaths
+
+
+class Synthetic_Activity(object):
+    """
+    Activity summary with the attributes of an Activity_Stats, for building large athlete histories without writing and parsing activity files.
+    """
+    def __init__(self, date, act_type, minutes, time_in_zones, points_per_min=POINTS_PER_MIN):
+        self.name = 'Synthetic {}'.format(act_type)
+        self.type = act_type
+        self.creator = 'Synthetic'
+        self.date = date
+        self.zones = DEFAULT_ZONES
+        self.time_in_zones = time_in_zones
+        self.training_load = int(sum([minutes_in_zone*rate for minutes_in_zone, rate in zip(time_in_zones, points_per_min)]))
+        self.total_distance_2d = ACTIVITY_PROFILES[act_type]['speed']*minutes*60/1609.34
+        self.total_distance_3d = self.total_distance_2d*1.001
+        self.avg_speed_2d = ACTIVITY_PROFILES[act_type]['speed']*3600/1609.34
+        self.avg_speed_3d = self.avg_speed_2d*1.001
+        self.elevation_gain = minutes*3.
+        self.elevation_loss = minutes*3.
+
+
+def synthetic_history(n_activities, end=None, seed=0):
+    """
+    Returns list of n_activities Synthetic_Activity summaries of runs and rides lasting 20 minutes to 5 hours, about one a day (with some doubles and rest days) up to end (default now), oldest first.
+    """
+    rng = np.random.RandomState(seed)
+    if end is None:
+        end = datetime.datetime.now()
+    n_days = int(n_activities*1.1) + 1
+    # Adding the rank keeps the sorted offsets distinct, since activities are identified by their dates
+    offsets = (np.sort(rng.randint(0, n_days*86400, n_activities)) + np.arange(n_activities))[::-1]
+    activities = []
+    for offset in offsets:
+        date = (end - datetime.timedelta(seconds=int(offset))).replace(microsecond=0)
+        act_type = ['running', 'cycling'][rng.randint(2)]
+        minutes = int(np.exp(rng.uniform(np.log(20), np.log(300))))
+        shares = rng.dirichlet([3, 4, 2, 1, 0.2])
+        activities.append(Synthetic_Activity(date, act_type, minutes, [int(round(share*minutes)) for share in shares]))
+    return activities
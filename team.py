@@ -0,0 +1,233 @@
+import os
+import glob
+import datetime
+import numpy as np
+from instrumentation import stage
+from utils import load_saved_athlete
+from class_defs import Athlete, parse_activity_files, activity_stats_or_error, error_message
+from fitness_model import daily_fitness_fatigue_form
+from sleep import sleep_scores
+
+METRICS = ['fitness', 'fatigue', 'form']
+
+# Fatigue (acute load) above this multiple of fitness (chronic load) marks an athlete as over-fatigued
+FATIGUE_RATIO = 1.5
+
+
+class Team(object):
+    """
+    A squad of Athletes whose daily training loads are held together in one array (days x athletes x activity types, on a shared calendar from the oldest activity of any athlete through today), so that fitness, fatigue and form for every athlete and activity type are computed in a single vectorized pass (see update), and cross-athlete queries (team averages, rankings, who is over-fatigued) are array reductions rather than loops over Athlete objects.
+
+    After update, fitness, fatigue and form map to arrays of shape (days, athletes, columns), columns being 'cardio' (all activities combined) followed by each activity type, computed the same way as each athlete's daily fitness/fatigue/form histories; the current values are those of the last day. Likewise sleep_scores holds daily sleep scores (days x athletes, on its own calendar from the first night anyone recorded, starting at sleep_start), and sleep each athlete's latest sleep score (NaN for athletes without sleep data).
+
+    Athletes' own fitness attributes are not updated by the team; call an athlete's update_fitness_values to refresh them.
+    """
+    def __init__(self, athletes=None):
+        self.names = []
+        self.athletes = []
+        self.start = None
+        self.types = []
+        self.loads = np.zeros((0, 0, 0))
+        self.values = dict((metric, np.zeros((0, 0, 1))) for metric in METRICS)
+        self.sleep_start = None
+        self.sleep_scores = np.zeros((0, 0))
+        self.sleep = np.zeros(0)
+        for name, athlete in sorted((athletes or {}).items()):
+            self.add_athlete(name, athlete)
+        if self.athletes:
+            self.update()
+
+    def __len__(self):
+        return len(self.athletes)
+
+    def __getitem__(self, name):
+        return self.athletes[self.names.index(name)]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    @property
+    def columns(self):
+        return ['cardio'] + self.types
+
+    @property
+    def days(self):
+        """
+        Returns list of the dates of each row of the daily arrays.
+        """
+        if self.start is None:
+            return []
+        return [self.start + datetime.timedelta(days=i) for i in range(len(self.loads))]
+
+    def add_athlete(self, name, athlete=None, **kwargs):
+        """
+        Adds athlete to the team as name (replacing any athlete already of that name), creating an Athlete from kwargs (max_hr, zones, ...) if none is given, and returns it. Call update (or add_folders) to include it in the team's values.
+        """
+        if athlete is None:
+            athlete = Athlete(**kwargs)
+        if name in self.names:
+            self.athletes[self.names.index(name)] = athlete
+        else:
+            self.names.append(name)
+            self.athletes.append(athlete)
+        return athlete
+
+    def add_folders(self, folders, processes=1):
+        """
+        Adds the activity files (.gpx and .tcx) and sleep data (.csv) in each athlete's folder, given as dict mapping athlete names to folders; athletes not yet on the team are added with default settings. Headers are read first so only new activities are parsed, and with processes > 1 (or None, for one per CPU) the files of every athlete are parsed over one shared pool of worker processes. The team's values are then updated once.
+
+        Files which can't be read are printed and skipped, without stopping the rest; returns dict mapping the path of each to its error.
+        """
+        errors = {}
+        batches = []
+        with stage('Team.read_headers', points=len(folders)):
+            for name, folder in sorted(folders.items()):
+                athlete = self[name] if name in self else self.add_athlete(name)
+                filepaths = glob.glob(os.path.join(folder, '*.gpx')) + glob.glob(os.path.join(folder, '*.tcx'))
+                batches.append((athlete, athlete.new_activities(athlete.read_headers(filepaths, errors))))
+        if processes == 1:
+            parsed = [athlete.parse_headers(headers, 1, errors) for athlete, headers in batches]
+        else:
+            jobs = [job for athlete, headers in batches for job in athlete.parsing_jobs([filepath for filepath, activity in headers])]
+            results = parse_activity_files(jobs, processes, parse=activity_stats_or_error)
+            parsed = []
+            for athlete, headers in batches:
+                batch, results = results[:len(headers)], results[len(headers):]
+                parsed.append([])
+                for (filepath, header), (activity, error) in zip(headers, batch):
+                    if error is None:
+                        parsed[-1].append((filepath, activity))
+                    else:
+                        errors[filepath] = error
+        for (athlete, headers), activities in zip(batches, parsed):
+            athlete.merge_activities(activities, update=False)
+        for name, folder in sorted(folders.items()):
+            for filepath in glob.glob(os.path.join(folder, '*.csv')):
+                try:
+                    self[name].update_sleep_values(filepath)
+                except Exception as e:
+                    errors[filepath] = error_message(e)
+        for filepath in sorted(errors):
+            print "Couldn't read {}: {}".format(filepath, errors[filepath])
+        self.update()
+        return errors
+
+    def update(self, end=None):
+        """
+        Stacks every athlete's daily training loads onto the shared calendar through end (default today), and computes fitness, fatigue and form for all athletes and activity types, and all sleep scores, in one pass each.
+        """
+        if end is None:
+            end = datetime.date.today()
+        with stage('Team.update', points=len(self.athletes)):
+            self.stack_loads(end)
+            loads = np.concatenate([self.loads.sum(axis=2, keepdims=True), self.loads], axis=2)
+            self.values = dict(zip(METRICS, daily_fitness_fatigue_form(loads)))
+            self.update_sleep(end)
+
+    def stack_loads(self, end):
+        daily_loads = [athlete.daily_loads for athlete in self.athletes if athlete.daily_loads.start is not None]
+        self.types = []
+        for loads in daily_loads:
+            self.types.extend([act_type for act_type in loads.types if act_type not in self.types])
+        if not daily_loads:
+            self.start = None
+            self.loads = np.zeros((0, len(self.athletes), 0))
+            return
+        self.start = min([loads.start for loads in daily_loads])
+        n_days = (end - self.start).days + 1
+        self.loads = np.zeros((n_days, len(self.athletes), len(self.types)))
+        for i, athlete in enumerate(self.athletes):
+            loads = athlete.daily_loads
+            if loads.start is None:
+                continue
+            offset = (loads.start - self.start).days
+            rows = loads.loads[:max(n_days - offset, 0)]
+            columns = [self.types.index(act_type) for act_type in loads.types]
+            self.loads[offset:offset+len(rows), i, columns] = rows[:, :len(columns)]
+
+    def update_sleep(self, end):
+        histories = [athlete.sleep_history for athlete in self.athletes]
+        starts = [history.start for history in histories if len(history)]
+        self.sleep = np.full(len(histories), np.nan)
+        if not starts:
+            self.sleep_start = None
+            self.sleep_scores = np.zeros((0, len(histories)))
+            return
+        self.sleep_start = min(starts)
+        minutes = np.column_stack([history.daily_minutes(self.sleep_start, end) for history in histories])
+        self.sleep_scores = sleep_scores(minutes)
+        # Each athlete's latest score is on the last day with one
+        scored = ~np.isnan(self.sleep_scores)
+        last = len(scored) - 1 - np.argmax(scored[::-1], axis=0)
+        has_score = scored.any(axis=0)
+        self.sleep[has_score] = self.sleep_scores[last[has_score], np.flatnonzero(has_score)]
+
+    def day_index(self, day=None):
+        """
+        Returns the row of the daily arrays for day (default the last day).
+        """
+        if day is None:
+            return len(self.loads) - 1
+        index = (day - self.start).days
+        if not 0 <= index < len(self.loads):
+            raise ValueError('{} is outside the team\'s days ({} to {})'.format(day, self.start, self.days[-1]))
+        return index
+
+    def series(self, metric, act_type='cardio'):
+        """
+        Returns array of daily values of metric ('fitness', 'fatigue' or 'form') for act_type, of shape (days, athletes).
+        """
+        if act_type not in self.columns:
+            return np.zeros((len(self.loads), len(self.athletes)))
+        return self.values[metric][:, :, self.columns.index(act_type)]
+
+    def current(self, metric, act_type='cardio', day=None):
+        """
+        Returns array of each athlete's value of metric ('fitness', 'fatigue', 'form', or 'sleep' for sleep scores) on day (default the last day).
+        """
+        if metric == 'sleep':
+            return self.sleep
+        if not len(self.loads):
+            return np.zeros(len(self.athletes))
+        return self.series(metric, act_type)[self.day_index(day)]
+
+    def average(self, metric, act_type='cardio'):
+        """
+        Returns array of the team's average daily value of metric (or, for 'sleep', the average sleep score of athletes with sleep data).
+        """
+        if metric == 'sleep':
+            return np.nanmean(self.sleep) if np.isfinite(self.sleep).any() else np.nan
+        return self.series(metric, act_type).mean(axis=1)
+
+    def ranking(self, metric, act_type='cardio', day=None):
+        """
+        Returns list of (name, value) pairs of every athlete with a value of metric on day (default the last day), highest first.
+        """
+        values = self.current(metric, act_type, day)
+        order = [i for i in np.argsort(-values, kind='mergesort') if not np.isnan(values[i])]
+        return [(self.names[i], values[i]) for i in order]
+
+    def over_fatigued(self, ratio=FATIGUE_RATIO, act_type='cardio', day=None):
+        """
+        Returns list of names of athletes whose fatigue on day (default the last day) exceeds ratio times their fitness, i.e. whose recent training load has jumped well above what they're used to.
+        """
+        fitness = self.current('fitness', act_type, day)
+        fatigue = self.current('fatigue', act_type, day)
+        return [self.names[i] for i in np.flatnonzero(fatigue > ratio*fitness)]
+
+    def save(self, directory):
+        """
+        Saves each athlete to directory as <name>.db (see Athlete.save).
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, athlete in zip(self.names, self.athletes):
+            athlete.save(os.path.join(directory, '{}.db'.format(name)))
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads a Team saved with save.
+        """
+        filepaths = sorted(glob.glob(os.path.join(directory, '*.db')))
+        return cls(dict((os.path.basename(filepath)[:-3], load_saved_athlete(filepath)) for filepath in filepaths))
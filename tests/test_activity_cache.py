@@ -0,0 +1,79 @@
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+from StringIO import StringIO
+import numpy as np
+from activity_cache import Activity_Cache
+from class_defs import Activity
+from synthetic_data import write_gpx
+
+
+class Activity_Cache_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = Activity_Cache(os.path.join(self.directory, 'cache'))
+        self.filepath = os.path.join(self.directory, 'run.gpx')
+        write_gpx(self.filepath, start=datetime.datetime(2017, 6, 1, 7, 30), minutes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def entries(self):
+        return os.listdir(self.cache.directory)
+
+    def test_round_trip(self):
+        parsed = Activity(self.filepath, cache=self.cache)
+        self.assertEqual(len(self.entries()), 1)
+        cached = Activity(self.filepath, cache=self.cache)
+        for name in ['name', 'type', 'date', 'creator', 'training_load', 'time_in_zones', 'total_distance_2d', 'elevation_gain', 'avg_cadence']:
+            self.assertEqual(getattr(cached, name), getattr(parsed, name))
+        self.assertTrue(np.allclose(cached.heart_rates.values, parsed.heart_rates.values))
+        self.assertTrue((cached.moving.values == parsed.moving.values).all())
+        # Other zone settings are cached separately
+        Activity(self.filepath, zones=[120, 140, 160, 180], cache=self.cache)
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_corrupt_entries_are_misses(self):
+        expected = Activity(self.filepath).training_load
+        key = self.cache.key(self.filepath, [113, 150, 168, 187], Activity(self.filepath).points_per_min)
+        path = self.cache.entry_path(key)
+        Activity(self.filepath, cache=self.cache)
+        with open(path, 'rb') as f:
+            content = f.read()
+        for corrupt in ['', content[:len(content)//2], 'PK\x03\x04' + '\x00'*100, content[:30] + '\xff'*(len(content) - 30)]:
+            with open(path, 'wb') as f:
+                f.write(corrupt)
+            stderr, sys.stderr = sys.stderr, StringIO()
+            try:
+                self.assertIsNone(self.cache.get(key))
+            finally:
+                stderr, sys.stderr = sys.stderr, stderr
+            self.assertEqual(stderr.getvalue(), '')
+            self.assertFalse(os.path.exists(path))
+            # The file is parsed again and the entry rewritten
+            with open(path, 'wb') as f:
+                f.write(corrupt)
+            self.assertEqual(Activity(self.filepath, cache=self.cache).training_load, expected)
+            self.assertIsNotNone(self.cache.get(key))
+
+    def test_entry_evicted_while_read(self):
+        activity = Activity(self.filepath, cache=self.cache)
+        key = self.cache.key(self.filepath, activity.zones, activity.points_per_min)
+        utime = os.utime
+
+        def evicted(path, times):
+            os.remove(path)
+            utime(path, times)
+        os.utime = evicted
+        try:
+            entry = self.cache.get(key)
+        finally:
+            os.utime = utime
+        self.assertEqual(entry[-1]['training_load'], activity.training_load)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import datetime
+import unittest
+import numpy as np
+from activity_history import Activity_History, STAT_COLUMNS
+
+
+class Summary(object):
+    """
+    Stand-in for an Activity_Stats.
+    """
+    def __init__(self, date, act_type='running', training_load=100, time_in_zones=(10, 20, 15, 5, 0), name='Morning Run'):
+        self.date = date
+        self.type = act_type
+        self.name = name
+        self.creator = 'Garmin Connect'
+        self.training_load = training_load
+        self.time_in_zones = list(time_in_zones) if time_in_zones is not None else None
+        for i, column in enumerate(STAT_COLUMNS[1:], 1):
+            setattr(self, column, float(i))
+
+
+def at(day, hour=7):
+    return datetime.datetime(2017, 6, day, hour, 30)
+
+
+class Activity_History_Test(unittest.TestCase):
+    def setUp(self):
+        self.activities = [Summary(at(3), 'cycling', 200), Summary(at(1)), Summary(at(2, 18), time_in_zones=None, training_load=None),
+                           Summary(at(2)), Summary(at(5), 'cycling', 150, name=u'Col du Gal\xe9bier')]
+        self.history = Activity_History(self.activities)
+
+    def dates(self, activities):
+        return [activity.date for activity in activities]
+
+    def test_empty_history(self):
+        history = Activity_History()
+        self.assertEqual(len(history), 0)
+        self.assertEqual(list(history), [])
+        self.assertEqual(history.between(), [])
+        self.assertEqual(history.of_type('running'), [])
+        self.assertEqual(history.day_ordinals().tolist(), [])
+        self.assertNotIn(at(1), history)
+        self.assertIsNone(history.get(at(1)))
+        self.assertRaises(KeyError, history.index, at(1))
+
+    def test_rows_are_sorted_by_date(self):
+        self.assertEqual(self.dates(self.history), [at(1), at(2), at(2, 18), at(3), at(5)])
+        self.assertEqual(self.history.index(at(3)), 3)
+        self.assertEqual(self.history.day_ordinals().tolist(), [at(day).toordinal() for day in [1, 2, 2, 3, 5]])
+        row = self.history.get(at(5))
+        self.assertEqual((row.type, row.name, row.creator, row.training_load, row.time_in_zones), ('cycling', u'Col du Gal\xe9bier', 'Garmin Connect', 150, [10, 20, 15, 5, 0]))
+        self.assertEqual([getattr(row, column) for column in STAT_COLUMNS[1:]], [float(i) for i in range(1, len(STAT_COLUMNS))])
+        # Activities without heart rate data keep their missing values
+        row = self.history.get(at(2, 18))
+        self.assertEqual((row.training_load, row.time_in_zones), (None, None))
+
+    def test_duplicates_are_skipped(self):
+        self.assertFalse(self.history.add(Summary(at(3), 'running', 1)))
+        added = self.history.add_many([Summary(at(4)), Summary(at(1)), Summary(at(4))])
+        self.assertEqual(self.dates(added), [at(4)])
+        self.assertEqual(len(self.history), 6)
+        self.assertEqual(self.history.get(at(3)).training_load, 200)
+
+    def test_remove(self):
+        removed = self.history.remove(at(3))
+        self.assertEqual((removed.date, removed.type, removed.training_load), (at(3), 'cycling', 200))
+        self.assertNotIn(at(3), self.history)
+        self.assertEqual(self.dates(self.history), [at(1), at(2), at(2, 18), at(5)])
+        self.assertRaises(KeyError, self.history.remove, at(3))
+        # It can be added back
+        self.assertTrue(self.history.add(removed))
+        self.assertEqual(self.history.get(at(3)).time_in_zones, [10, 20, 15, 5, 0])
+
+    def test_removal_that_empties_a_type(self):
+        for date in [at(3), at(5)]:
+            self.history.remove(date)
+        self.assertEqual(self.history.of_type('cycling'), [])
+        self.assertEqual(len(self.history.between(act_type='running')), 3)
+
+    def test_between_is_inclusive(self):
+        self.assertEqual(self.dates(self.history.between(at(2), at(3))), [at(2), at(2, 18), at(3)])
+        self.assertEqual(self.dates(self.history.between(at(2, 12), None)), [at(2, 18), at(3), at(5)])
+        self.assertEqual(self.dates(self.history.between(None, at(1))), [at(1)])
+        self.assertEqual(self.dates(self.history.between(at(3), at(2))), [])
+        self.assertEqual(self.dates(self.history.between(at(2), at(5), 'cycling')), [at(3), at(5)])
+        self.assertEqual(self.history.between(act_type='swimming'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
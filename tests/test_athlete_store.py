@@ -0,0 +1,98 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import datetime
+import unittest
+from contextlib import closing
+import numpy as np
+from athlete_store import Athlete_Store, ACTIVITY_COLUMNS
+from test_fitness_model import synthetic_athlete
+
+
+def stored_rows(filepath, query):
+    with closing(sqlite3.connect(filepath)) as connection:
+        return connection.execute(query).fetchall()
+
+
+class Round_Trip_Test(unittest.TestCase):
+    """
+    An athlete loaded from a store has the activities, daily loads, fitness values and sleep of the athlete saved to it, however many times it was saved in between.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'athlete.db')
+        self.athlete = synthetic_athlete(300)
+        today = datetime.date.today().toordinal()
+        self.athlete.sleep_history.merge(np.arange(today - 40, today + 1), 420 + 10*(np.arange(41) % 5))
+        self.athlete.update_sleep_score()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameAthlete(self, athlete, loaded):
+        self.assertEqual([[getattr(activity, column) for column in ACTIVITY_COLUMNS] for activity in athlete.activity_history],
+                         [[getattr(activity, column) for column in ACTIVITY_COLUMNS] for activity in loaded.activity_history])
+        self.assertEqual([list(activity.time_in_zones) for activity in athlete.activity_history],
+                         [list(activity.time_in_zones) for activity in loaded.activity_history])
+        for act_type in ['cardio', 'cycling', 'running']:
+            for value in ['fitness', 'fatigue', 'form']:
+                name = '{}_{}'.format(act_type, value)
+                self.assertEqual(getattr(athlete, name), getattr(loaded, name))
+            self.assertTrue(np.allclose(athlete.calculate_daily_training_loads(act_type), loaded.calculate_daily_training_loads(act_type)))
+        self.assertEqual(athlete.time_in_zones_7day, loaded.time_in_zones_7day)
+        self.assertEqual(list(athlete.sleep_history), list(loaded.sleep_history))
+        self.assertEqual(athlete.sleep_score, loaded.sleep_score)
+
+    def test_round_trip(self):
+        self.athlete.save(self.filepath)
+        self.assertSameAthlete(self.athlete, Athlete_Store(self.filepath).load())
+
+    def test_round_trip_after_additions_and_removals(self):
+        self.athlete.save(self.filepath)
+        dates = [activity.date for activity in self.athlete.activity_history][::7]
+        self.athlete.remove_activities(dates)
+        self.athlete.merge_activities([(None, activity) for activity in synthetic_athlete(20, seed=1).activity_history])
+        self.athlete.save(self.filepath)
+        loaded = Athlete_Store(self.filepath).load()
+        self.assertSameAthlete(self.athlete, loaded)
+        self.assertEqual(len(stored_rows(self.filepath, 'SELECT date FROM activities')), len(self.athlete.activity_history))
+        # The reloaded athlete saves its own changes incrementally too
+        loaded.remove_activities(dates[:1] + [activity.date for activity in loaded.activity_history][-3:])
+        loaded.save(self.filepath)
+        self.assertSameAthlete(loaded, Athlete_Store(self.filepath).load())
+
+    def test_saving_another_athlete_replaces_the_stored_one(self):
+        self.athlete.save(self.filepath)
+        other = synthetic_athlete(10, seed=1)
+        other.save(self.filepath)
+        loaded = Athlete_Store(self.filepath).load()
+        self.assertSameAthlete(other, loaded)
+        self.assertEqual(len(stored_rows(self.filepath, 'SELECT date FROM activities')), 10)
+        self.assertEqual(len(stored_rows(self.filepath, 'SELECT DISTINCT activity_id FROM zone_times')), 10)
+        # No loads are left from days before the new athlete's first activity
+        self.assertEqual(stored_rows(self.filepath, 'SELECT MIN(day) FROM daily_loads'), [(other.activity_history[0].date.date().isoformat(),)])
+
+    def test_only_new_sleep_nights_are_written(self):
+        self.athlete.save(self.filepath)
+        self.assertEqual(self.athlete.sleep_history.dirty, set())
+        # Nights already saved aren't rewritten, so a row changed behind the athlete's back stays changed
+        first_day = min(self.athlete.sleep_history.days)
+        with closing(sqlite3.connect(self.filepath)) as connection:
+            with connection:
+                connection.execute('UPDATE sleep_nights SET minutes = -1 WHERE day = ?', (datetime.date.fromordinal(first_day).isoformat(),))
+        today = datetime.date.today().toordinal()
+        self.athlete.sleep_history.merge([today - 1, today + 1], [300, 480])
+        self.assertEqual(self.athlete.sleep_history.dirty, set([today - 1, today + 1]))
+        self.athlete.save(self.filepath)
+        rows = dict(stored_rows(self.filepath, 'SELECT day, minutes FROM sleep_nights'))
+        self.assertEqual(rows[datetime.date.fromordinal(first_day).isoformat()], -1)
+        self.assertEqual(rows[datetime.date.fromordinal(today - 1).isoformat()], 300)
+        self.assertEqual(rows[datetime.date.fromordinal(today + 1).isoformat()], 480)
+        self.assertEqual(len(rows), len(self.athlete.sleep_history))
+        # Loading doesn't leave anything to write
+        self.assertEqual(Athlete_Store(self.filepath).load().sleep_history.dirty, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
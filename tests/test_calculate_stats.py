@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import calculate_stats
+from calculate_stats import assign_zones, zone_points, zone_times_and_load, activity_summary, POINTS_PER_MIN
+from parse_xml import parse_gpx, parse_tcx
+from synthetic_data import write_gpx, write_tcx
+
+
+class Assign_Zones_Test(unittest.TestCase):
+    def test_thresholds_belong_to_the_zone_above(self):
+        zones = [113, 150, 168, 187]
+        heart_rates = [60, 112, 113, 149, 150, 167.5, 168, 186, 187, 220]
+        self.assertEqual(assign_zones(heart_rates, zones).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+    def test_missing_heart_rates_fall_in_the_top_zone(self):
+        self.assertEqual(assign_zones([np.nan, 100., np.nan], [113, 150, 168, 187]).tolist(), [5, 1, 5])
+
+    def test_any_number_of_zones(self):
+        self.assertEqual(assign_zones([100, 150, 200], [150]).tolist(), [1, 2, 2])
+        self.assertEqual(assign_zones([100, 125, 135, 155, 165, 175, 185], [120, 130, 140, 150, 160, 180]).tolist(), [1, 2, 3, 5, 6, 6, 7])
+
+
+class Zone_Points_Test(unittest.TestCase):
+    def test_default_rates(self):
+        self.assertEqual(zone_points([113, 150, 168, 187]), POINTS_PER_MIN)
+
+    def test_rates_must_match_the_zones(self):
+        self.assertEqual(zone_points([150], [1, 2]), [1, 2])
+        self.assertRaises(ValueError, zone_points, [120, 140, 160])
+        self.assertRaises(ValueError, zone_points, [150], POINTS_PER_MIN)
+
+
+class Zone_Times_And_Load_Test(unittest.TestCase):
+    def test_counts_moving_time_only(self):
+        df = pd.DataFrame({'time_delta': [np.nan, 60., 60., 60., 60., 600., 60.],
+                           'zone': [1, 1, 2, 3, 3, 4, 5],
+                           'moving': [True, True, True, True, True, False, True]})
+        times, load = zone_times_and_load(df)
+        self.assertEqual(times, [1, 1, 2, 0, 1])
+        self.assertEqual(load, int(0.2 + 0.4 + 2*0.75 + 2.))
+
+    def test_without_moving_column(self):
+        df = pd.DataFrame({'time_delta': [np.nan, 90., 90.], 'zone': [1, 2, 2]})
+        self.assertEqual(zone_times_and_load(df, [1, 2]), ([0, 3], 6))
+
+
+def brute_force_time_in_zones(df):
+    """
+    The original time in zones: the moving time of each zone's trackpoints, filtered out of the dataframe one zone at a time.
+    """
+    times = []
+    for i in range(1, 6):
+        df_zone = df[df.zone == i]
+        if 'moving' in df.columns.values:
+            df_zone = df_zone[df_zone.moving == True]
+        times.append(int(round(df_zone.time_delta.sum()/60, 0)))
+    return times
+
+
+class Activity_Summary_Test(unittest.TestCase):
+    """
+    activity_summary gives the same stats as the individual dataframe functions it replaced, on files of every kind the parsers read.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parsed_files(self):
+        writers = [('garmin.gpx', write_gpx, {}),
+                   ('strava.gpx', write_gpx, {'creator': 'StravaGPX', 'act_type': 'cycling', 'smart_recording': True}),
+                   ('dropout.gpx', write_gpx, {'hr_dropout': 0.05, 'seed': 1}),
+                   ('no_cadence.gpx', write_gpx, {'cadence': False, 'seed': 2}),
+                   ('no_gps.gpx', write_gpx, {'gps': False, 'seed': 3}),
+                   ('bike.tcx', write_tcx, {'hr_dropout': 0.02})]
+        for name, write, kwargs in writers:
+            filepath = os.path.join(self.directory, name)
+            write(filepath, **kwargs)
+            parse = parse_gpx if name.endswith('.gpx') else parse_tcx
+            yield name, parse(filepath)[-1]
+
+    def test_matches_legacy_functions(self):
+        for name, df in self.parsed_files():
+            stats = activity_summary(df)
+            columns = df.columns.values
+            if 'lat' in columns:
+                self.assertAlmostEqual(stats['total_distance_2d'], calculate_stats.distance_2d(df))
+                self.assertAlmostEqual(stats['total_distance_3d'], calculate_stats.distance_3d(df))
+                self.assertAlmostEqual(stats['avg_speed_2d'], calculate_stats.avg_speed_2d(df))
+                self.assertAlmostEqual(stats['avg_speed_3d'], calculate_stats.avg_speed_3d(df))
+            else:
+                self.assertNotIn('total_distance_2d', stats)
+            if 'elevation_change' in columns:
+                gain, loss = calculate_stats.elevation(df)
+                self.assertAlmostEqual(stats['elevation_gain'], gain)
+                self.assertAlmostEqual(stats['elevation_loss'], loss)
+            else:
+                self.assertNotIn('elevation_gain', stats)
+            times = brute_force_time_in_zones(df)
+            self.assertEqual(stats['time_in_zones'], times)
+            self.assertEqual(stats['training_load'], int(sum([minutes*rate for minutes, rate in zip(times, POINTS_PER_MIN)])))
+            if 'cadence' in columns and 'moving' in columns:
+                self.assertEqual(stats['avg_cadence'], calculate_stats.avg_cadence(df))
+            elif 'cadence' in columns:
+                # (avg_cadence needs the moving column, which needs GPS; without it every point counts)
+                running_df = df[df.cadence > 40]
+                self.assertEqual(stats['avg_cadence'], int((running_df.time_delta*running_df.cadence).sum()*1./running_df.time_delta.sum()))
+            else:
+                self.assertNotIn('avg_cadence', stats)
+
+    def test_single_trackpoint(self):
+        df = pd.DataFrame({'time_delta': [np.nan], 'hr': [120.], 'zone': [2], 'moving': [False], 'cadence': [85.]})
+        stats = activity_summary(df)
+        self.assertEqual((stats['time_in_zones'], stats['training_load']), ([0]*5, 0))
+        self.assertNotIn('avg_cadence', stats)
+
+    def test_stats_without_their_columns_are_left_out(self):
+        df = pd.DataFrame({'time_delta': [np.nan, 60., 60.], 'elevation': [10., 12., 11.]})
+        self.assertEqual(activity_summary(df), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from class_defs import Activity, Athlete, default_zones
+from synthetic_data import write_gpx, write_tcx
+from test_parse_xml import remove_type
+from test_fitness_model import synthetic_athlete
+
+
+class Lazy_Activity_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.start = datetime.datetime(2017, 6, 1, 7, 30)
+        self.gpx = os.path.join(self.directory, 'run.gpx')
+        self.tcx = os.path.join(self.directory, 'ride.tcx')
+        write_gpx(self.gpx, start=self.start, minutes=10)
+        write_tcx(self.tcx, start=self.start + datetime.timedelta(days=1), minutes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_trackpoints_are_parsed_on_first_use(self):
+        for filepath in [self.gpx, self.tcx]:
+            activity = Activity(filepath, lazy=True)
+            eager = Activity(filepath)
+            self.assertEqual((activity.name, activity.type, activity.date), (eager.name, eager.type, eager.date))
+            self.assertNotIn('heart_rates', activity.__dict__)
+            self.assertEqual(activity.training_load, eager.training_load)
+            self.assertIn('heart_rates', activity.__dict__)
+            self.assertEqual(activity.time_in_zones, eager.time_in_zones)
+            self.assertEqual(activity.time_in_zone5, eager.time_in_zone5)
+            self.assertTrue((activity.heart_rates.values == eager.heart_rates.values).all())
+
+    def test_unknown_type_waits_for_trackpoints(self):
+        remove_type(self.gpx)
+        activity = Activity(self.gpx, lazy=True)
+        self.assertNotIn('type', activity.__dict__)
+        self.assertEqual(activity.type, Activity(self.gpx).type)
+
+    def test_duplicates_are_never_parsed(self):
+        athlete = Athlete()
+        athlete.add_activities([self.gpx, self.tcx])
+        # A copy of the run whose trackpoints are cut off: its header is enough to tell it's a duplicate
+        with open(self.gpx) as f:
+            content = f.read()
+        copy = os.path.join(self.directory, 'run copy.gpx')
+        with open(copy, 'w') as f:
+            f.write(content[:len(content)//2])
+        athlete.add_activities([copy])
+        self.assertEqual([activity.date for activity in athlete.activity_history], [self.start, self.start + datetime.timedelta(days=1)])
+
+
+class Update_Hr_Info_Test(unittest.TestCase):
+    """
+    However the heart rate settings change, nothing derived from the old zones is served afterwards.
+    """
+    def setUp(self):
+        self.athlete = synthetic_athlete(60)
+        self.today = datetime.date.today()
+
+    def assertRebuilt(self, n_zones):
+        self.assertIsNone(self.athlete.fitness_index)
+        self.assertNotIn('rollups', self.athlete.__dict__)
+        self.assertEqual(len(self.athlete.as_of(self.today)['time_in_zones_7day']), n_zones)
+        self.assertEqual(len(self.athlete.rollups.window(self.today - datetime.timedelta(days=6), self.today)['time_in_zones']), n_zones)
+
+    def use_derived_state(self):
+        self.athlete.as_of(self.today)
+        self.athlete.rollups.window(self.today - datetime.timedelta(days=6), self.today)
+
+    def test_max_hr(self):
+        self.use_derived_state()
+        self.athlete.update_hr_info(Max_hr=180)
+        self.assertEqual((self.athlete.max_hr, self.athlete.zones), (180, default_zones(180)))
+        self.assertRebuilt(5)
+
+    def test_zones_then_max_hr(self):
+        self.use_derived_state()
+        self.athlete.update_hr_info(Zones=[120, 140, 160], Max_hr=190, Points_per_min=[0.5, 1, 1.5, 2])
+        self.assertEqual(self.athlete.points_per_min, [0.5, 1, 1.5, 2])
+        self.assertRebuilt(4)
+        self.use_derived_state()
+        # Other numbers of zones are scaled with max_hr, keeping their rates
+        self.athlete.update_hr_info(Max_hr=171)
+        self.assertEqual((self.athlete.zones, self.athlete.points_per_min), ([108, 126, 144], [0.5, 1, 1.5, 2]))
+        self.assertRebuilt(4)
+
+    def test_invalid_settings_change_nothing(self):
+        self.assertRaises(ValueError, self.athlete.update_hr_info, Zones=[120, 140, 160])
+        self.assertEqual((self.athlete.max_hr, self.athlete.zones), (195, default_zones(195)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import cli
+from athlete_store import Athlete_Store
+from synthetic_data import write_activity_folder
+
+
+def run(*argv):
+    """
+    Runs the command line with argv, returning its exit status and what it printed to standard output and standard error.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    try:
+        try:
+            status = cli.main(list(argv))
+        except SystemExit as e:
+            status = e.code
+        return status, sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+class Cli_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folder = os.path.join(self.directory, 'exports')
+        write_activity_folder(self.folder, 3)
+        self.filepath = os.path.join(self.directory, 'athlete.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ingest_and_history(self):
+        self.assertEqual(run('ingest', self.filepath, self.folder, '--max-hr', '190')[0], 0)
+        athlete = Athlete_Store(self.filepath).load()
+        self.assertEqual(athlete.max_hr, 190)
+        status, output, errors = run('history', self.filepath)
+        self.assertEqual(status, 0)
+        records = json.loads(output)
+        self.assertEqual([record['date'] for record in records], [activity.date.isoformat() for activity in athlete.activity_history])
+
+    def test_zones_with_their_rates(self):
+        status, output, errors = run('ingest', self.filepath, self.folder, '--zones', '120', '140', '160', '--points-per-min', '0.5', '1', '1.5', '2')
+        self.assertEqual(status, 0)
+        athlete = Athlete_Store(self.filepath).load()
+        self.assertEqual((list(athlete.zones), list(athlete.points_per_min)), ([120, 140, 160], [0.5, 1, 1.5, 2]))
+        self.assertEqual([len(activity.time_in_zones) for activity in athlete.activity_history], [4]*3)
+
+    def test_zones_without_matching_rates_are_a_usage_error(self):
+        for settings in [['--zones', '120', '140', '160'],
+                         ['--zones', '120', '140', '160', '--points-per-min', '1', '2'],
+                         ['--points-per-min', '1', '2', '3']]:
+            status, output, errors = run('sync', self.filepath, self.folder, *settings)
+            self.assertEqual(status, 2)
+            self.assertIn('usage:', errors)
+            self.assertIn('--points-per-min', errors)
+            self.assertFalse(os.path.exists(self.filepath))
+        # Four thresholds (five zones) use the default rates
+        self.assertEqual(run('sync', self.filepath, self.folder, '--zones', '113', '150', '168', '187')[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
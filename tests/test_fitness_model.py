@@ -0,0 +1,279 @@
+import datetime
+import unittest
+import numpy as np
+from class_defs import Athlete
+from activity_history import Activity_History, STAT_COLUMNS
+from fitness_model import FITNESS_NORM, FATIGUE_NORM, Fitness_State, exponential_weights, exponential_filter, windowed_exponential_sum, daily_fitness_fatigue_form
+from synthetic_data import synthetic_history
+
+
+def synthetic_athlete(n_activities, seed=0):
+    athlete = Athlete()
+    athlete.merge_activities([(None, activity) for activity in synthetic_history(n_activities, seed=seed)])
+    return athlete
+
+
+class Workout(object):
+    """
+    The parts of an Activity_Stats which fitness depends on.
+    """
+    def __init__(self, date, act_type='running', training_load=100, time_in_zones=(10, 20, 15, 5, 0)):
+        self.date = date
+        self.type = act_type
+        self.training_load = training_load
+        self.time_in_zones = list(time_in_zones) if time_in_zones is not None else None
+        self.name = self.creator = None
+        for column in STAT_COLUMNS[1:]:
+            setattr(self, column, None)
+
+
+class Fitness_State_Test(unittest.TestCase):
+    def setUp(self):
+        self.day = datetime.date(2017, 6, 1)
+        self.morning = datetime.datetime(2017, 6, 1, 7, 30)
+
+    def days_ago(self, n, hour=7):
+        return datetime.datetime.combine(self.day - datetime.timedelta(days=n), datetime.time(hour, 30))
+
+    def test_single_activity(self):
+        state = Fitness_State.from_activities([Workout(self.morning, training_load=150)], 5, day=self.day)
+        for key in ['cardio', 'running']:
+            self.assertAlmostEqual(state.fitness_sums[key], 150)
+            self.assertAlmostEqual(state.fatigue_sums[key], 150)
+            self.assertEqual(state.fitness(key), int(round(150/FITNESS_NORM)))
+            self.assertEqual(state.fatigue(key), int(round(150/FATIGUE_NORM)))
+        self.assertEqual(state.fitness('cycling'), 0)
+        self.assertEqual(state.time_in_zones(7), [10, 20, 15, 5, 0])
+        self.assertEqual(state.time_in_zones(42), [10, 20, 15, 5, 0])
+
+    def test_advance_decays_and_retires_activities(self):
+        state = Fitness_State.from_activities([Workout(self.morning)], 5, day=self.day)
+        state.advance(self.day + datetime.timedelta(days=3))
+        self.assertAlmostEqual(state.fitness_sums['cardio'], 100*np.exp(-3/42.))
+        self.assertAlmostEqual(state.fatigue_sums['cardio'], 100*np.exp(-3/7.))
+        # A week later the activity has left the fatigue and 7-day windows, but not the 42-day one
+        state.advance(self.day + datetime.timedelta(days=7))
+        self.assertEqual(state.fatigue_sums['cardio'], 0.)
+        self.assertEqual(state.time_in_zones(7), [0]*5)
+        self.assertEqual(state.time_in_zones(42), [10, 20, 15, 5, 0])
+        state.advance(self.day + datetime.timedelta(days=42))
+        self.assertEqual(state.time_in_zones(42), [0]*5)
+        self.assertAlmostEqual(state.fitness_sums['cardio'], 100*np.exp(-1.))
+
+    def test_cannot_move_back(self):
+        state = Fitness_State(5, day=self.day)
+        self.assertRaises(ValueError, state.advance, self.day - datetime.timedelta(days=1))
+
+    def test_built_incrementally_or_at_once(self):
+        activities = [Workout(self.days_ago(n), act_type, load) for n, act_type, load in
+                      [(60, 'running', 80), (30, 'cycling', 200), (9, 'running', 120), (6, 'cycling', 90), (2, 'running', 60), (0, 'running', 40)]]
+        state = Fitness_State(5, day=activities[0].date.date())
+        for activity in activities:
+            state.advance(activity.date.date())
+            state.add(activity)
+        expected = Fitness_State.from_activities(activities, 5, day=self.day)
+        for key in ['cardio', 'running', 'cycling']:
+            self.assertAlmostEqual(state.fitness_sums[key], expected.fitness_sums[key])
+            self.assertAlmostEqual(state.fatigue_sums[key], expected.fatigue_sums[key])
+        for n_days in [7, 42]:
+            self.assertEqual(state.time_in_zones(n_days), expected.time_in_zones(n_days))
+        self.assertEqual(state.time_in_zones(7), [30, 60, 45, 15, 0])
+        self.assertEqual(state.time_in_zones(42), [50, 100, 75, 25, 0])
+
+    def test_built_from_history(self):
+        activities = [Workout(self.days_ago(n), act_type, load, zones) for n, act_type, load, zones in
+                      [(50, 'running', 80, (1, 2, 3, 4, 5)), (20, 'cycling', 200, None), (8, 'running', None, (5, 5, 5)), (3, 'cycling', 90, (1, 1, 1, 1, 1)), (0, 'running', 40, (2, 2, 2, 2, 2))]]
+        state = Fitness_State.from_history(Activity_History(activities), 5, day=self.day)
+        expected = Fitness_State.from_activities(activities, 5, day=self.day)
+        for key in ['cardio', 'running', 'cycling']:
+            self.assertAlmostEqual(state.fitness_sums[key], expected.fitness_sums[key])
+            self.assertAlmostEqual(state.fatigue_sums[key], expected.fatigue_sums[key])
+        for n_days in [7, 42]:
+            self.assertEqual(state.time_in_zones(n_days), expected.time_in_zones(n_days))
+        self.assertEqual(Fitness_State.from_history(Activity_History(), 5, day=self.day).fitness_sums, {})
+
+    def test_backdated_add_and_remove(self):
+        state = Fitness_State(5, day=self.day)
+        old = Workout(self.days_ago(3))
+        state.add(old)
+        self.assertAlmostEqual(state.fitness_sums['cardio'], 100*np.exp(-3/42.))
+        self.assertAlmostEqual(state.fatigue_sums['cardio'], 100*np.exp(-3/7.))
+        state.remove(old)
+        self.assertAlmostEqual(state.fitness_sums['cardio'], 0.)
+        self.assertAlmostEqual(state.fatigue_sums['cardio'], 0.)
+        self.assertEqual(state.time_in_zones(7), [0]*5)
+
+    def test_removal_that_empties_a_type(self):
+        run, ride = Workout(self.days_ago(1)), Workout(self.days_ago(2), 'cycling', 250)
+        state = Fitness_State.from_activities([run, ride], 5, day=self.day)
+        state.remove(ride)
+        self.assertEqual((state.fitness('cycling'), state.fatigue('cycling')), (0, 0))
+        self.assertAlmostEqual(state.fitness_sums['cardio'], state.fitness_sums['running'])
+        self.assertAlmostEqual(state.fatigue_sums['cardio'], state.fatigue_sums['running'])
+        self.assertEqual(state.time_in_zones(7), [10, 20, 15, 5, 0])
+
+    def test_activities_without_load_or_heart_rate(self):
+        activities = [Workout(self.days_ago(1), training_load=None, time_in_zones=None),
+                      Workout(self.days_ago(2), time_in_zones=(5, 5, 5)),
+                      Workout(self.days_ago(3), training_load=0)]
+        state = Fitness_State.from_activities(activities, 5, day=self.day)
+        self.assertAlmostEqual(state.fitness_sums['cardio'], 100*np.exp(-2/42.))
+        # Only the last activity has times for all five zones
+        self.assertEqual(state.time_in_zones(7), [10, 20, 15, 5, 0])
+
+
+def per_day_values(training_loads):
+    """
+    Daily fitness, fatigue and form summed afresh for every day, as the original quadratic-time calculation did.
+    """
+    n_days = len(training_loads)
+    fitness = [np.dot(training_loads[i::-1], np.exp(-np.arange(i+1)/42.)) for i in range(n_days)]
+    fatigue = [np.dot(training_loads[i::-1][:7], np.exp(-np.arange(min(i+1, 7))/7.)) for i in range(n_days)]
+    fitness = np.array(fitness)/exponential_weights(42).sum()
+    fatigue = np.array(fatigue)/exponential_weights(7).sum()
+    return fitness, fatigue, fitness - fatigue
+
+
+class Daily_Values_Test(unittest.TestCase):
+    def setUp(self):
+        self.fitness_norm = exponential_weights(42).sum()
+        self.fatigue_norm = exponential_weights(7).sum()
+
+    def test_no_days(self):
+        for values in daily_fitness_fatigue_form(np.zeros(0)):
+            self.assertEqual(len(values), 0)
+
+    def test_single_day(self):
+        fitness, fatigue, form = daily_fitness_fatigue_form([100.])
+        self.assertAlmostEqual(fitness[0], 100/self.fitness_norm)
+        self.assertAlmostEqual(fatigue[0], 100/self.fatigue_norm)
+        self.assertAlmostEqual(form[0], fitness[0] - fatigue[0])
+
+    def test_one_workout_then_rest(self):
+        loads = np.zeros(50)
+        loads[0] = 100.
+        fitness, fatigue, form = daily_fitness_fatigue_form(loads)
+        days = np.arange(50)
+        self.assertTrue(np.allclose(fitness, 100*np.exp(-days/42.)/self.fitness_norm))
+        self.assertTrue(np.allclose(fatigue[:7], 100*np.exp(-days[:7]/7.)/self.fatigue_norm))
+        # Fatigue only counts the last 7 days
+        self.assertTrue((fatigue[7:] == 0).all())
+
+    def test_fewer_days_than_the_window(self):
+        for n_days in range(1, 8):
+            fitness, fatigue, form = daily_fitness_fatigue_form(np.full(n_days, 100.))
+            self.assertTrue(np.allclose(fatigue, 100*np.cumsum(exponential_weights(7)[:n_days])/self.fatigue_norm))
+            self.assertTrue(np.allclose(fitness, 100*np.cumsum(exponential_weights(42)[:n_days])/self.fitness_norm))
+
+    def test_exponential_filter_recursion(self):
+        rng = np.random.RandomState(0)
+        # Long enough for several blocks of 20*n_days days, with rest days
+        loads = np.where(rng.random_sample((2000, 3)) < 0.3, 0., rng.uniform(20, 400, (2000, 3)))
+        for n_days in [7, 42]:
+            out = exponential_filter(loads, n_days)
+            self.assertTrue(np.allclose(out[0], loads[0]))
+            self.assertTrue(np.allclose(out[1:], loads[1:] + np.exp(-1./n_days)*out[:-1]))
+            # Continuing from part way gives the same as filtering in one go
+            self.assertTrue(np.allclose(exponential_filter(loads[777:], n_days, out[776]), out[777:]))
+            # Each column is filtered on its own
+            self.assertTrue(np.allclose(exponential_filter(loads[:, 1], n_days), out[:, 1]))
+
+    def test_windowed_exponential_sum(self):
+        loads = np.arange(1., 21.)
+        out = windowed_exponential_sum(loads, 7)
+        self.assertAlmostEqual(out[0], 1.)
+        self.assertAlmostEqual(out[19], np.dot(loads[19:12:-1], exponential_weights(7)))
+
+    def test_matches_per_day_sums(self):
+        rng = np.random.RandomState(1)
+        loads = np.where(rng.random_sample(300) < 0.4, 0., rng.uniform(20, 300, 300))
+        for value, expected in zip(daily_fitness_fatigue_form(loads), per_day_values(loads)):
+            self.assertTrue(np.allclose(value, expected))
+
+
+class Fitness_Index_Test(unittest.TestCase):
+    """
+    Values read from the fitness index are those of the full daily recalculation.
+    """
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.athlete = Athlete()
+
+    def add(self, *activities):
+        self.athlete.merge_activities([(None, activity) for activity in activities])
+
+    def days_ago(self, n, hour=7):
+        return datetime.datetime.combine(self.today - datetime.timedelta(days=n), datetime.time(hour, 30))
+
+    def assertMatchesRecalculation(self, start, act_types=('cardio', 'cycling', 'running')):
+        for act_type in act_types:
+            values = self.athlete.as_of_range(start, self.today, act_type)
+            for value, daily in zip(['fitness', 'fatigue', 'form'], self.athlete.calculate_daily_fitness_fatigue_form(act_type)):
+                self.assertTrue(np.allclose(values[value][-len(daily):], daily))
+
+    def test_empty_history(self):
+        values = self.athlete.as_of(self.today)
+        self.assertEqual((values['fitness'], values['fatigue'], values['form']), (0., 0., 0.))
+        self.assertEqual(values['time_in_zones_7day'], [0]*5)
+
+    def test_single_day(self):
+        self.add(Workout(self.days_ago(0), training_load=120), Workout(self.days_ago(0, 18), 'cycling', 60))
+        values = self.athlete.as_of(self.today)
+        self.assertAlmostEqual(values['fitness'], 180/exponential_weights(42).sum())
+        self.assertAlmostEqual(values['fatigue'], 180/exponential_weights(7).sum())
+        self.assertEqual(values['time_in_zones_7day'], [20, 40, 30, 10, 0])
+        self.assertEqual(self.athlete.as_of(self.today, 'cycling')['fatigue'], 60/exponential_weights(7).sum())
+        # Days before the first activity have no training at all
+        before = self.athlete.as_of(self.today - datetime.timedelta(days=3))
+        self.assertEqual((before['fitness'], before['time_in_zones_42day']), (0., [0]*5))
+
+    def test_matches_recalculation_after_changes(self):
+        workouts = [Workout(self.days_ago(n), ['running', 'cycling'][n % 3 == 0], 30 + 7*n) for n in range(0, 200, 2)]
+        self.add(*workouts)
+        start = workouts[-1].date.date()
+        self.assertMatchesRecalculation(start)
+        # A removal only recalculates from the day removed; removing every ride leaves no cycling fitness
+        self.athlete.remove_activities([workout.date for workout in workouts[10:30]])
+        self.assertMatchesRecalculation(start)
+        self.athlete.remove_activities([workout.date for workout in workouts if workout.type == 'cycling' and workout.date in self.athlete.activity_history])
+        self.assertMatchesRecalculation(start)
+        self.assertTrue((self.athlete.as_of_range(start, self.today, 'cycling')['fitness'] == 0).all())
+        # As do additions, including ones older than the first indexed day
+        self.add(Workout(self.days_ago(250), 'cycling', 300), Workout(self.days_ago(5, 18), 'cycling', 90))
+        self.assertMatchesRecalculation(self.today - datetime.timedelta(days=250))
+
+
+class Consistency_Test(unittest.TestCase):
+    """
+    Current values, the last day of the daily histories, and values as of today are the same numbers.
+    """
+    def setUp(self):
+        self.athlete = synthetic_athlete(1000)
+        self.athlete.update_fitness_values()
+        self.athlete.update_historical_values()
+        self.today = datetime.date.today()
+
+    def test_as_of_today_equals_current_values(self):
+        state = self.athlete.fitness_state
+        for act_type in ['cardio', 'cycling', 'running']:
+            values = self.athlete.as_of(self.today, act_type)
+            self.assertAlmostEqual(values['fitness'], state.fitness_sums[act_type]/FITNESS_NORM)
+            self.assertAlmostEqual(values['fatigue'], state.fatigue_sums[act_type]/FATIGUE_NORM)
+            self.assertEqual(int(round(values['fitness'])), getattr(self.athlete, '{}_fitness'.format(act_type)))
+            self.assertEqual(int(round(values['fatigue'])), getattr(self.athlete, '{}_fatigue'.format(act_type)))
+        values = self.athlete.as_of(self.today)
+        self.assertEqual(values['time_in_zones_7day'], self.athlete.time_in_zones_7day)
+        self.assertEqual(values['time_in_zones_42day'], self.athlete.time_in_zones_42day)
+
+    def test_last_history_row_equals_current_values(self):
+        for act_type in ['cardio', 'cycling', 'running']:
+            values = self.athlete.as_of(self.today, act_type)
+            for value in ['fitness', 'fatigue', 'form']:
+                history = getattr(self.athlete, '{}_{}_history'.format(act_type, value))
+                self.assertAlmostEqual(history[-1], values[value])
+            self.assertEqual(int(round(getattr(self.athlete, '{}_fitness_history'.format(act_type))[-1])), getattr(self.athlete, '{}_fitness'.format(act_type)))
+            self.assertEqual(int(round(getattr(self.athlete, '{}_fatigue_history'.format(act_type))[-1])), getattr(self.athlete, '{}_fatigue'.format(act_type)))
+
+
+if __name__ == '__main__':
+    unittest.main()
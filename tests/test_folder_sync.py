@@ -0,0 +1,237 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from class_defs import Athlete
+from athlete_store import Athlete_Store
+from folder_sync import File_Manifest, file_hash
+from synthetic_data import write_activity_folder, write_gpx, write_tcx
+
+
+def truncate(filepath):
+    """
+    Cuts a file off halfway, as when an export is interrupted, changing its size (and mtime) so a sync notices.
+    """
+    with open(filepath) as f:
+        content = f.read()
+    with open(filepath, 'w') as f:
+        f.write(content[:len(content)//2])
+
+
+class File_Manifest_Test(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.mtime = 1500000000
+        self.manifest = File_Manifest()
+        for name in ['a.gpx', 'b.tcx', 'c.csv']:
+            self.write(name, name)
+        self.record_all()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+        self.touch(name)
+
+    def touch(self, name):
+        # Explicit mtimes, so every change is seen however fast the test runs
+        self.mtime += 1
+        os.utime(self.path(name), (self.mtime, self.mtime))
+
+    def record_all(self):
+        changes = self.manifest.scan(self.folder)
+        for path, size, mtime, digest, entry in changes.pending:
+            self.manifest.record(path, size, mtime, digest, date=os.path.basename(path))
+        return changes
+
+    def test_new_files(self):
+        self.assertEqual(sorted(self.manifest.entries), [self.path('a.gpx'), self.path('b.tcx'), self.path('c.csv')])
+        self.assertEqual(self.manifest.get(self.path('a.gpx')).hash, file_hash(self.path('a.gpx')))
+        self.assertEqual(self.manifest.scan(self.folder), ([], [], []))
+        # Other files are ignored
+        self.write('notes.txt', 'notes')
+        self.assertEqual(self.manifest.scan(self.folder), ([], [], []))
+
+    def test_touched_file_is_not_read_again(self):
+        self.touch('a.gpx')
+        self.assertEqual(self.manifest.scan(self.folder), ([], [], []))
+        self.assertEqual(self.manifest.get(self.path('a.gpx')).mtime, self.mtime)
+        self.assertEqual(self.manifest.get(self.path('a.gpx')).date, 'a.gpx')
+
+    def test_edited_file(self):
+        entry = self.manifest.get(self.path('b.tcx'))
+        self.write('b.tcx', 'edited')
+        changes = self.manifest.scan(self.folder)
+        self.assertEqual([(path, previous) for path, size, mtime, digest, previous in changes.pending], [(self.path('b.tcx'), entry)])
+
+    def test_copies_and_renames(self):
+        shutil.copy(self.path('a.gpx'), self.path('a copy.gpx'))
+        os.rename(self.path('b.tcx'), self.path('renamed.tcx'))
+        changes = self.manifest.scan(self.folder)
+        self.assertEqual(changes.pending, [])
+        self.assertEqual([path for path, entry in changes.copies], [self.path('a copy.gpx'), self.path('renamed.tcx')])
+        self.assertEqual([path for path, entry in changes.deleted], [self.path('b.tcx')])
+        # Copies are recorded with the activity of the file they copy
+        self.assertEqual(self.manifest.get(self.path('renamed.tcx')).date, 'b.tcx')
+
+    def test_unreadable_file_is_skipped_until_it_changes(self):
+        self.write('d.gpx', 'broken')
+        changes = self.manifest.scan(self.folder)
+        path, size, mtime, digest, entry = changes.pending[0]
+        self.manifest.record(path, size, mtime, digest, error='ParseError')
+        self.assertEqual(self.manifest.scan(self.folder), ([], [], []))
+        # Its content isn't taken for that of a file which was read
+        shutil.copy(self.path('d.gpx'), self.path('e.gpx'))
+        self.assertEqual([pending[0] for pending in self.manifest.scan(self.folder).pending], [self.path('e.gpx')])
+        self.touch('d.gpx')
+        self.assertEqual([pending[0] for pending in self.manifest.scan(self.folder).pending], [self.path('d.gpx'), self.path('e.gpx')])
+
+    def test_unsettled_files_are_left_for_later(self):
+        self.write('d.gpx', 'new')
+        os.utime(self.path('d.gpx'), None)
+        self.assertEqual(self.manifest.scan(self.folder, settle=60.).pending, [])
+        self.assertEqual([pending[0] for pending in self.manifest.scan(self.folder).pending], [self.path('d.gpx')])
+
+
+class Sync_Folder_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folder = os.path.join(self.directory, 'exports')
+        self.filepaths = write_activity_folder(self.folder, 5)
+        self.athlete = Athlete()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def dates(self, athlete):
+        return [activity.date for activity in athlete.activity_history]
+
+    def test_only_changes_are_parsed(self):
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual((counts['parsed'], counts['added']), (5, 5))
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual((counts['parsed'], counts['skipped'], counts['added']), (0, 0, 0))
+        shutil.copy(self.filepaths[0], os.path.join(self.folder, 'copy.gpx'))
+        self.assertEqual(self.athlete.sync_folder(self.folder)['skipped'], 1)
+        self.assertEqual(len(self.athlete.activity_history), 5)
+
+    def test_edited_file_replaces_its_activity(self):
+        self.athlete.sync_folder(self.folder)
+        dates = self.dates(self.athlete)
+        start = dates[2] + datetime.timedelta(minutes=1)
+        write_gpx(self.filepaths[2], start=start)
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual((counts['parsed'], counts['added'], counts['removed']), (1, 1, 1))
+        self.assertEqual(self.dates(self.athlete), dates[:2] + [start] + dates[3:])
+
+    def test_deleted_files(self):
+        self.athlete.sync_folder(self.folder)
+        dates = self.dates(self.athlete)
+        os.remove(self.filepaths[0])
+        self.assertEqual(self.athlete.sync_folder(self.folder)['deleted'], 1)
+        self.assertEqual(self.dates(self.athlete), dates)
+        # With prune, the activities of deleted files go too, unless another file holds them
+        shutil.copy(self.filepaths[1], os.path.join(self.folder, 'copy.gpx'))
+        self.athlete.sync_folder(self.folder)
+        os.remove(self.filepaths[1])
+        os.remove(self.filepaths[2])
+        counts = self.athlete.sync_folder(self.folder, prune=True)
+        self.assertEqual((counts['deleted'], counts['removed']), (2, 1))
+        self.assertEqual(self.dates(self.athlete), dates[:2] + dates[3:])
+
+    def test_reloaded_store_carries_on(self):
+        for filepath in self.filepaths[3:]:
+            os.rename(filepath, filepath + '.later')
+        self.athlete.sync_folder(self.folder)
+        filepath = os.path.join(self.directory, 'athlete.db')
+        self.athlete.save(filepath)
+        for path in self.filepaths[3:]:
+            os.rename(path + '.later', path)
+        os.remove(self.filepaths[0])
+        loaded = Athlete_Store(filepath).load()
+        counts = loaded.sync_folder(self.folder, prune=True)
+        self.assertEqual((counts['parsed'], counts['deleted'], counts['added'], counts['removed']), (2, 1, 2, 1))
+        expected = Athlete()
+        expected.sync_folder(self.folder)
+        self.assertEqual(self.dates(loaded), self.dates(expected))
+        self.assertEqual(loaded.cardio_fitness, expected.cardio_fitness)
+        loaded.save(filepath)
+        self.assertEqual(self.dates(Athlete_Store(filepath).load()), self.dates(expected))
+
+
+class Bad_File_Test(unittest.TestCase):
+    """
+    A file which can't be read doesn't cost the athlete anything: the activity it held before is kept, other files are synced as usual, and it's skipped until it changes again.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folder = os.path.join(self.directory, 'exports')
+        self.filepaths = write_activity_folder(self.folder, 4)
+        self.athlete = Athlete()
+        self.athlete.sync_folder(self.folder)
+        self.dates = [activity.date for activity in self.athlete.activity_history]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_corrupt_file_keeps_old_activity(self):
+        truncate(self.filepaths[1])
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual(counts['removed'], 0)
+        self.assertEqual(list(counts['errors']), [self.filepaths[1]])
+        self.assertEqual([activity.date for activity in self.athlete.activity_history], self.dates)
+        entry = self.athlete.manifest.get(self.filepaths[1])
+        self.assertEqual(entry.date, self.dates[1])
+        self.assertTrue(entry.error)
+
+    def test_corrupt_file_is_skipped_until_it_changes(self):
+        truncate(self.filepaths[1])
+        self.athlete.sync_folder(self.folder)
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual((counts['parsed'], counts['failed']), (0, 0))
+        # A repaired export is read again and replaces the activity
+        start = self.dates[1].replace(minute=0, second=0) + datetime.timedelta(minutes=1)
+        write_gpx(self.filepaths[1], start=start)
+        counts = self.athlete.sync_folder(self.folder)
+        self.assertEqual((counts['parsed'], counts['failed'], counts['added'], counts['removed']), (1, 0, 1, 1))
+        self.assertIsNone(self.athlete.manifest.get(self.filepaths[1]).error)
+        self.assertEqual([activity.date for activity in self.athlete.activity_history], [self.dates[0], start] + self.dates[2:])
+
+    def test_new_corrupt_file_doesnt_stop_others(self):
+        start = datetime.datetime.combine(self.dates[-1].date(), datetime.time(20, 0))
+        write_gpx(os.path.join(self.folder, 'evening.gpx'), start=start)
+        write_tcx(os.path.join(self.folder, 'broken.tcx'), start=start + datetime.timedelta(hours=2))
+        truncate(os.path.join(self.folder, 'broken.tcx'))
+        # Not even a header to read
+        with open(os.path.join(self.folder, 'garbage.gpx'), 'w') as f:
+            f.write('not an export\n')
+        os.remove(self.filepaths[0])
+        counts = self.athlete.sync_folder(self.folder, prune=True)
+        self.assertEqual((counts['parsed'], counts['failed'], counts['deleted']), (1, 2, 1))
+        self.assertEqual((counts['added'], counts['removed']), (1, 1))
+        self.assertEqual([activity.date for activity in self.athlete.activity_history], self.dates[1:] + [start])
+
+    def test_watch_folder_survives_bad_files(self):
+        filepath = os.path.join(self.directory, 'athlete.db')
+        self.athlete.save(filepath)
+        truncate(self.filepaths[2])
+        reports = []
+        self.athlete.watch_folder(self.folder, interval=0, settle=0., callback=lambda athlete, counts: reports.append(counts), max_syncs=3)
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(list(reports[0]['errors']), [self.filepaths[2]])
+        # The error is saved with the manifest, so a reloaded athlete skips the file too
+        loaded = Athlete_Store(filepath).load()
+        self.assertTrue(loaded.manifest.get(self.filepaths[2]).error)
+        self.assertEqual(loaded.sync_folder(self.folder)['parsed'], 0)
+        self.assertEqual(len(loaded.activity_history), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import re
+import shutil
+import datetime
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from parse_xml import impute_nulls, parse_gpx, parse_tcx, parse_gpx_header, parse_tcx_header
+from synthetic_data import write_gpx, write_tcx, GPX_CREATORS
+
+nan = np.nan
+
+
+def remove_type(filepath):
+    """
+    Drops the <type> of a .gpx file's track, as some Strava exports leave it out.
+    """
+    with open(filepath) as f:
+        content = f.read()
+    with open(filepath, 'w') as f:
+        f.write(re.sub(r'\s*<type>[^<]*</type>', '', content))
+
+class Impute_Nulls_Test(unittest.TestCase):
+    def test_isolated_null_gets_the_mean(self):
+        df = impute_nulls(pd.DataFrame({'hr': [120., nan, 130., 140.]}))
+        self.assertEqual(df.hr.tolist(), [120., 125., 130., 140.])
+
+    def test_run_of_nulls_is_filled_along_a_line(self):
+        df = impute_nulls(pd.DataFrame({'elevation': [10., nan, nan, nan, 18., nan, 20.]}))
+        self.assertEqual(df.elevation.tolist(), [10., 12., 14., 16., 18., 19., 20.])
+
+    def test_nulls_at_the_ends_are_kept(self):
+        df = impute_nulls(pd.DataFrame({'cadence': [nan, nan, 80., nan, 90., nan]}))
+        self.assertTrue(np.isnan(df.cadence.values[[0, 1, 5]]).all())
+        self.assertEqual(df.cadence.values[2:5].tolist(), [80., 85., 90.])
+
+    def test_columns_with_fewer_than_two_values_are_left_alone(self):
+        df = impute_nulls(pd.DataFrame({'hr': [nan, 150., nan], 'cadence': [nan, nan, nan]}))
+        self.assertTrue(np.isnan(df.hr.values[[0, 2]]).all())
+        self.assertTrue(np.isnan(df.cadence.values).all())
+
+    def test_integer_and_boolean_columns_are_untouched(self):
+        df = impute_nulls(pd.DataFrame({'zone': [1, 3, 5], 'moving': [True, False, True], 'hr': [100., nan, 110.]}))
+        self.assertEqual((df.zone.dtype.kind, df.moving.dtype.kind), ('i', 'b'))
+        self.assertEqual(df.zone.tolist(), [1, 3, 5])
+        self.assertEqual(df.moving.tolist(), [True, False, True])
+        self.assertEqual(df.hr.tolist(), [100., 105., 110.])
+
+
+class Header_Test(unittest.TestCase):
+    """
+    File headers give the name, type, date and creator a full parse does.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.start = datetime.datetime(2017, 6, 1, 7, 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_gpx(self):
+        for creator in GPX_CREATORS:
+            filepath = os.path.join(self.directory, 'activity.gpx')
+            write_gpx(filepath, creator=creator, act_type='cycling', start=self.start, minutes=2)
+            header = parse_gpx_header(filepath)
+            self.assertEqual(header, parse_gpx(filepath)[:4])
+            self.assertEqual(header, ('Synthetic cycling', 'cycling', self.start, creator))
+
+    def test_gpx_without_type(self):
+        filepath = os.path.join(self.directory, 'activity.gpx')
+        write_gpx(filepath, start=self.start, minutes=2)
+        remove_type(filepath)
+        # The type is only known once the trackpoint speeds are
+        self.assertEqual(parse_gpx_header(filepath)[1], 'Unknown Activity Type')
+        self.assertNotEqual(parse_gpx(filepath)[1], 'Unknown Activity Type')
+
+    def test_tcx(self):
+        filepath = os.path.join(self.directory, 'activity.tcx')
+        write_tcx(filepath, start=self.start, minutes=2)
+        self.assertEqual(parse_tcx_header(filepath), parse_tcx(filepath)[:4])
+        self.assertEqual(parse_tcx_header(filepath)[1:3], ('cycling', self.start))
+
+
+if __name__ == '__main__':
+    unittest.main()
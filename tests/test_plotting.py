@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from class_defs import Activity, pyplot
+from synthetic_data import write_gpx, write_tcx
+
+# Figures are saved rather than shown
+pyplot('Agg')
+
+
+class Activity_Plot_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def plot(self, activity, **options):
+        filepath = os.path.join(self.directory, 'plot.png')
+        activity.plot(filepath=filepath, **options)
+        self.assertTrue(os.path.getsize(filepath) > 0)
+        pyplot().close('all')
+
+    def test_tcx_without_gps(self):
+        filepath = os.path.join(self.directory, 'ride.tcx')
+        write_tcx(filepath, minutes=10)
+        activity = Activity(filepath)
+        self.assertIsNone(activity.moving)
+        self.plot(activity)
+        self.plot(activity, hr_hist=True, zones_hist=True, hr_and_zones_hist=True)
+        self.plot(activity, elevation=False, grade=False)
+
+    def test_gpx(self):
+        filepath = os.path.join(self.directory, 'run.gpx')
+        write_gpx(filepath, minutes=10)
+        activity = Activity(filepath)
+        self.plot(activity)
+        self.plot(activity, hr_hist=True, zones_hist=True, hr_and_zones_hist=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
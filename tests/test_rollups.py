@@ -0,0 +1,76 @@
+import datetime
+import unittest
+import numpy as np
+from activity_history import Activity_History
+from rollups import Rollups, ROLLUP_STATS
+from synthetic_data import synthetic_history
+from test_activity_history import Summary
+
+
+def on(year, month, day, hour=7):
+    return datetime.datetime(year, month, day, hour, 30)
+
+
+class Rollups_Test(unittest.TestCase):
+    def setUp(self):
+        # Sunday 29 January to Wednesday 1 February 2017: two weeks and two months
+        self.activities = [Summary(on(2017, 1, 29), training_load=50), Summary(on(2017, 1, 30), 'cycling', 200),
+                           Summary(on(2017, 1, 31), training_load=80, time_in_zones=None), Summary(on(2017, 2, 1), training_load=70)]
+        self.rollups = Rollups.from_history(Activity_History(self.activities), 5)
+
+    def test_empty(self):
+        rollups = Rollups(5)
+        totals = rollups.window(datetime.date(2017, 1, 1), datetime.date(2017, 3, 31))
+        self.assertEqual((totals['activities'], totals['training_load'], totals['time_in_zones']), (0, 0, [0]*5))
+        self.assertEqual(len(rollups.series('week')['start']), 0)
+        series = rollups.series('month', start=datetime.date(2017, 1, 1), end=datetime.date(2017, 3, 1))
+        self.assertEqual(series['activities'].tolist(), [0, 0, 0])
+
+    def test_single_day(self):
+        totals = self.rollups.window(datetime.date(2017, 1, 30), datetime.date(2017, 1, 30))
+        self.assertEqual((totals['activities'], totals['training_load'], totals['time_in_zones']), (1, 200, [10, 20, 15, 5, 0]))
+        self.assertEqual(totals['total_distance_2d'], 1.)
+        self.assertEqual(self.rollups.window(datetime.date(2017, 1, 30), datetime.date(2017, 1, 30), 'running')['activities'], 0)
+        self.assertEqual(self.rollups.window(datetime.date(2017, 1, 1), datetime.date(2017, 1, 28))['activities'], 0)
+
+    def test_weeks_start_on_monday(self):
+        series = self.rollups.series('week', start=datetime.date(2017, 1, 23), end=datetime.date(2017, 2, 5))
+        self.assertEqual(series['start'], [datetime.date(2017, 1, 23), datetime.date(2017, 1, 30)])
+        self.assertEqual(series['activities'].tolist(), [1, 3])
+        self.assertEqual(series['training_load'].tolist(), [50, 350])
+        # Activities without heart rate data count towards everything but time in zones
+        self.assertEqual(series['time_in_zones'][1].tolist(), [20, 40, 30, 10, 0])
+
+    def test_months(self):
+        series = self.rollups.series('month', 'running', datetime.date(2016, 12, 15), datetime.date(2017, 2, 15))
+        self.assertEqual(series['start'], [datetime.date(2016, 12, 1), datetime.date(2017, 1, 1), datetime.date(2017, 2, 1)])
+        self.assertEqual(series['activities'].tolist(), [0, 2, 1])
+        self.assertEqual(self.rollups.window(datetime.date(2017, 1, 31), datetime.date(2017, 2, 1))['training_load'], 150)
+
+    def test_removal_that_empties_a_type(self):
+        self.rollups.remove(self.activities[1:2])
+        totals = self.rollups.window(datetime.date(2017, 1, 1), datetime.date(2017, 2, 28), 'cycling')
+        self.assertEqual((totals['activities'], totals['training_load'], totals['time_in_zones']), (0, 0, [0]*5))
+        self.assertEqual(self.rollups.window(datetime.date(2017, 1, 1), datetime.date(2017, 2, 28))['activities'], 3)
+        self.assertEqual(self.rollups.series('week', 'cycling', datetime.date(2017, 1, 30), datetime.date(2017, 1, 30))['activities'].tolist(), [0])
+
+    def test_windows_across_months(self):
+        activities = synthetic_history(200, end=datetime.datetime(2017, 6, 1, 20, 0))
+        history = Activity_History(activities)
+        # Built at once, or activity by activity in any order
+        rollups = Rollups(5)
+        rollups.add(activities[100:])
+        rollups.add(activities[:100])
+        for period in ['day', 'week', 'month']:
+            self.assertTrue(np.allclose(rollups.totals[period].sum(axis=1), Rollups.from_history(history, 5).totals[period].sum(axis=1)))
+        for start, end in [(datetime.date(2016, 12, 15), datetime.date(2017, 3, 10)), (datetime.date(2017, 1, 1), datetime.date(2017, 2, 28)),
+                           (datetime.date(2016, 2, 29), datetime.date(2017, 1, 31)), (datetime.date(2017, 5, 31), datetime.date(2017, 7, 1))]:
+            inside = history.between(datetime.datetime.combine(start, datetime.time()), datetime.datetime.combine(end, datetime.time.max))
+            totals = rollups.window(start, end)
+            self.assertEqual(totals['activities'], len(inside))
+            self.assertAlmostEqual(totals['training_load'], sum([activity.training_load for activity in inside]))
+            self.assertEqual(totals['time_in_zones'], np.sum([[0]*5] + [activity.time_in_zones for activity in inside], axis=0).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import datetime
+import unittest
+import numpy as np
+from class_defs import Athlete
+from fitness_model import FITNESS_NORM
+from scenarios import Scenario
+from synthetic_data import Synthetic_Activity, synthetic_history
+from test_fitness_model import Workout
+
+
+class Scenario_Engine_Test(unittest.TestCase):
+    """
+    A scenario projects the fitness, fatigue and form of the athlete with its changes made to the activity history.
+    """
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.activities = synthetic_history(150, seed=3)
+        self.athlete = Athlete()
+        self.athlete.merge_activities([(None, activity) for activity in self.activities])
+
+    def recalculate(self, activities, act_type):
+        athlete = Athlete()
+        athlete.merge_activities([(None, activity) for activity in activities])
+        return athlete.calculate_daily_fitness_fatigue_form(act_type)
+
+    def assertMatches(self, results, column, activities):
+        for act_type in ['cardio', 'cycling', 'running']:
+            for metric, expected in zip(['fitness', 'fatigue', 'form'], self.recalculate(activities, act_type)):
+                # Both end today; the scenario's results start at its first change
+                series = results.series(metric, act_type)[:, column]
+                self.assertTrue(np.allclose(series, expected[-len(series):]))
+
+    def test_matches_recalculation(self):
+        history = list(self.athlete.activity_history)
+        days = lambda n: self.today - datetime.timedelta(days=n)
+        removed = set([activity.date for activity in history[-40::6]])
+        planned = [Workout(datetime.datetime.combine(days(n), datetime.time(12, 0)), act_type, load) for n, act_type, load in [(30, 'cycling', 120), (12, 'running', 80), (0, 'cycling', 200)]]
+        zone_workout = Synthetic_Activity(datetime.datetime.combine(days(5), datetime.time(18, 0)), 'running', 50, [10, 20, 20, 0, 0])
+        scenarios = [Scenario('remove').remove(history[-1].date), Scenario('add'), Scenario('scale').scale(days(40), days(20), 0.5),
+                     Scenario('scale rides').scale(days(60), days(0), 1.5, 'cycling'), Scenario('all')]
+        for workout in planned:
+            scenarios[1].add(workout.date, workout.training_load, workout.type)
+        scenarios[1].add(zone_workout.date, act_type='running', time_in_zones=zone_workout.time_in_zones)
+        for date in removed:
+            scenarios[4].remove(date)
+        for workout in planned:
+            scenarios[4].add(workout.date, workout.training_load, workout.type)
+        # Overlapping the removals, so only what's left is scaled
+        scenarios[4].scale(days(45), days(3), 0.7).scale(days(60), days(50), 0.5, 'running')
+        results = self.athlete.scenarios().evaluate(scenarios, start=days(100))
+
+        def scaled(activities, start, end, factor, act_type=None):
+            for activity in activities:
+                if start <= activity.date.date() <= end and act_type in (None, activity.type):
+                    activity = Workout(activity.date, activity.type, activity.training_load*factor, activity.time_in_zones)
+                yield activity
+
+        self.assertMatches(results, 0, history[:-1])
+        self.assertMatches(results, 1, history + planned + [zone_workout])
+        self.assertMatches(results, 2, list(scaled(history, days(40), days(20), 0.5)))
+        self.assertMatches(results, 3, list(scaled(history, days(60), days(0), 1.5, 'cycling')))
+        kept = [activity for activity in history if activity.date not in removed]
+        self.assertMatches(results, 4, list(scaled(scaled(kept, days(45), days(3), 0.7), days(60), days(50), 0.5, 'running')) + planned)
+
+    def test_scaling_a_day_with_a_removal(self):
+        day = datetime.datetime.combine(self.today - datetime.timedelta(days=400), datetime.time(7, 0))
+        self.athlete.merge_activities([(None, Workout(day, 'running', 36)), (None, Workout(day.replace(hour=18), 'running', 55))])
+        engine = self.athlete.scenarios()
+        scenario = Scenario().remove(day.replace(hour=18)).scale(day, day, 0.5)
+        # 91 recorded, 55 of it removed and half of the rest scaled away
+        self.assertEqual(engine.loads[engine.day_index(day), 0], 91)
+        scenario_indices, days, columns, loads = engine.cells([scenario])
+        self.assertEqual(loads[columns == 0].sum(), 18 - 91)
+        results = engine.evaluate([scenario])
+        self.assertAlmostEqual(results.on(day, 'fitness')[0], 18/FITNESS_NORM)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+import numpy as np
+from sleep import Sleep_History, read_sleep_csv, sleep_scores
+
+
+class Sleep_History_Test(unittest.TestCase):
+    def setUp(self):
+        self.day = datetime.date(2017, 6, 1)
+        self.today = self.day.toordinal()
+
+    def test_empty_history(self):
+        history = Sleep_History()
+        self.assertEqual((len(history), history.start, list(history)), (0, None, []))
+        self.assertEqual(len(history.daily_minutes()), 0)
+        self.assertEqual(len(history.scores()), 0)
+        self.assertTrue(np.isnan(history.daily_minutes(self.day, self.day)).all())
+
+    def test_merge_overlapping_exports(self):
+        history = Sleep_History(np.arange(self.today, self.today + 5), [400, 410, 420, 430, 440])
+        # Two nights already recorded (one of them changed), and two new ones
+        self.assertEqual(history.merge(np.arange(self.today + 3, self.today + 7), [430, 445, 450, 460]), 3)
+        self.assertEqual(history.daily_minutes().tolist(), [400, 410, 420, 430, 445, 450, 460])
+        self.assertEqual(history.merge([self.today + 6], [460]), 0)
+
+    def test_merge_out_of_order(self):
+        history = Sleep_History([self.today + 4, self.today], [440, 400])
+        # An older export fills in the gap; for a night given twice the later entry wins
+        self.assertEqual(history.merge([self.today + 2, self.today - 1, self.today + 2], [1, 390, 420]), 2)
+        self.assertEqual(history.start, self.day - datetime.timedelta(days=1))
+        self.assertEqual(list(history)[1:3], [(self.day, 400), (self.day + datetime.timedelta(days=2), 420)])
+        minutes = history.daily_minutes()
+        self.assertEqual(len(minutes), 6)
+        self.assertTrue(np.isnan(minutes[[2, 4]]).all())
+        self.assertEqual(minutes[[0, 1, 3, 5]].tolist(), [390, 400, 420, 440])
+
+    def test_daily_minutes_between_days(self):
+        history = Sleep_History.from_undated([400, 410, 420], self.day)
+        self.assertEqual(history.start, self.day - datetime.timedelta(days=2))
+        minutes = history.daily_minutes(self.day - datetime.timedelta(days=1), self.day + datetime.timedelta(days=2))
+        self.assertEqual(minutes[:2].tolist(), [410, 420])
+        self.assertTrue(np.isnan(minutes[2:]).all())
+
+
+class Sleep_Scores_Test(unittest.TestCase):
+    def test_steady_sleep_scores_100(self):
+        scores = sleep_scores(np.full(40, 450.))
+        self.assertTrue(np.isnan(scores[:2]).all())
+        self.assertTrue((scores[2:] == 100).all())
+
+    def test_short_nights_lower_the_score(self):
+        minutes = np.full(30, 480.)
+        minutes[-3:] = 360.
+        scores = sleep_scores(minutes)
+        self.assertTrue(scores[-1] < scores[-2] < scores[-3] < 100)
+
+    def test_missing_nights(self):
+        minutes = np.array([450., np.nan, 450., 450., np.nan, np.nan, np.nan, 300.])
+        scores = sleep_scores(minutes)
+        # A score needs 3 nights recorded, and one of the last 3
+        self.assertTrue(np.isnan(scores[:3]).all())
+        self.assertEqual(scores[3], 100)
+        self.assertTrue(np.isnan(scores[6]))
+        self.assertTrue(scores[7] < 100)
+        # Scoring many athletes' columns at once gives each column's own scores
+        both = sleep_scores(np.column_stack([minutes, np.full(8, 450.)]))
+        self.assertTrue(np.allclose(both[:, 0], scores, equal_nan=True))
+
+    def test_scores_of_history(self):
+        history = Sleep_History([datetime.date(2017, 6, d).toordinal() for d in [1, 2, 3, 5]], [450, 450, 450, 450])
+        self.assertEqual(len(history.scores()), 5)
+        self.assertEqual(len(history.scores(datetime.date(2017, 6, 10))), 10)
+
+
+class Sleep_Csv_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'sleep.csv')
+        with open(self.filepath, 'w') as f:
+            f.write('Sleep Duration,\n,\nDate,Minutes\n2017-06-01,450\n2017-06-02,--\nAverage,440\n2017-06-03,430\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_sleep_csv(self):
+        days, minutes = read_sleep_csv(self.filepath)
+        self.assertEqual(days.tolist(), [datetime.date(2017, 6, 1).toordinal(), datetime.date(2017, 6, 3).toordinal()])
+        self.assertEqual(minutes.tolist(), [450, 430])
+
+    def test_add_csv(self):
+        history = Sleep_History()
+        self.assertEqual(history.add_csv(self.filepath), 2)
+        self.assertEqual(history.add_csv(self.filepath), 0)
+        self.assertEqual(len(history), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from class_defs import Athlete
+from team import Team
+from test_folder_sync import truncate
+from synthetic_data import write_activity_folder
+
+
+class Add_Folders_Test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folders = {}
+        self.filepaths = {}
+        for seed, name in enumerate(['Matt', 'Sam']):
+            self.folders[name] = os.path.join(self.directory, name)
+            self.filepaths[name] = write_activity_folder(self.folders[name], 6 + 2*seed, seed=seed)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertMatchesAthletes(self, team):
+        """
+        The team's activities and (rounded) current values are those of each athlete synced on its own.
+        """
+        for i, name in enumerate(team.names):
+            athlete = Athlete()
+            athlete.sync_folder(self.folders[name])
+            self.assertEqual([activity.date for activity in team[name].activity_history], [activity.date for activity in athlete.activity_history])
+            athlete.update_fitness_values()
+            self.assertEqual(int(round(team.current('fitness')[i])), athlete.cardio_fitness)
+            self.assertEqual(int(round(team.current('fatigue', 'running')[i])), athlete.running_fatigue)
+
+    def test_add_folders(self):
+        team = Team()
+        self.assertEqual(team.add_folders(self.folders), {})
+        self.assertEqual(team.names, ['Matt', 'Sam'])
+        self.assertEqual([len(athlete.activity_history) for athlete in team.athletes], [6, 8])
+        self.assertMatchesAthletes(team)
+        # Activities already added aren't added again
+        team.add_folders(self.folders)
+        self.assertEqual([len(athlete.activity_history) for athlete in team.athletes], [6, 8])
+
+    def test_shared_pool(self):
+        team = Team()
+        team.add_folders(self.folders, processes=2)
+        self.assertEqual([len(athlete.activity_history) for athlete in team.athletes], [6, 8])
+        self.assertMatchesAthletes(team)
+
+    def test_bad_files_are_skipped(self):
+        truncate(self.filepaths['Matt'][1])
+        with open(os.path.join(self.folders['Sam'], 'garbage.gpx'), 'w') as f:
+            f.write('not an export\n')
+        with open(os.path.join(self.folders['Sam'], 'sleep.csv'), 'w') as f:
+            f.write('not a sleep export\n')
+        for processes in [1, 2]:
+            team = Team()
+            errors = team.add_folders(self.folders, processes=processes)
+            self.assertEqual(sorted(errors), sorted([self.filepaths['Matt'][1], os.path.join(self.folders['Sam'], 'garbage.gpx'),
+                                                     os.path.join(self.folders['Sam'], 'sleep.csv')]))
+            self.assertEqual([len(athlete.activity_history) for athlete in team.athletes], [5, 8])
+            self.assertTrue(np.isnan(team.sleep).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,44 +1,40 @@
-import datetime
-import numpy as np
 import cPickle as pickle
+from sleep import Sleep_History
+from folder_sync import File_Manifest
+from activity_history import Activity_History
+from athlete_store import Athlete_Store, is_store
+from calculate_stats import zone_points
 
 
 # Repository for random functions which are occasionally useful
 
 def load_saved_athlete(filepath):
+    """
+    Loads an Athlete saved with Athlete.save, or pickled by older versions.
+    """
+    if is_store(filepath):
+        return Athlete_Store(filepath).load()
     with open(filepath, 'rb') as f:
         athlete = pickle.load(f)
+    # Fill in attributes added since older Athletes were pickled
+    if not hasattr(athlete, 'points_per_min'):
+        athlete.points_per_min = zone_points(athlete.zones)
+    for name in ['cache', 'store', 'fitness_index']:
+        if not hasattr(athlete, name):
+            setattr(athlete, name, None)
+    athlete.unsaved_activities = []
+    athlete.removed_activities = []
+    if not hasattr(athlete, 'manifest'):
+        athlete.manifest = File_Manifest()
+    # Athletes saved before activity_history became a columnar Activity_History stored a list of Activity_Stats
+    if isinstance(athlete.activity_history, list):
+        athlete.activity_history = Activity_History(athlete.activity_history)
+    # Athletes saved before sleep was keyed by date kept a list of the nights of the last sleep .csv read
+    if isinstance(athlete.sleep_history, list):
+        athlete.sleep_history = Sleep_History.from_undated(athlete.sleep_history, athlete.last_update.date())
+        athlete.sleep_score_history = athlete.sleep_history.scores()
+    if not hasattr(athlete, 'fitness_state'):
+        athlete.rebuild_fitness_state()
+    if not hasattr(athlete, 'daily_loads'):
+        athlete.rebuild_daily_loads()
     return athlete
-
-
-def calc_fit_from_list(activity_list):
-    current_time = datetime.datetime.now()
-    fitness = 0
-    loads_and_ages = []
-    for activity in activity_list:
-        days_old = int((current_time-activity.date).total_seconds()*1/86400)
-        if activity.training_load != None:
-            fitness += activity.training_load*np.exp(-days_old*1./42)
-    # Normalize by sum_{i=1}^{42}e^(-i/42)
-    fitness = int(round(fitness/26.234, 0))
-    return fitness
-
-
-def calc_fat_from_list(activity_list):
-    current_time = datetime.datetime.now()
-    fatigue = 0
-    loads_and_ages = []
-    for activity in activity_list:
-        days_old = int((current_time-activity.date).total_seconds()*1/86400)
-        if activity.training_load:
-            fatigue += activity.training_load*np.exp(-days_old*1./7)
-    # Normalize by sum_{i=1}^{7}e^(-i/7)
-    fatigue = int(round(fatigue/4.116, 0))
-    return fatigue
-
-
-def calc_norm_factor(n_days):
-    nf = 0
-    for i in range(n_days):
-        nf += np.exp(-i*1./n_days)
-    return round(nf, 3)